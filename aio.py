@@ -0,0 +1,416 @@
+import asyncio
+import io
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from functools import wraps
+
+from flask import (abort, current_app, g, make_response, render_template,
+                   request, request_started)
+from sqlalchemy import select
+from werkzeug.exceptions import HTTPException
+
+import instrumentation
+import pooling
+from app import (ARTIST_LISTING_KEY, DETAIL_TABLES, VENUE_LISTING_KEY,
+                 artist_listing, artist_shows, detail_key, detail_payload,
+                 group_areas, search_results, search_statement, venue_listing,
+                 venue_shows)
+from conditional import (ALL_PAGES, make_validators, page_name,
+                         remember_versions, set_validators, skip_validation,
+                         started_statement, unchanged, versions_statement)
+from models import Artist, Venue, artist_genre, venue_genre
+from pagination import make_page, page_query
+
+#----------------------------------------------------------------------------#
+# Async queries.
+#
+# Each query checks out a connection of its own from the async engine, so
+# independent queries of one request run concurrently under asyncio.gather.
+#----------------------------------------------------------------------------#
+
+
+def engine():
+    return current_app.extensions['async_engine']
+
+
+async def fetch_all(statement):
+    async with engine().connect() as connection:
+        return (await connection.execute(statement)).all()
+
+
+async def fetch_first(statement):
+    async with engine().connect() as connection:
+        return (await connection.execute(statement)).first()
+
+
+async def fetch_scalar(statement):
+    async with engine().connect() as connection:
+        return (await connection.execute(statement)).scalar()
+
+
+async def fetch_scalars(statement):
+    async with engine().connect() as connection:
+        return (await connection.execute(statement)).scalars().all()
+
+
+async def nothing():
+    return None
+
+
+def conditional(*tables, time_sensitive=False, pages=None):
+    """conditional.conditional for coroutine views.
+
+    The data versions and the latest show start are read concurrently.
+    """
+    def decorator(view):
+        @wraps(view)
+        async def wrapper(**kwargs):
+            if skip_validation():
+                return await view(**kwargs)
+
+            names = list(tables) + (pages(**kwargs) if pages else [])
+            rows, started = await asyncio.gather(
+                fetch_all(versions_statement(names)),
+                fetch_scalar(started_statement()) if time_sensitive
+                else nothing())
+            remember_versions(names, rows)
+            etag, last_modified = make_validators(rows, time_sensitive, started)
+            response = (current_app.response_class(status=304)
+                        if unchanged(etag, last_modified)
+                        else make_response(await view(**kwargs)))
+            return set_validators(response, etag, last_modified)
+        return wrapper
+    return decorator
+
+
+async def get_page(statement, columns):
+    after, before = request.args.get('after'), request.args.get('before')
+    per_page = current_app.config['PAGE_SIZE']
+    try:
+        query = page_query(statement, columns, after, before, per_page)
+    except (ValueError, TypeError):
+        abort(400)
+    return make_page(await fetch_all(query), columns, after, before, per_page)
+
+
+async def data_versions(names):
+    # conditional.data_versions, read through the async engine.
+    missing = [name for name in names
+               if name not in g.get('data_versions', {})]
+    if missing:
+        remember_versions(missing,
+                          await fetch_all(versions_statement(missing)))
+    return [g.data_versions[name] for name in names]
+
+
+async def get_or_set(cache, key, build):
+    value = cache.get(key)
+    if value is None:
+        value, expires_at = await build()
+        cache.set(key, value, expires_at)
+    return value
+
+
+async def detail(table, junction, shows, ident):
+    # The row, its genres, and its upcoming and past shows in four
+    # concurrent queries.
+    owner = next(column for column in junction.c
+                 if column.name != 'genre_name')
+    statement = shows(ident)
+    start_time = statement.selected_columns.start_time
+    now = datetime.now()
+    record, genre_names, upcoming, past = await asyncio.gather(
+        fetch_first(select(table).where(table.c.id == ident)),
+        fetch_scalars(select(junction.c.genre_name).where(owner == ident)),
+        fetch_all(statement.where(start_time > now)),
+        fetch_all(statement.where(start_time <= now)))
+    if record is None:
+        abort(404)
+    return detail_payload(record._mapping, genre_names, upcoming, past)
+
+#----------------------------------------------------------------------------#
+# Views.
+#
+# Async counterparts of the read views in app.py, registered under the same
+# endpoints so templates, url_for and request.endpoint see no difference.
+#----------------------------------------------------------------------------#
+
+VIEWS = {}
+
+
+def view(endpoint):
+    def decorator(function):
+        VIEWS[endpoint] = function
+        return function
+    return decorator
+
+
+def cache():
+    return current_app.extensions['detail_cache']
+
+
+@view('main.venues')
+@conditional('venue', 'show')
+async def venues():
+    page = await get_page(venue_listing(), VENUE_LISTING_KEY)
+    return render_template('pages/venues.html', areas=group_areas(page.items),
+                           page=page)
+
+
+@view('main.search_venues')
+async def search_venues():
+    keyword = request.form.get('search_term', '')
+    matches = await fetch_all(search_statement(
+        Venue, venue_genre.c.venue_id, keyword, engine().dialect.name))
+    return render_template('pages/search_venues.html',
+                           results=search_results(matches), search_term=keyword)
+
+
+@view('main.show_venue')
+@conditional(*DETAIL_TABLES, time_sensitive=True,
+             pages=lambda venue_id: [ALL_PAGES, page_name('venue', venue_id)])
+async def show_venue(venue_id):
+    page = page_name('venue', venue_id)
+    key = detail_key(page, await data_versions([ALL_PAGES, page]))
+    data = await get_or_set(cache(), key, lambda: detail(
+        Venue.__table__, venue_genre, venue_shows, venue_id))
+    return render_template('pages/show_venue.html', venue=data)
+
+
+@view('main.artists')
+@conditional('artist')
+async def artists():
+    page = await get_page(artist_listing(), ARTIST_LISTING_KEY)
+    data = [{'id': artist.id,
+             'name': artist.name}
+            for artist in page.items]
+    return render_template('pages/artists.html', artists=data, page=page)
+
+
+@view('main.search_artists')
+async def search_artists():
+    keyword = request.form.get('search_term', '')
+    matches = await fetch_all(search_statement(
+        Artist, artist_genre.c.artist_id, keyword, engine().dialect.name))
+    return render_template('pages/search_artists.html',
+                           results=search_results(matches), search_term=keyword)
+
+
+@view('main.show_artist')
+@conditional(*DETAIL_TABLES, time_sensitive=True,
+             pages=lambda artist_id: [ALL_PAGES,
+                                      page_name('artist', artist_id)])
+async def show_artist(artist_id):
+    page = page_name('artist', artist_id)
+    key = detail_key(page, await data_versions([ALL_PAGES, page]))
+    data = await get_or_set(cache(), key, lambda: detail(
+        Artist.__table__, artist_genre, artist_shows, artist_id))
+    return render_template('pages/show_artist.html', artist=data)
+
+#----------------------------------------------------------------------------#
+# ASGI application.
+#----------------------------------------------------------------------------#
+
+
+def build_environ(scope, body):
+    # The WSGI environ of an ASGI http request.
+    server = scope.get('server') or ('localhost', 80)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode().decode('latin-1'),
+        'PATH_INFO': scope['path'].encode().decode('latin-1'),
+        'QUERY_STRING': scope['query_string'].decode('latin-1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1] or 80),
+        'SERVER_PROTOCOL': f'HTTP/{scope.get("http_version", "1.1")}',
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    if scope.get('client'):
+        environ['REMOTE_ADDR'] = scope['client'][0]
+        environ['REMOTE_PORT'] = str(scope['client'][1])
+    for name, value in scope['headers']:
+        name = name.decode('latin-1').upper().replace('-', '_')
+        if name not in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+            name = f'HTTP_{name}'
+        value = value.decode('latin-1')
+        environ[name] = f'{environ[name]},{value}' if name in environ else value
+    return environ
+
+
+async def read_body(receive):
+    chunks = []
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            break
+        chunks.append(message.get('body', b''))
+        if not message.get('more_body'):
+            break
+    return b''.join(chunks)
+
+
+def start_message(status, headers):
+    return {'type': 'http.response.start',
+            'status': int(status.split(' ', 1)[0]),
+            'headers': [(name.lower().encode('latin-1'), value.encode('latin-1'))
+                        for name, value in headers]}
+
+
+class AsyncApp:
+    """ASGI application serving the read routes from coroutines.
+
+    Requests for the endpoints in VIEWS go through the Flask app's own
+    request handling (hooks, sessions, error handlers), but their views await
+    queries on the async engine rather than holding a thread. Every other
+    request, the form handlers included, is handed to the WSGI app on a pool
+    of ASGI_SYNC_THREADS threads, where it runs exactly as under gunicorn.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self.engine = pooling.create_async_engine(app.config)
+        app.extensions['async_engine'] = self.engine
+        if app.config['SQL_INSTRUMENTATION']:
+            instrumentation.listen(self.engine.sync_engine)
+        self.executor = ThreadPoolExecutor(app.config['ASGI_SYNC_THREADS'],
+                                           thread_name_prefix='wsgi')
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self.lifespan(receive, send)
+        elif scope['type'] == 'http':
+            environ = build_environ(scope, await read_body(receive))
+            view = VIEWS.get(self.endpoint(environ))
+            if view is None:
+                await self.call_wsgi(environ, send)
+            else:
+                await self.call_async(environ, view, send)
+
+    def endpoint(self, environ):
+        try:
+            endpoint, _ = self.app.url_map.bind_to_environ(environ).match()
+        except HTTPException:
+            # Not found, wrong method or a redirect: the WSGI app answers.
+            return None
+        return endpoint
+
+    async def lifespan(self, receive, send):
+        loop = asyncio.get_running_loop()
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                try:
+                    await loop.run_in_executor(self.executor, self.startup)
+                except Exception as e:
+                    await send({'type': 'lifespan.startup.failed',
+                                'message': repr(e)})
+                    return
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await self.engine.dispose()
+                self.executor.shutdown(wait=False)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    def startup(self):
+        # The before_first_request hooks, such as the typeahead build, run
+        # before the server accepts requests rather than in the event loop.
+        with self.app.app_context():
+            self.app.try_trigger_before_first_request_functions()
+
+    async def call_async(self, environ, view, send):
+        # Flask.wsgi_app, with the view awaited.
+        app = self.app
+        context = app.request_context(environ)
+        error = None
+        try:
+            try:
+                context.push()
+                response = await self.full_dispatch_request(view)
+            except Exception as e:
+                error = e
+                response = app.handle_exception(e)
+            except:
+                error = sys.exc_info()[1]
+                raise
+            body, status, headers = response.get_wsgi_response(environ)
+            try:
+                body = b''.join(body)
+            finally:
+                if hasattr(body, 'close'):
+                    body.close()
+        finally:
+            if app.should_ignore_error(error):
+                error = None
+            context.auto_pop(error)
+        await send(start_message(status, headers))
+        await send({'type': 'http.response.body', 'body': body})
+
+    async def full_dispatch_request(self, view):
+        app = self.app
+        app.try_trigger_before_first_request_functions()
+        try:
+            request_started.send(app)
+            rv = app.preprocess_request()
+            if rv is None:
+                rv = await view(**request.view_args)
+        except Exception as e:
+            rv = app.handle_user_exception(e)
+        return app.finalize_request(rv)
+
+    async def call_wsgi(self, environ, send):
+        # The request runs start to finish on one pool thread, the way the
+        # thread-local database session expects; its body is passed back
+        # through a small queue so streamed responses stay streamed.
+        loop = asyncio.get_running_loop()
+        queue = asyncio.Queue(maxsize=8)
+
+        def put(message):
+            asyncio.run_coroutine_threadsafe(queue.put(message), loop).result()
+
+        task = loop.run_in_executor(self.executor, self.run_wsgi, environ, put)
+        try:
+            while True:
+                message = await queue.get()
+                if message is None:
+                    break
+                await send(message)
+        except BaseException:
+            # Let the thread run to completion, discarding what it sends.
+            while await queue.get() is not None:
+                pass
+            raise
+        await task
+
+    def run_wsgi(self, environ, put):
+        response = []
+
+        def start_response(status, headers, exc_info=None):
+            response[:] = [start_message(status, headers)]
+
+        def start():
+            if response:
+                put(response.pop())
+
+        try:
+            iterable = self.app(environ, start_response)
+            try:
+                for chunk in iterable:
+                    if chunk:
+                        start()
+                        put({'type': 'http.response.body', 'body': chunk,
+                             'more_body': True})
+                start()
+                put({'type': 'http.response.body', 'body': b''})
+            finally:
+                if hasattr(iterable, 'close'):
+                    iterable.close()
+        finally:
+            put(None)
@@ -0,0 +1,287 @@
+from datetime import datetime, timedelta
+
+from flask import Blueprint, abort, current_app, jsonify, request
+from sqlalchemy import select
+
+from conditional import conditional
+from models import (DEFAULT_SHOW_DURATION, MAX_SHOW_DURATION, Artist, Show,
+                    Venue, artist_genre, db, venue_genre)
+from pagination import paginate
+from schedule import conflicts, filter_shows, select_shows
+
+#----------------------------------------------------------------------------#
+# Read-only JSON API.
+#
+# Every endpoint runs Core selects of just the columns it returns and
+# serializes the result rows directly; no ORM objects are built, so neither
+# identity-map bookkeeping nor the genre subquery loads are paid for.
+#----------------------------------------------------------------------------#
+
+api = Blueprint('api', __name__, url_prefix='/api')
+
+venue = Venue.__table__
+artist = Artist.__table__
+show = Show.__table__
+
+SHOW_FIELDS = {
+    'id': show.c.id,
+    'start_time': show.c.start_time,
+    'duration_minutes': show.c.duration.label('duration_minutes'),
+    'venue_id': show.c.venue_id,
+    'venue_name': venue.c.name.label('venue_name'),
+    'venue_city': venue.c.city.label('venue_city'),
+    'venue_state': venue.c.state.label('venue_state'),
+    'venue_image_link': venue.c.image_link.label('venue_image_link'),
+    'artist_id': show.c.artist_id,
+    'artist_name': artist.c.name.label('artist_name'),
+    'artist_image_link': artist.c.image_link.label('artist_image_link'),
+}
+SHOW_DEFAULT_FIELDS = ['id', 'start_time', 'venue_id', 'venue_name',
+                       'artist_id', 'artist_name']
+LISTING_DEFAULT_FIELDS = ['id', 'name', 'city', 'state']
+
+
+@api.errorhandler(400)
+@api.errorhandler(404)
+def api_error(error):
+    return jsonify({'error': error.description}), error.code
+
+#  Helpers
+#  ----------------------------------------------------------------
+
+
+def serialize(row, fields):
+    record = {}
+    for field in fields:
+        value = row._mapping[field]
+        if isinstance(value, datetime):
+            value = value.isoformat()
+        elif isinstance(value, timedelta):
+            # Durations are given in minutes, as the show form takes them.
+            value = int(value.total_seconds() // 60)
+        record[field] = value
+    return record
+
+
+def requested_fields(available, default):
+    fields = request.args.get('fields')
+    if not fields:
+        return list(default)
+    fields = list(dict.fromkeys(field.strip() for field in fields.split(',')
+                                if field.strip()))
+    unknown = [field for field in fields if field not in available]
+    if unknown:
+        abort(400, f'Unknown fields: {", ".join(unknown)}')
+    return fields
+
+
+def datetime_arg(name):
+    value = request.args.get(name)
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        abort(400, f'{name} must be an ISO 8601 date or datetime')
+
+
+def int_arg(name):
+    value = request.args.get(name)
+    if not value:
+        return None
+    try:
+        return int(value)
+    except ValueError:
+        abort(400, f'{name} must be an integer')
+
+
+def date_range(column):
+    # ?from= is inclusive and ?to= exclusive.
+    criteria = []
+    start, end = datetime_arg('from'), datetime_arg('to')
+    if start:
+        criteria.append(column >= start)
+    if end:
+        criteria.append(column < end)
+    return criteria
+
+
+def page_of(statement, sort_key):
+    per_page = request.args.get('limit', current_app.config['PAGE_SIZE'], type=int)
+    per_page = max(1, min(per_page, current_app.config['API_MAX_PAGE_SIZE']))
+    try:
+        return paginate(statement, sort_key,
+                        after=request.args.get('after'),
+                        before=request.args.get('before'),
+                        per_page=per_page,
+                        fetch=lambda statement: db.session.execute(statement).all())
+    except (ValueError, TypeError):
+        abort(400, 'Invalid cursor')
+
+
+def owner_column(junction):
+    return next(column for column in junction.c if column.name != 'genre_name')
+
+
+def genres_by_owner(junction, ids):
+    # Genre names for a page of venues or artists, in a single query.
+    owner = owner_column(junction)
+    genres = {ident: [] for ident in ids}
+    rows = db.session.execute(
+        select(owner, junction.c.genre_name).where(owner.in_(ids))
+        .order_by(owner, junction.c.genre_name))
+    for ident, name in rows:
+        genres[ident].append(name)
+    return genres
+
+
+def listing(table, junction, show_fk):
+    fields = requested_fields(list(table.c.keys()) + ['genres'],
+                              LISTING_DEFAULT_FIELDS)
+    columns = [table.c[field] for field in fields if field != 'genres']
+    statement = select(*dict.fromkeys(columns + [table.c.id]))
+
+    for name in ('city', 'state'):
+        if request.args.get(name):
+            statement = statement.where(table.c[name] == request.args[name])
+    if request.args.get('genre'):
+        owner = owner_column(junction)
+        statement = statement.where(table.c.id.in_(
+            select(owner).where(junction.c.genre_name == request.args['genre'])))
+    shows_in_range = date_range(show.c.start_time)
+    if shows_in_range:
+        statement = statement.where(table.c.id.in_(
+            select(show_fk).where(*shows_in_range)))
+
+    page = page_of(statement, [table.c.id])
+    records = [serialize(row, [field for field in fields if field != 'genres'])
+               for row in page.items]
+    if 'genres' in fields:
+        genres = genres_by_owner(junction, [row.id for row in page.items])
+        for row, record in zip(page.items, records):
+            record['genres'] = genres[row.id]
+    return jsonify({'data': records, 'next': page.next, 'prev': page.prev})
+
+
+def detail(table, junction, show_fk, other, other_fk, ident):
+    row = db.session.execute(
+        select(*table.c).where(table.c.id == ident)).first()
+    if row is None:
+        abort(404, f'No {table.name} with id {ident}')
+    record = serialize(row, table.c.keys())
+    record['genres'] = genres_by_owner(junction, [ident])[ident]
+
+    shows = db.session.execute(
+        select(show.c.id, show.c.start_time,
+               other.c.id.label(f'{other.name}_id'),
+               other.c.name.label(f'{other.name}_name'),
+               other.c.image_link.label(f'{other.name}_image_link'))
+        .select_from(show.join(other, other_fk == other.c.id))
+        .where(show_fk == ident).order_by(show.c.start_time, show.c.id)).all()
+
+    now = datetime.now()
+    fields = list(shows[0]._mapping.keys()) if shows else []
+    record['upcoming_shows'] = [serialize(row, fields)
+                                for row in shows if row.start_time > now]
+    record['past_shows'] = [serialize(row, fields)
+                            for row in shows if row.start_time <= now]
+    return jsonify(record)
+
+#  Venues
+#  ----------------------------------------------------------------
+
+
+@api.route('/venues')
+@conditional('venue', 'show')
+def venues():
+    return listing(venue, venue_genre, show.c.venue_id)
+
+
+@api.route('/venues/<int:venue_id>')
+@conditional('venue', 'artist', 'show', time_sensitive=True)
+def venue_detail(venue_id):
+    return detail(venue, venue_genre, show.c.venue_id,
+                  artist, show.c.artist_id, venue_id)
+
+#  Artists
+#  ----------------------------------------------------------------
+
+
+@api.route('/artists')
+@conditional('artist', 'show')
+def artists():
+    return listing(artist, artist_genre, show.c.artist_id)
+
+
+@api.route('/artists/<int:artist_id>')
+@conditional('venue', 'artist', 'show', time_sensitive=True)
+def artist_detail(artist_id):
+    return detail(artist, artist_genre, show.c.artist_id,
+                  venue, show.c.venue_id, artist_id)
+
+#  Shows
+#  ----------------------------------------------------------------
+
+
+def show_statement(fields):
+    columns = [SHOW_FIELDS[field] for field in fields]
+    return select_shows(*dict.fromkeys(columns + [show.c.start_time, show.c.id]))
+
+
+@api.route('/shows')
+@conditional('show', 'venue', 'artist')
+def shows():
+    fields = requested_fields(SHOW_FIELDS, SHOW_DEFAULT_FIELDS)
+    statement = filter_shows(show_statement(fields),
+                             start=datetime_arg('from'), end=datetime_arg('to'),
+                             city=request.args.get('city'),
+                             state=request.args.get('state'),
+                             genre=request.args.get('genre'),
+                             venue_id=int_arg('venue_id'),
+                             artist_id=int_arg('artist_id'))
+    page = page_of(statement, [show.c.start_time, show.c.id])
+    return jsonify({'data': [serialize(row, fields) for row in page.items],
+                    'next': page.next, 'prev': page.prev})
+
+
+@api.route('/shows/conflicts')
+@conditional('show', 'venue', 'artist')
+def show_conflicts():
+    # The shows a booking of ?start_time= for ?duration= minutes would
+    # overlap at ?venue_id= or by ?artist_id=.
+    start_time = datetime_arg('start_time')
+    if start_time is None:
+        abort(400, 'start_time is required')
+    venue_id, artist_id = int_arg('venue_id'), int_arg('artist_id')
+    if venue_id is None and artist_id is None:
+        abort(400, 'venue_id or artist_id is required')
+    # Bounds are checked on the minutes, as a timedelta of a huge number
+    # of them overflows.
+    minutes = int_arg('duration')
+    longest = MAX_SHOW_DURATION // timedelta(minutes=1)
+    if minutes is not None and not 1 <= minutes <= longest:
+        abort(400, f'duration must be between 1 and {longest} minutes')
+    duration = (DEFAULT_SHOW_DURATION if minutes is None
+                else timedelta(minutes=minutes))
+
+    fields = list(SHOW_FIELDS)
+    rows = conflicts(db.session,
+                     [SHOW_FIELDS[field] for field in fields] + [show.c.duration],
+                     start_time, duration,
+                     venue_id=venue_id, artist_id=artist_id)
+    records = []
+    for row in rows:
+        record = serialize(row, fields)
+        record['end_time'] = (row.start_time + row.duration).isoformat()
+        records.append(record)
+    return jsonify({'data': records})
+
+
+@api.route('/shows/<int:show_id>')
+@conditional('show', 'venue', 'artist')
+def show_detail(show_id):
+    row = db.session.execute(
+        show_statement(list(SHOW_FIELDS)).where(show.c.id == show_id)).first()
+    if row is None:
+        abort(404, f'No show with id {show_id}')
+    return jsonify(serialize(row, list(SHOW_FIELDS)))
@@ -2,56 +2,345 @@
 # Imports
 #----------------------------------------------------------------------------#
 
+import csv
+import io
 import json
 import logging
+import os
+from datetime import date, datetime, timedelta
+from itertools import groupby
 from logging import FileHandler, Formatter
 
-import babel
-import dateutil.parser
-from flask import (Flask, Response, flash, redirect, render_template, request,
-                   url_for)
-from flask_migrate import Migrate
-from flask_moment import Moment
-from flask_wtf import Form
-from flask_wtf.csrf import CSRFProtect
-
-from forms import *
-from models import *
+from flask import (Blueprint, Flask, Response, abort, current_app, flash,
+                   jsonify, redirect, render_template, request,
+                   stream_with_context, url_for)
+from sqlalchemy import and_, func, or_, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import joinedload
+from werkzeug.local import LocalProxy
+
+import genres
+import ical
+import pooling
+import typeahead
+from cache import get_or_set
+from conditional import (ALL_PAGES, conditional, data_versions, mark_written,
+                         page_name, versions_statement)
+from forms import (ArtistForm, CalendarForm, ShowFilterForm, ShowForm,
+                   VenueForm)
+from models import (DEFAULT_SHOW_DURATION, Artist, Show, Venue, artist_genre,
+                    db, venue_genre)
+from pagination import paginate
+from schedule import (FEED_COLUMNS, adjacent, conflicts, filter_shows,
+                      midnight, refused_overlap, select_shows, window)
 
 #----------------------------------------------------------------------------#
 # App Config.
 #----------------------------------------------------------------------------#
 
-app = Flask(__name__)
-moment = Moment(app)
-app.config.from_object('config')
-db.init_app(app)
-migrate = Migrate(app, db)
+main = Blueprint('main', __name__, cli_group=None)
+
+# The detail page cache of the current app.
+cache = LocalProxy(lambda: current_app.extensions['detail_cache'])
+
+
+def create_app(config='config'):
+    """Build the application.
+
+    Modules only needed by some entry points are imported here rather than
+    at the top of the file, and those of the flask command's own commands
+    only when it runs. With PRELOAD set the shared, read-mostly state is
+    built now as well, so a server forking workers after loading the app
+    (gunicorn --preload) builds it once and the workers share its memory.
+    """
+    from flask_moment import Moment
+
+    import counters
+    import instrumentation
+    import metrics
+    import templating
+    from api import api
+    from cache import make_cache
+    from formatting import DatetimeFilter
+
+    app = Flask(__name__)
+    app.config.from_object(config)
+    Moment(app)
+    pooling.configure(app, db)
+    instrumentation.register(app, db)
+    app.extensions['metrics'] = metrics.register(app)
+    app.extensions['detail_cache'] = make_cache(app.config)
+
+    app.register_blueprint(main)
+    app.register_blueprint(api)
+    if os.environ.get('FLASK_RUN_FROM_CLI') == 'true':
+        # Set by the flask command before it loads the app.
+        register_commands(app)
+    app.extensions['counter_scheduler'] = counters.register(app)
+    app.extensions['typeahead_refresher'] = typeahead.register(app)
+
+    app.jinja_env.filters['datetime'] = DatetimeFilter(
+        app.config['DATETIME_FILTER_CACHE_SIZE'])
+    templating.configure(app)
+
+    if not app.debug:
+        file_handler = FileHandler('error.log')
+        file_handler.setFormatter(
+            Formatter(
+                '%(asctime)s %(levelname)s: %(message)s [in %(pathname)s:%(lineno)d]')
+        )
+        app.logger.setLevel(logging.INFO)
+        file_handler.setLevel(logging.INFO)
+        app.logger.addHandler(file_handler)
+        app.logger.info('errors')
+
+    if app.config.get('PRELOAD'):
+        preload(app)
+    return app
+
+
+def register_commands(app):
+    # Commands of the flask command alone. Servers never load Flask-Migrate
+    # (and alembic), the importer or the generator.
+    from flask_migrate import Migrate
+
+    import importer
+    import seed
+
+    Migrate(app, db)
+    importer.register(app)
+    seed.register(app)
+
+
+def preload(app):
+    import gc
+
+    with app.app_context():
+        typeahead.build(db, app.config['TYPEAHEAD_MAX_KEYS'])
+        genres.registry.known(db.session)
+        app.jinja_env.filters['datetime'].compile()
+        db.session.remove()
+        # Connections must not be shared across fork; workers open their own.
+        db.get_engine(app).dispose()
+    app.extensions['preloaded'] = True
+    # Keep the collector from touching, and so copying, the preloaded objects
+    # in every worker.
+    gc.freeze()
 
 #----------------------------------------------------------------------------#
-# Filters.
+# Helpers.
 #----------------------------------------------------------------------------#
 
 
-def format_datetime(value, format='medium'):
-    if isinstance(value, str):
-        value = dateutil.parser.parse(value)
+def like_pattern(keyword):
+    # Escape LIKE wildcards so the search term is matched literally.
+    keyword = (keyword.replace('\\', '\\\\')
+               .replace('%', '\\%')
+               .replace('_', '\\_'))
+    return f'%{keyword}%'
+
+
+def search_statement(model, genre_fk, keyword, dialect):
+    """Select the venues or artists matching keyword, best matches first.
+
+    The keyword is matched against name, city, state and genre, and
+    "City, ST" style keywords match on city and state together. Each result
+    row carries its precomputed num_upcoming_shows.
+    """
+    keyword = keyword.strip()
+    pattern = like_pattern(keyword)
+
+    genre_matches = select(genre_fk).where(
+        genre_fk.table.c.genre_name.ilike(pattern, escape='\\'))
+    criteria = [model.name.ilike(pattern, escape='\\'),
+                model.city.ilike(pattern, escape='\\'),
+                model.state.ilike(pattern, escape='\\'),
+                model.id.in_(genre_matches)]
+    if ',' in keyword:
+        city, state = (part.strip() for part in keyword.rsplit(',', 1))
+        criteria.append(and_(model.city.ilike(like_pattern(city), escape='\\'),
+                             model.state.ilike(like_pattern(state), escape='\\')))
+
+    ranking = [model.name, model.id]
+    if dialect == 'postgresql':
+        # pg_trgm similarity; the GIN trigram indexes serve the ILIKE filters.
+        ranking.insert(0, func.similarity(model.name, keyword).desc())
+
+    return select(model.id, model.name, model.num_upcoming_shows).where(
+        or_(*criteria)).order_by(*ranking)
+
+
+def search(model, genre_fk, keyword):
+    return db.session.execute(search_statement(
+        model, genre_fk, keyword, db.engine.dialect.name)).all()
+
+
+def search_results(matches):
+    return {'count': len(matches),
+            'data': [{'id': match.id,
+                      'name': match.name,
+                      'num_upcoming_shows': match.num_upcoming_shows}
+                     for match in matches]}
+
+
+def split_shows(shows, now):
+    # Single pass against one timestamp, so every show lands in exactly one
+    # bucket.
+    upcoming, past = [], []
+    for show in shows:
+        (upcoming if show.start_time > now else past).append(show)
+    return upcoming, past
+
+
+def detail_payload(columns, genre_names, upcoming, past):
+    """Cacheable page payload for a venue or artist and its shows.
+
+    columns maps the column names of the venue or artist row to its values;
+    upcoming and past are its show rows, each in start time order. Returns
+    the payload and the moment it goes stale: the start time of the next
+    upcoming show, when that show moves over to the past.
+    """
+    payload = dict(columns)
+    payload['genres'] = sorted(genre_names)
+    payload['upcoming_shows'] = [show._asdict() for show in upcoming]
+    payload['upcoming_shows_count'] = len(upcoming)
+    payload['past_shows'] = [show._asdict() for show in past]
+    payload['past_shows_count'] = len(past)
+
+    return payload, upcoming[0].start_time.timestamp() if upcoming else None
+
+
+# The tables a venue or artist page is built from.
+DETAIL_TABLES = ('venue', 'artist', 'show')
+
+
+def detail_key(page, versions=None):
+    """Cache key of the payload of a venue or artist page.
+
+    The key carries the versions of the page's own data_version row and of
+    ALL_PAGES. A write to the page through any worker makes every worker's
+    entry for it miss, and leaves the entries of other pages alone. The
+    versions are the ones the conditional GET validated with, so a page is
+    not sent under a newer ETag than the payload it was built from.
+    """
+    versions = versions or data_versions([ALL_PAGES, page])
+    return f'{page}@' + '.'.join(str(version) for version in versions)
+
+
+def venue_pages(venue_id):
+    # The venue's page and every artist page listing a show there.
+    artist_ids = db.session.query(Show.artist_id).filter(
+        Show.venue_id == venue_id).distinct()
+    return [page_name('venue', venue_id)] + [page_name('artist', artist_id)
+                                             for (artist_id,) in artist_ids]
+
+
+def artist_pages(artist_id):
+    # The artist's page and every venue page listing one of their shows.
+    venue_ids = db.session.query(Show.venue_id).filter(
+        Show.artist_id == artist_id).distinct()
+    return [page_name('artist', artist_id)] + [page_name('venue', venue_id)
+                                               for (venue_id,) in venue_ids]
+
+
+def drop_payloads(pages):
+    """Delete the cached payloads of pages a commit just changed.
+
+    Their keys carry the versions before the commit, which no page is read
+    under again; deleting them frees a shared cache of them at once.
+    """
+    current = {row.table_name: row.version for row in db.session.execute(
+        versions_statement([ALL_PAGES] + pages))}
+    everything = current.get(ALL_PAGES, 0)
+    cache.delete(*[detail_key(page, [everything, current[page] - 1])
+                   for page in pages if page in current])
+
+
+def record_payload(record, shows):
+    # detail_payload of an ORM venue or artist, its genres loaded with it.
+    upcoming, past = split_shows(shows, datetime.now())
+    return detail_payload({column.key: getattr(record, column.key)
+                           for column in record.__table__.columns},
+                          [genre.name for genre in record.genres],
+                          upcoming, past)
+
+
+def venue_shows(venue_id):
+    return select(Show.start_time,
+                  Artist.id.label('artist_id'),
+                  Artist.name.label('artist_name'),
+                  Artist.image_link.label('artist_image_link')
+                  ).join(Artist, Show.artist_id == Artist.id
+                         ).where(Show.venue_id == venue_id
+                                 ).order_by(Show.start_time)
+
+
+def artist_shows(artist_id):
+    return select(Show.start_time,
+                  Venue.id.label('venue_id'),
+                  Venue.name.label('venue_name'),
+                  Venue.image_link.label('venue_image_link')
+                  ).join(Venue, Show.venue_id == Venue.id
+                         ).where(Show.artist_id == artist_id
+                                 ).order_by(Show.start_time)
+
+
+def venue_listing():
+    # Pages are keyed on the area ordering so an area is never shuffled
+    # across a page boundary.
+    return select(Venue.id, Venue.name, Venue.city, Venue.state,
+                  Venue.num_upcoming_shows)
+
+
+VENUE_LISTING_KEY = [Venue.state, Venue.city, Venue.name, Venue.id]
+
+
+def group_areas(rows):
+    # rows come back ordered by area, so they are grouped as they stream in.
+    return [{'city': city,
+             'state': state,
+             'venues': [{'id': row.id,
+                         'name': row.name,
+                         'num_upcoming_shows': row.num_upcoming_shows}
+                        for row in area]}
+            for (state, city), area in groupby(rows, key=lambda row: (row.state, row.city))]
 
-    if format == 'full':
-        format = "EEEE MMMM, d, y 'at' h:mma"
-    elif format == 'medium':
-        format = "EE MM, dd, y h:mma"
-    return babel.dates.format_datetime(value, format, locale='en')
 
+def artist_listing():
+    return select(Artist.id, Artist.name)
 
-app.jinja_env.filters['datetime'] = format_datetime
+
+ARTIST_LISTING_KEY = [Artist.name, Artist.id]
+
+
+def get_page(query, columns):
+    # Page of query addressed by the ?after= / ?before= cursors of the request.
+    try:
+        return paginate(query, columns,
+                        after=request.args.get('after'),
+                        before=request.args.get('before'),
+                        per_page=current_app.config['PAGE_SIZE'],
+                        fetch=lambda query: db.session.execute(query).all())
+    except (ValueError, TypeError):
+        abort(400)
+
+
+def form_filters(form):
+    # The filters set in a query string form. Those that do not validate
+    # are reported and left out.
+    form.validate()
+    for name, errors in form.errors.items():
+        for error in errors:
+            flash(f'{form[name].label.text}: {error}', 'danger')
+    return {name: value for name, value in form.data.items()
+            if value not in (None, '') and name not in form.errors}
 
 #----------------------------------------------------------------------------#
 # Controllers.
 #----------------------------------------------------------------------------#
 
 
-@app.route('/')
+@main.route('/')
 def index():
     return render_template('pages/home.html')
 
@@ -59,80 +348,55 @@ def index():
 #  Venues
 #  ----------------------------------------------------------------
 
-@app.route('/venues')
+@main.route('/venues')
+@conditional('venue', 'show')
 def venues():
-    # num_upcoming_shows should be aggregated based on number of upcoming shows per venue.
-    venues = Venue.query.order_by(Venue.state, Venue.city).all()
-    data = []
-    for venue in venues:
-        listing = {
-            'id': venue.id,
-            'name': venue.name,
-            'num_upcoming_shows': venue.shows.filter(datetime.now() < Show.start_time).count()
-        }
-        try:
-            if (data[-1]['state'] == venue.state
-                    and data[-1]['city'] == venue.city):
-                data[-1]['venues'].append(listing)
-            else:
-                data.append({'city': venue.city,
-                             'state': venue.state,
-                             'venues': [listing]})
-        except IndexError:
-            data.append({'city': venue.city,
-                         'state': venue.state,
-                         'venues': [listing]})
-
-    return render_template('pages/venues.html', areas=data)
+    # One query over the precomputed show counters.
+    page = get_page(venue_listing(), VENUE_LISTING_KEY)
+    return render_template('pages/venues.html', areas=group_areas(page.items),
+                           page=page)
 
 
-@app.route('/venues/search', methods=['POST'])
+@main.route('/venues/search', methods=['POST'])
 def search_venues():
     # seach for Hop should return "The Musical Hop".
     # search for "Music" should return "The Musical Hop" and "Park Square Live Music & Coffee"
 
-    keyword = request.form.get('search_term')
-    matches = Venue.query.filter(Venue.name.ilike(f'%{keyword}%')).all()
-    response = {'count': len(matches), 'data': []}
-    for match in matches:
-        response['data'].append({'id': match.id,
-                                 'name': match.name,
-                                 'num_upcoming_shows': match.shows.filter(
-                                     datetime.now() < Show.start_time).count()})
+    keyword = request.form.get('search_term', '')
+    matches = search(Venue, venue_genre.c.venue_id, keyword)
 
-    return render_template('pages/search_venues.html', results=response, search_term=request.form.get('search_term', ''))
+    return render_template('pages/search_venues.html', results=search_results(matches), search_term=request.form.get('search_term', ''))
 
 
-@app.route('/venues/<int:venue_id>')
+@main.route('/venues/<int:venue_id>')
+@conditional(*DETAIL_TABLES, time_sensitive=True,
+             pages=lambda venue_id: [ALL_PAGES, page_name('venue', venue_id)])
 def show_venue(venue_id):
     # shows the venue page with the given venue_id
 
-    data = Venue.query.get(venue_id)
-
-    shows = db.session.query(Show.start_time, Artist.id, Artist.name, Artist.image_link).join(
-        Artist).filter(Show.venue_id == venue_id)
+    data = get_or_set(cache, detail_key(page_name('venue', venue_id)),
+                      lambda: venue_detail(venue_id))
+    return render_template('pages/show_venue.html', venue=data)
 
-    upcoming_shows = shows.filter(datetime.now() < Show.start_time)
-    data.upcoming_shows = upcoming_shows.all()
-    data.upcoming_shows_count = upcoming_shows.count()
 
-    past_shows = shows.filter(datetime.now() > Show.start_time)
-    data.past_shows = past_shows.all()
-    data.past_shows_count = past_shows.count()
+def venue_detail(venue_id):
+    venue = Venue.query.options(
+        joinedload(Venue.genres)).get_or_404(venue_id)
 
-    return render_template('pages/show_venue.html', venue=data)
+    shows = db.session.execute(venue_shows(venue_id)).all()
+    return record_payload(venue, shows)
 
 #  Create Venue
 #  ----------------------------------------------------------------
 
 
-@ app.route('/venues/create', methods=['GET'])
+@ main.route('/venues/create', methods=['GET'])
 def create_venue_form():
     form = VenueForm()
     return render_template('forms/new_venue.html', form=form)
 
 
-@ app.route('/venues/create', methods=['POST'])
+@ main.route('/venues/create', methods=['POST'])
 def create_venue_submission():
     error = False
 
@@ -161,12 +425,7 @@ def create_venue_submission():
         db.session.add(venue)
         db.session.flush()
         venue_id = venue.id
-        for genre in data.getlist('genres'):
-            if not Genre.query.filter_by(name=genre).all():
-                db.session.add(Genre(name=genre))
-                db.session.flush()
-            db.session.execute(venue_genre.insert(), params={
-                               'venue_id': venue_id, 'genre_name': genre})
+        genres.attach(venue_genre, venue_id, data.getlist('genres'))
 
         db.session.commit()
 
@@ -184,18 +443,28 @@ def create_venue_submission():
     else:
         # on successful db insert, flash success
         flash(f'Venue {request.form["name"]} was successfully listed!', 'info')
+        typeahead.add_listing('venue', venue_id, data.get('name'),
+                              data.get('city'), data.get('state'),
+                              data.getlist('genres'))
 
     return render_template('pages/home.html')
 
 
-@ app.route('/venues/<venue_id>', methods=['DELETE'])
+@ main.route('/venues/<venue_id>', methods=['DELETE'])
 def delete_venue(venue_id):
 
     venue = Venue.query.get(venue_id)
     venue_name = venue.name
+    listing = (venue.id, venue.city, venue.state)
+    stale = venue_pages(venue.id)
     error = False
     try:
+        # Shows go first, through the session, so the counters of the
+        # artists playing them are brought down with them.
+        for show in venue.shows:
+            db.session.delete(show)
         db.session.delete(venue)
+        mark_written(db.session.connection(), stale)
         db.session.commit()
 
     except:
@@ -212,6 +481,8 @@ def delete_venue(venue_id):
     else:
         # on successful db insert, flash success
         flash(f'Venue {venue_name} was successfully deleted!', 'info')
+        typeahead.remove_listing('venue', *listing)
+        drop_payloads(stale)
 
     # BONUS CHALLENGE: Implement a button to delete a Venue on a Venue Page, have it so that
     # clicking that button delete it from the db then redirect the user to the homepage
@@ -221,55 +492,51 @@ def delete_venue(venue_id):
 #  ----------------------------------------------------------------
 
 
-@ app.route('/artists')
+@ main.route('/artists')
+@ conditional('artist')
 def artists():
+    page = get_page(artist_listing(), ARTIST_LISTING_KEY)
     data = [{'id': artist.id,
              'name': artist.name}
-            for artist in Artist.query.all()]
-    return render_template('pages/artists.html', artists=data)
+            for artist in page.items]
+    return render_template('pages/artists.html', artists=data, page=page)
 
 
-@ app.route('/artists/search', methods=['POST'])
+@ main.route('/artists/search', methods=['POST'])
 def search_artists():
     # seach for "A" should return "Guns N Petals", "Matt Quevado", and "The Wild Sax Band".
     # search for "band" should return "The Wild Sax Band".
 
-    keyword = request.form.get('search_term')
-    matches = Artist.query.filter(Artist.name.ilike(f'%{keyword}%')).all()
-    response = {'count': len(matches), 'data': []}
-    for match in matches:
-        response['data'].append({'id': match.id,
-                                 'name': match.name,
-                                 'num_upcoming_shows': match.shows.filter(
-                                     datetime.now() < Show.start_time).count()})
+    keyword = request.form.get('search_term', '')
+    matches = search(Artist, artist_genre.c.artist_id, keyword)
 
-    return render_template('pages/search_artists.html', results=response, search_term=request.form.get('search_term', ''))
+    return render_template('pages/search_artists.html', results=search_results(matches), search_term=request.form.get('search_term', ''))
 
 
-@ app.route('/artists/<int:artist_id>')
+@ main.route('/artists/<int:artist_id>')
+@ conditional(*DETAIL_TABLES, time_sensitive=True,
+              pages=lambda artist_id: [ALL_PAGES,
+                                       page_name('artist', artist_id)])
 def show_artist(artist_id):
     # shows the artist page with the given artist_id
 
-    data = Artist.query.get(artist_id)
+    data = get_or_set(cache, detail_key(page_name('artist', artist_id)),
+                      lambda: artist_detail(artist_id))
+    return render_template('pages/show_artist.html', artist=data)
 
-    shows = db.session.query(Show.start_time, Venue.id, Venue.name, Venue.image_link).join(
-        Venue).filter(Show.artist_id == artist_id)
 
-    upcoming_shows = shows.filter(datetime.now() < Show.start_time)
-    data.upcoming_shows = upcoming_shows.all()
-    data.upcoming_shows_count = upcoming_shows.count()
+def artist_detail(artist_id):
+    artist = Artist.query.options(
+        joinedload(Artist.genres)).get_or_404(artist_id)
 
-    past_shows = shows.filter(datetime.now() > Show.start_time)
-    data.past_shows = past_shows.all()
-    data.past_shows_count = past_shows.count()
-
-    return render_template('pages/show_artist.html', artist=data)
+    shows = db.session.execute(artist_shows(artist_id)).all()
+    return record_payload(artist, shows)
 
 #  Update
 #  ----------------------------------------------------------------
 
 
-@ app.route('/artists/<int:artist_id>/edit', methods=['GET'])
+@ main.route('/artists/<int:artist_id>/edit', methods=['GET'])
 def edit_artist(artist_id):
     form = ArtistForm()
 
@@ -280,7 +547,7 @@ def edit_artist(artist_id):
     return render_template('forms/edit_artist.html', form=form, artist=artist)
 
 
-@ app.route('/artists/<int:artist_id>/edit', methods=['POST'])
+@ main.route('/artists/<int:artist_id>/edit', methods=['POST'])
 def edit_artist_submission(artist_id):
     # artist record with ID <artist_id> using the new attributes
 
@@ -294,6 +561,8 @@ def edit_artist_submission(artist_id):
 
     artist = Artist.query.get(artist_id)
     artist_name = Artist.query.get(artist_id).name
+    listing = (artist.id, artist.city, artist.state)
+    stale = artist_pages(artist_id)
     error = False
     try:
         artist.name = data.get('name')
@@ -308,12 +577,8 @@ def edit_artist_submission(artist_id):
             data.get('seeking_venue')) is None else True
         artist.seeking_description = data.get('seeking_description')
 
-        for genre in data.getlist('genres'):
-            if not Genre.query.filter_by(name=genre).all():
-                db.session.add(Genre(name=genre))
-                db.session.flush()
-            db.session.execute(artist_genre.insert(), params={
-                               'artist_id': artist_id, 'genre_name': genre})
+        genres.attach(artist_genre, artist_id, data.getlist('genres'))
+        mark_written(db.session.connection(), stale)
 
         db.session.commit()
     except:
@@ -330,11 +595,16 @@ def edit_artist_submission(artist_id):
     else:
         # on successful db insert, flash success
         flash(f'Artist {artist_name} was successfully edited!', 'info')
+        typeahead.remove_listing('artist', *listing)
+        typeahead.add_listing('artist', artist_id, data.get('name'),
+                              data.get('city'), data.get('state'),
+                              data.getlist('genres'))
+        drop_payloads(stale)
 
-    return redirect(url_for('show_artist', artist_id=artist_id))
+    return redirect(url_for('.show_artist', artist_id=artist_id))
 
 
-@ app.route('/venues/<int:venue_id>/edit', methods=['GET'])
+@ main.route('/venues/<int:venue_id>/edit', methods=['GET'])
 def edit_venue(venue_id):
     form = VenueForm()
 
@@ -345,7 +615,7 @@ def edit_venue(venue_id):
     return render_template('forms/edit_venue.html', form=form, venue=venue)
 
 
-@ app.route('/venues/<int:venue_id>/edit', methods=['POST'])
+@ main.route('/venues/<int:venue_id>/edit', methods=['POST'])
 def edit_venue_submission(venue_id):
     data = request.form
 
@@ -357,6 +627,8 @@ def edit_venue_submission(venue_id):
 
     venue = Venue.query.get(venue_id)
     venue_name = Venue.query.get(venue_id).name
+    listing = (venue.id, venue.city, venue.state)
+    stale = venue_pages(venue_id)
     error = False
     try:
         venue.name = data.get('name')
@@ -371,12 +643,8 @@ def edit_venue_submission(venue_id):
             data.get('seeking_talent')) is None else True
         venue.seeking_description = data.get('seeking_description')
 
-        for genre in data.getlist('genres'):
-            if not Genre.query.filter_by(name=genre).all():
-                db.session.add(Genre(name=genre))
-                db.session.flush()
-            db.session.execute(venue_genre.insert(), params={
-                               'venue_id': venue_id, 'genre_name': genre})
+        genres.attach(venue_genre, venue_id, data.getlist('genres'))
+        mark_written(db.session.connection(), stale)
 
         db.session.commit()
 
@@ -394,20 +662,25 @@ def edit_venue_submission(venue_id):
     else:
         # on successful db insert, flash success
         flash(f'Artist {venue_name} was successfully edited!', 'info')
+        typeahead.remove_listing('venue', *listing)
+        typeahead.add_listing('venue', venue_id, data.get('name'),
+                              data.get('city'), data.get('state'),
+                              data.getlist('genres'))
+        drop_payloads(stale)
 
-    return redirect(url_for('show_venue', venue_id=venue_id))
+    return redirect(url_for('.show_venue', venue_id=venue_id))
 
 #  Create Artist
 #  ----------------------------------------------------------------
 
 
-@ app.route('/artists/create', methods=['GET'])
+@ main.route('/artists/create', methods=['GET'])
 def create_artist_form():
     form = ArtistForm()
     return render_template('forms/new_artist.html', form=form)
 
 
-@ app.route('/artists/create', methods=['POST'])
+@ main.route('/artists/create', methods=['POST'])
 def create_artist_submission():
     error = False
     data = request.form
@@ -435,12 +708,7 @@ def create_artist_submission():
         db.session.add(artist)
         db.session.flush()
         artist_id = artist.id
-        for genre in data.getlist('genres'):
-            if not Genre.query.filter_by(name=genre).all():
-                db.session.add(Genre(name=genre))
-                db.session.flush()
-            db.session.execute(artist_genre.insert(), params={
-                               'artist_id': artist_id, 'genre_name': genre})
+        genres.attach(artist_genre, artist_id, data.getlist('genres'))
 
         db.session.add(artist)
         db.session.commit()
@@ -460,48 +728,245 @@ def create_artist_submission():
         # on successful db insert, flash success
         flash(
             f'Artist {request.form["name"]} was successfully listed!', 'info')
+        typeahead.add_listing('artist', artist_id, data.get('name'),
+                              data.get('city'), data.get('state'),
+                              data.getlist('genres'))
 
     return render_template('pages/home.html')
 
 
+#  Typeahead
+#  ----------------------------------------------------------------
+
+@ main.before_app_first_request
+def build_typeahead():
+    if not current_app.extensions.get('preloaded'):
+        typeahead.build(db, current_app.config['TYPEAHEAD_MAX_KEYS'])
+
+
+@ main.route('/typeahead')
+def suggest():
+    # Suggestions come from the in-process index; no SQL runs per keystroke.
+    kinds = request.args.get('kinds')
+    suggestions = typeahead.index.suggest(
+        request.args.get('q', ''),
+        kinds=kinds.split(',') if kinds else None,
+        limit=min(request.args.get('limit', 10, type=int), 50))
+    return jsonify(suggestions)
+
+
+@ main.cli.command('rebuild-typeahead')
+def rebuild_typeahead():
+    """Have every worker rebuild its typeahead index; report its size."""
+    # The index lives in each server process, not in this one; moving its
+    # version makes their refreshers rebuild it.
+    typeahead.changed(db.session.connection())
+    db.session.commit()
+    stats = typeahead.build(db, current_app.config['TYPEAHEAD_MAX_KEYS']).stats()
+    print(json.dumps(stats, indent=2))
+
+
+#  Stats
+#  ----------------------------------------------------------------
+
+@ main.route('/cache/stats')
+def cache_stats():
+    return jsonify(cache.stats())
+
+
+@ main.route('/pool/stats')
+def pool_stats():
+    return jsonify(pooling.stats(db.engine))
+
+
 #  Shows
 #  ----------------------------------------------------------------
 
-@ app.route('/shows')
+@ main.route('/shows')
+@ conditional('show', 'venue', 'artist')
 def shows():
     # displays list of shows at /shows
 
-    shows = Show.query.order_by(Show.start_time).all()
-    data = []
-    for show in shows:
-        data.append({"venue_id": show.venue_id,
-                     "venue_name": show.venue.name,
-                     "artist_id": show.artist_id,
-                     "artist_name": show.artist.name,
-                     "artist_image_link": show.artist.image_link,
-                     "start_time": str(show.start_time)})
+    # The venue and artist columns are joined in rather than lazy loaded
+    # show by show, and the filters narrow that one query.
+    form = ShowFilterForm(request.args)
+    filters = form_filters(form)
+    if 'start' in filters:
+        filters['start'] = midnight(filters['start'])
+    if 'end' in filters:
+        # The To date is included.
+        filters['end'] = midnight(filters['end'] + timedelta(days=1))
+
+    rows = filter_shows(select_shows(
+        Show.id, Show.start_time,
+        Show.venue_id, Venue.name.label('venue_name'),
+        Show.artist_id, Artist.name.label('artist_name'),
+        Artist.image_link.label('artist_image_link')), **filters)
+    page = get_page(rows, [Show.start_time, Show.id])
+    data = [{"venue_id": show.venue_id,
+             "venue_name": show.venue_name,
+             "artist_id": show.artist_id,
+             "artist_name": show.artist_name,
+             "artist_image_link": show.artist_image_link,
+             "start_time": show.start_time}
+            for show in page.items]
+
+    return render_template('pages/shows.html', shows=data, page=page,
+                           form=form)
+
+
+@ main.route('/shows/export.<any(csv, ndjson):format>')
+@ conditional('show', 'venue', 'artist')
+def export_shows(format):
+    # Rows are pulled through a server-side cursor and written out in chunks,
+    # so memory stays flat and the first bytes leave before the query ends.
+    batch_size = current_app.config['EXPORT_BATCH_SIZE']
+    rows = db.session.query(
+        Show.id, Show.start_time,
+        Venue.id.label('venue_id'), Venue.name.label('venue_name'),
+        Artist.id.label('artist_id'), Artist.name.label('artist_name')
+    ).join(Venue, Show.venue_id == Venue.id
+           ).join(Artist, Show.artist_id == Artist.id
+                  ).order_by(Show.start_time, Show.id).yield_per(batch_size)
+
+    def generate():
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        if format == 'csv':
+            writer.writerow(rows.statement.selected_columns.keys())
+        for number, row in enumerate(rows, start=1):
+            if format == 'csv':
+                writer.writerow(row)
+            else:
+                record = row._asdict()
+                record['start_time'] = record['start_time'].isoformat()
+                buffer.write(json.dumps(record) + '\n')
+            if number % batch_size == 0:
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+        yield buffer.getvalue()
 
-    return render_template('pages/shows.html', shows=data)
+    mimetypes = {'csv': 'text/csv', 'ndjson': 'application/x-ndjson'}
+    return Response(stream_with_context(generate()), mimetype=mimetypes[format],
+                    headers={'Content-Disposition': f'attachment; filename=shows.{format}'})
 
 
-@ app.route('/shows/create')
+#  Calendar
+#  ----------------------------------------------------------------
+
+@ main.route('/calendar')
+@ conditional('show', 'venue', 'artist')
+def calendar():
+    # Shows of a day, week, weekend or month, a page at a time from the
+    # start_time index and grouped by day.
+    form = CalendarForm(request.args)
+    filters = form_filters(form)
+    period = filters.pop('period', 'week')
+    day = filters.pop('date', None)
+    if day is None:
+        # Addressed by date, so the page of a URL never changes with the
+        # day it is asked for.
+        return redirect(url_for('main.calendar', **dict(
+            request.args.to_dict(), date=date.today().isoformat())))
+
+    first, last = window(period, day)
+    rows = filter_shows(select_shows(
+        Show.id, Show.start_time,
+        Show.venue_id, Venue.name.label('venue_name'),
+        Venue.city.label('venue_city'), Venue.state.label('venue_state'),
+        Show.artist_id, Artist.name.label('artist_name')),
+        start=midnight(first), end=midnight(last), **filters)
+    page = get_page(rows, [Show.start_time, Show.id])
+    days = [{'day': midnight(show_day), 'shows': list(shows)}
+            for show_day, shows in groupby(
+                page.items, key=lambda show: show.start_time.date())]
+
+    args = {name: value for name, value in request.args.items()
+            if name not in ('date', 'after', 'before')}
+    earlier, later = adjacent(period, day)
+    return render_template(
+        'pages/calendar.html', form=form, days=days, page=page,
+        first=midnight(first), last=midnight(last - timedelta(days=1)),
+        earlier=url_for('main.calendar', date=earlier.isoformat(), **args),
+        later=url_for('main.calendar', date=later.isoformat(), **args))
+
+
+def show_feed(model, ident, **filters):
+    # An iCalendar of every show of a venue or artist, written out as the
+    # rows arrive through a server-side cursor. The data versions answer
+    # the clients polling it, so an unchanged feed costs one query.
+    name = db.session.execute(
+        select(model.name).where(model.id == ident)).scalar()
+    if name is None:
+        abort(404)
+    rows = db.session.execute(
+        filter_shows(select_shows(*FEED_COLUMNS), **filters)
+        .order_by(Show.start_time, Show.id)
+        .execution_options(stream_results=True))
+    partitions = rows.partitions(current_app.config['EXPORT_BATCH_SIZE'])
+    return Response(stream_with_context(
+        ical.stream(f'{name} | Fyyur', partitions, request.host)),
+        mimetype='text/calendar')
+
+
+@ main.route('/venues/<int:venue_id>/shows.ics')
+@ conditional('show', 'venue', 'artist')
+def venue_feed(venue_id):
+    return show_feed(Venue, venue_id, venue_id=venue_id)
+
+
+@ main.route('/artists/<int:artist_id>/shows.ics')
+@ conditional('show', 'venue', 'artist')
+def artist_feed(artist_id):
+    return show_feed(Artist, artist_id, artist_id=artist_id)
+
+
+@ main.route('/shows/create')
 def create_shows():
     # renders form. do not touch.
     form = ShowForm()
     return render_template('forms/new_show.html', form=form)
 
 
-@ app.route('/shows/create', methods=['POST'])
+@ main.route('/shows/create', methods=['POST'])
 def create_show_submission():
     error = False
+    overlap = False
+    clashes = []
 
-    try:
-        data = request.form
-        show = Show(artist_id=data.get('artist_id'), venue_id=data.get(
-            'venue_id'), start_time=data.get('start_time'))
+    form = ShowForm(request.form)
 
-        db.session.add(show)
-        db.session.commit()
+    if not form.validate():
+        for (field, error) in form.errors.items():
+            flash(f'{field}: {error}', 'danger')
+        return render_template('forms/new_show.html', form=form)
+
+    try:
+        show = Show(artist_id=int(form.artist_id.data),
+                    venue_id=int(form.venue_id.data),
+                    start_time=form.start_time.data,
+                    duration=form.duration.data or DEFAULT_SHOW_DURATION)
+        stale = [page_name('venue', show.venue_id),
+                 page_name('artist', show.artist_id)]
+
+        # Checked first so the message can name the bookings in the way;
+        # the exclusion constraints still refuse one made in the meantime.
+        clashes = conflicts(
+            db.session, [Show.id, Show.start_time, Show.duration,
+                         Venue.name.label('venue_name'),
+                         Artist.name.label('artist_name')],
+            show.start_time, show.duration,
+            venue_id=show.venue_id, artist_id=show.artist_id)
+        if not clashes:
+            db.session.add(show)
+            mark_written(db.session.connection(), stale)
+            db.session.commit()
+
+    except IntegrityError as e:
+        error = True
+        overlap = refused_overlap(e)
+        db.session.rollback()
 
     except:
         error = True
@@ -510,49 +975,50 @@ def create_show_submission():
     finally:
         db.session.close()
 
-    if error:
+    if clashes:
+        for clash in clashes:
+            end_time = clash.start_time + clash.duration
+            flash(f'Overlaps {clash.artist_name} at {clash.venue_name}, '
+                  f'{clash.start_time:%Y-%m-%d %H:%M} to {end_time:%H:%M}.',
+                  'danger')
+        return render_template('forms/new_show.html', form=form)
+
+    if overlap:
+        flash('The venue or the artist was booked for that time meanwhile. '
+              'Show could not be listed.', 'danger')
+    elif error:
         # on unsuccessful db insert, flash an error instead.
         flash(
             'An error occurred. Show could not be listed.', 'danger')
     else:
         # on successful db insert, flash success
         flash('Show was successfully listed!', 'info')
+        drop_payloads(stale)
 
     return render_template('pages/home.html')
 
 
-@ app.errorhandler(404)
+@ main.app_errorhandler(404)
 def not_found_error(error):
     return render_template('errors/404.html'), 404
 
 
-@ app.errorhandler(500)
+@ main.app_errorhandler(500)
 def server_error(error):
     return render_template('errors/500.html'), 500
 
 
-if not app.debug:
-    file_handler = FileHandler('error.log')
-    file_handler.setFormatter(
-        Formatter(
-            '%(asctime)s %(levelname)s: %(message)s [in %(pathname)s:%(lineno)d]')
-    )
-    app.logger.setLevel(logging.INFO)
-    file_handler.setLevel(logging.INFO)
-    app.logger.addHandler(file_handler)
-    app.logger.info('errors')
-
 #----------------------------------------------------------------------------#
 # Launch.
 #----------------------------------------------------------------------------#
 
 # Default port:
 if __name__ == '__main__':
-    app.run()
+    create_app().run()
 
 # Or specify port manually:
 '''
 if __name__ == '__main__':
     port = int(os.environ.get('PORT', 5000))
-    app.run(host='0.0.0.0', port=port)
+    create_app().run(host='0.0.0.0', port=port)
 '''
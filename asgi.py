@@ -0,0 +1,7 @@
+# ASGI entry point: uvicorn asgi:app --workers 4
+# The read routes are served by coroutines on an async engine and every
+# other route by the WSGI app on a thread pool; see aio.py.
+from aio import AsyncApp
+from app import create_app
+
+app = AsyncApp(create_app())
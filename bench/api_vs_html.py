@@ -0,0 +1,72 @@
+"""Compare the JSON API with the HTML pages serving the same data.
+
+Requests each pair of routes through the test client and prints the median
+time and the number of SQL statements per request. Conditional GET is
+bypassed, so every request builds its response in full; the detail page
+cache is cleared before each HTML request.
+
+Usage: python -m bench.api_vs_html [--venue-id N] [--artist-id N] [--repeat N]
+"""
+import argparse
+import statistics
+import time
+
+from sqlalchemy import event
+
+from app import create_app
+from models import db
+
+PAIRS = [
+    ('/venues', '/api/venues'),
+    ('/artists', '/api/artists'),
+    ('/shows', '/api/shows'),
+    ('/venues/{venue_id}', '/api/venues/{venue_id}'),
+    ('/artists/{artist_id}', '/api/artists/{artist_id}'),
+]
+
+
+def measure(client, cache, url, repeat, statements):
+    timings, counts = [], []
+    for _ in range(repeat):
+        cache.clear()
+        before = len(statements)
+        started = time.perf_counter()
+        response = client.get(url)
+        timings.append(time.perf_counter() - started)
+        counts.append(len(statements) - before)
+        if response.status_code != 200:
+            raise SystemExit(f'{url} answered {response.status_code}')
+    return statistics.median(timings) * 1000, max(counts)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--venue-id', type=int, default=1)
+    parser.add_argument('--artist-id', type=int, default=1)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    app = create_app()
+    cache = app.extensions['detail_cache']
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    with app.app_context():
+        engine = db.engine
+    event.listen(engine, 'before_cursor_execute', record)
+
+    client = app.test_client()
+    print(f'{"route":<28}{"ms":>10}{"queries":>10}')
+    for html, json in PAIRS:
+        for url in (html, json):
+            url = url.format(venue_id=args.venue_id, artist_id=args.artist_id)
+            ms, queries = measure(client, cache, url, args.repeat,
+                                  statements)
+            print(f'{url:<28}{ms:>10.2f}{queries:>10}')
+        print()
+
+
+if __name__ == '__main__':
+    main()
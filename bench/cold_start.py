@@ -0,0 +1,79 @@
+"""Measure worker cold start: time to the first rendered pages.
+
+Each scenario runs in a fresh interpreter, which imports the app and then
+renders the form pages (templates only, no listings) through the test
+client, timing the import and the first response separately:
+
+  lazy     no warm-up, no bytecode cache: templates compile on first hit
+  cold     warm-up into an empty bytecode cache, as the first worker after
+           a deploy
+  warm     warm-up from a populated bytecode cache, as every later worker
+
+The first request also runs the before_first_request hooks, so the
+configured database must be reachable.
+
+Usage: python -m bench.cold_start [--runs N]
+"""
+import argparse
+import json
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+
+WORKER = '''
+import json, sys, time
+started = time.perf_counter()
+import config
+config.JINJA_CACHE_DIR = sys.argv[1] or None
+config.TEMPLATE_WARMUP = sys.argv[2] == '1'
+from app import create_app
+app = create_app()
+imported = time.perf_counter()
+client = app.test_client()
+for url in ['/', '/venues/create', '/artists/create', '/shows/create']:
+    assert client.get(url).status_code == 200, url
+    if url == '/':
+        first = time.perf_counter()
+done = time.perf_counter()
+print(json.dumps({'import': imported - started, 'first': first - imported,
+                  'pages': done - imported, 'total': done - started}))
+'''
+
+SCENARIOS = [('lazy', False, False), ('cold', True, True), ('warm', True, True)]
+
+
+def run(cache_dir, warmup):
+    output = subprocess.run(
+        [sys.executable, '-c', WORKER, cache_dir or '', '1' if warmup else '0'],
+        check=True, capture_output=True, text=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=5)
+    args = parser.parse_args()
+
+    results = {name: [] for name, _, _ in SCENARIOS}
+    for _ in range(args.runs):
+        cache_dir = tempfile.mkdtemp(prefix='fyyur-jinja-')
+        try:
+            for name, cached, warmup in SCENARIOS:
+                results[name].append(
+                    run(cache_dir if cached else None, warmup))
+        finally:
+            shutil.rmtree(cache_dir)
+
+    print(f'median of {args.runs} runs, ms')
+    print(f'{"":<8}{"import":>10}{"first page":>12}{"4 pages":>10}{"total":>10}')
+    for name, runs in results.items():
+        row = [statistics.median(run[key] for run in runs) * 1000
+               for key in ('import', 'first', 'pages', 'total')]
+        print(f'{name:<8}' + ''.join(f'{value:>{width}.1f}'
+                                     for value, width in zip(row, (10, 12, 10, 10))))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+"""Time the `datetime` template filter over a page of 10k shows.
+
+Compares the previous filter (babel.dates.format_datetime, fed the
+str(start_time) that /shows used to pass) with DatetimeFilter on a cold and
+on a warm cache, both called directly and through a Jinja loop like the
+one in pages/shows.html. Needs no database.
+
+Usage: python -m bench.datetime_filter [--shows N] [--distinct N]
+"""
+import argparse
+import random
+import time
+from datetime import datetime, timedelta
+
+import babel.dates
+import dateutil.parser
+from jinja2 import Environment
+
+from formatting import PATTERNS, DatetimeFilter
+
+TEMPLATE = ('{% for show in shows %}'
+            '<h4>{{ show.start_time|datetime("full") }}</h4>'
+            '{% endfor %}')
+
+
+def previous_filter(value, format='medium'):
+    if isinstance(value, str):
+        value = dateutil.parser.parse(value)
+    return babel.dates.format_datetime(value, PATTERNS.get(format, format),
+                                       locale='en')
+
+
+def timed(label, function):
+    started = time.perf_counter()
+    function()
+    print(f'{label:<40}{(time.perf_counter() - started) * 1000:>10.1f} ms')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--shows', type=int, default=10000)
+    parser.add_argument('--distinct', type=int, default=2000,
+                        help='Distinct start times among the shows.')
+    args = parser.parse_args()
+
+    random.seed(0)
+    start = datetime(2030, 1, 1, 20)
+    times = [start + timedelta(hours=random.randrange(args.distinct))
+             for _ in range(args.shows)]
+    strings = [str(value) for value in times]
+
+    new_filter = DatetimeFilter(maxsize=args.distinct * 2)
+    for value in times[:100]:
+        assert new_filter(value, 'full') == previous_filter(str(value), 'full')
+        assert new_filter(value) == previous_filter(value)
+
+    print(f'{args.shows} shows, {args.distinct} distinct start times')
+    timed('previous filter, str round trip',
+          lambda: [previous_filter(value, 'full') for value in strings])
+    timed('DatetimeFilter, cold cache',
+          lambda: [new_filter(value, 'full') for value in times])
+    timed('DatetimeFilter, warm cache',
+          lambda: [new_filter(value, 'full') for value in times])
+
+    for label, shows, datetime_filter in [
+            ('template, previous filter',
+             [{'start_time': value} for value in strings], previous_filter),
+            ('template, DatetimeFilter (warm)',
+             [{'start_time': value} for value in times], new_filter)]:
+        environment = Environment()
+        environment.filters['datetime'] = datetime_filter
+        template = environment.from_string(TEMPLATE)
+        timed(label, lambda: template.render(shows=shows))
+
+    print(new_filter.cache_info())
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,84 @@
+"""Print EXPLAIN ANALYZE plans for the queries the app issues.
+
+Drives the read routes through the test client, captures every SELECT they
+run, and explains each one twice: once with the show indexes hidden
+(dropped inside a transaction that is rolled back) and once with them in
+place. Needs a Postgres database that has been upgraded to head.
+
+Dropping an index takes an exclusive lock on the table until the rollback,
+so point this at a local or staging copy rather than production.
+
+Usage: python -m bench.explain [--venue-id N] [--artist-id N]
+"""
+import argparse
+
+from sqlalchemy import event, text
+
+from app import create_app
+from models import Show, db
+
+SHOW_INDEXES = [index.name for index in Show.__table__.indexes]
+
+
+def capture_queries(app, venue_id, artist_id):
+    queries = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith('SELECT'):
+            queries.append((statement, parameters))
+
+    client = app.test_client()
+    with app.app_context():
+        engine = db.engine
+    event.listen(engine, 'before_cursor_execute', record)
+    try:
+        for url in ['/venues', '/artists', '/shows',
+                    f'/venues/{venue_id}', f'/artists/{artist_id}']:
+            client.get(url)
+        client.post('/venues/search', data={'search_term': 'music'})
+        client.post('/artists/search', data={'search_term': 'band'})
+    finally:
+        event.remove(engine, 'before_cursor_execute', record)
+
+    unique = {}
+    for statement, parameters in queries:
+        unique.setdefault(statement, parameters)
+    return list(unique.items())
+
+
+def explain(connection, statement, parameters):
+    cursor = connection.connection.cursor()
+    cursor.execute('EXPLAIN (ANALYZE, BUFFERS) ' + statement, parameters)
+    return '\n'.join(row[0] for row in cursor.fetchall())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--venue-id', type=int, default=1)
+    parser.add_argument('--artist-id', type=int, default=1)
+    args = parser.parse_args()
+
+    app = create_app()
+    queries = capture_queries(app, args.venue_id, args.artist_id)
+    with app.app_context():
+        with db.engine.connect() as connection:
+            for statement, parameters in queries:
+                print('=' * 78)
+                print(statement.strip())
+
+                transaction = connection.begin()
+                try:
+                    for name in SHOW_INDEXES:
+                        connection.execute(text(f'DROP INDEX IF EXISTS {name}'))
+                    print('\n-- before (without show indexes)')
+                    print(explain(connection, statement, parameters))
+                finally:
+                    transaction.rollback()
+
+                print('\n-- after')
+                print(explain(connection, statement, parameters))
+                print()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,74 @@
+"""Measure how long a worker takes to import and build the app.
+
+Runs fresh interpreters that import app and call create_app(), reporting
+the median wall time of each step, the heaviest top-level imports from
+python -X importtime, and whether the modules deferred out of the serving
+path (babel, dateutil, flask_migrate, alembic, and the importer and seed
+of the flask command) were loaded. Template warm-up is left to
+bench.cold_start and turned off here. No database connection is made
+unless PRELOAD is set.
+
+Usage: python -m bench.import_time [--runs N] [--top N]
+"""
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+
+DEFERRED = ['babel', 'dateutil', 'flask_migrate', 'alembic', 'importer', 'seed']
+
+WORKER = '''
+import json, sys, time
+started = time.perf_counter()
+import config
+config.TEMPLATE_WARMUP = False
+import app
+imported = time.perf_counter()
+app.create_app()
+created = time.perf_counter()
+print(json.dumps({'import': imported - started, 'create_app': created - imported,
+                  'loaded': [name for name in %r if name in sys.modules]}))
+''' % (DEFERRED,)
+
+
+def run(*flags):
+    return subprocess.run([sys.executable, *flags, '-c', WORKER],
+                          check=True, capture_output=True, text=True)
+
+
+def heaviest(importtime, top):
+    # Cumulative microseconds of the modules imported by the worker and by
+    # app itself, including those create_app() imports.
+    modules = []
+    for line in importtime.splitlines():
+        if not line.startswith('import time:') or '|' not in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        depth = (len(name) - len(name.lstrip()) + 1) // 2
+        if cumulative.strip().isdigit() and depth <= 2 and name.strip() != 'app':
+            modules.append((int(cumulative), name.strip()))
+    return sorted(modules, reverse=True)[:top]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--top', type=int, default=10)
+    args = parser.parse_args()
+
+    results = [json.loads(run().stdout.strip().splitlines()[-1])
+               for _ in range(args.runs)]
+    for key in ('import', 'create_app'):
+        median = statistics.median(result[key] for result in results)
+        print(f'{key:<12}{median * 1000:>10.1f} ms')
+    loaded = results[-1]['loaded']
+    print(f'deferred modules loaded: {", ".join(loaded) or "none"}')
+
+    print('\nheaviest imports (-X importtime, ms)')
+    for cumulative, name in heaviest(run('-X', 'importtime').stderr, args.top):
+        print(f'{name:<40}{cumulative / 1000:>10.1f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,397 @@
+"""Load a multi-worker server with concurrent traffic and find where it saturates.
+
+Starts gunicorn with gunicorn.conf.py and the given worker, thread and
+connection pool settings (or targets an already running server with --url),
+then replays a weighted mix of list pages, detail pages, searches and form
+submissions from many concurrent clients. Each concurrency level runs for
+--duration seconds after --warmup seconds; the report gives throughput,
+latency percentiles and the error rate per level, a breakdown by request
+kind for the last level, and the level past which throughput stops growing.
+
+Clients are closed loop: each sends its next request as soon as the last
+one is answered. They are spread over several processes so the driver's
+own GIL does not cap the load. A request counts as an error when it fails
+to connect or times out, answers 400 or above, or, for the form
+submissions, does not report the listing as created.
+
+The submissions create venues and shows, named 'Load listing ...', in the
+target database; reseed it afterwards (`flask seed --reset`) or pass
+--no-writes. The database must hold some venues and artists to pick from.
+
+Usage: python -m bench.load [--url URL] [--workers N] [--threads N]
+                            [--pool-size N] [--max-overflow N]
+                            [--concurrency 1,4,16,64] [--duration S]
+                            [--warmup S] [--mix NAME=WEIGHT,...]
+                            [--processes N] [--no-writes]
+"""
+import argparse
+import http.client
+import json
+import multiprocessing
+import os
+import random
+import re
+import socket
+import subprocess
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+from urllib.parse import urlencode, urlsplit
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Request kinds and their default share of the traffic.
+MIX = {
+    'venues': 15,
+    'artists': 10,
+    'shows': 15,
+    'venue_detail': 20,
+    'artist_detail': 15,
+    'search_venues': 8,
+    'search_artists': 7,
+    'create_show': 5,
+    'create_venue': 5,
+}
+WRITES = {'create_show', 'create_venue'}
+
+SEARCH_TERMS = ['hall', 'blue', 'the', 'band', 'golden room', 'jazz', 'a',
+                'club 1', 'midnight', 'trio']
+CSRF_TOKEN = re.compile(r'name="csrf_token" type="hidden" value="([^"]+)"')
+
+
+class Client:
+    """One connection with its own cookies, as one browser would hold."""
+
+    def __init__(self, url, timeout):
+        parts = urlsplit(url)
+        self.host, self.port = parts.hostname, parts.port or 80
+        self.timeout = timeout
+        self.connection = None
+        self.cookies = {}
+        self.csrf_token = None
+
+    def close(self):
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+
+    def request(self, method, path, form=None):
+        headers = {}
+        body = None
+        if form is not None:
+            body = urlencode(form, doseq=True)
+            headers['Content-Type'] = 'application/x-www-form-urlencoded'
+        if self.cookies:
+            headers['Cookie'] = '; '.join(f'{name}={value}' for name, value
+                                          in self.cookies.items())
+        # A kept-alive connection may have been closed by the server since
+        # its last use; that request is sent once more on a new one.
+        reused = self.connection is not None
+        try:
+            response, data = self._send(method, path, body, headers)
+        except (http.client.RemoteDisconnected, ConnectionResetError,
+                BrokenPipeError):
+            self.close()
+            if not reused:
+                raise
+            response, data = self._send(method, path, body, headers)
+        for cookie in response.headers.get_all('Set-Cookie') or []:
+            name, _, value = cookie.split(';', 1)[0].partition('=')
+            self.cookies[name.strip()] = value
+        if response.will_close:
+            self.close()
+        return response.status, data
+
+    def _send(self, method, path, body, headers):
+        if self.connection is None:
+            self.connection = http.client.HTTPConnection(
+                self.host, self.port, timeout=self.timeout)
+        try:
+            self.connection.request(method, path, body, headers)
+            response = self.connection.getresponse()
+            return response, response.read()
+        except Exception:
+            self.close()
+            raise
+
+    def token(self):
+        # The form pages carry the CSRF token of this client's session.
+        if self.csrf_token is None:
+            _, data = self.request('GET', '/venues/create')
+            match = CSRF_TOKEN.search(data.decode('utf-8', 'replace'))
+            self.csrf_token = match.group(1) if match else ''
+        return self.csrf_token
+
+
+def build(kind, rng, ids, client, number):
+    """Return (method, path, form, expected texts) for one request of kind.
+
+    The response must contain one of the expected texts, if any are given.
+    """
+    if kind in ('venues', 'artists', 'shows'):
+        return 'GET', f'/{kind}', None, None
+    if kind == 'venue_detail':
+        return 'GET', f'/venues/{rng.choice(ids["venues"])}', None, None
+    if kind == 'artist_detail':
+        return 'GET', f'/artists/{rng.choice(ids["artists"])}', None, None
+    if kind in ('search_venues', 'search_artists'):
+        return ('POST', f'/{kind.split("_")[1]}/search',
+                {'search_term': rng.choice(SEARCH_TERMS)}, None)
+    if kind == 'create_show':
+        start_time = datetime.now() + timedelta(days=rng.randint(1, 365),
+                                                hours=rng.randint(0, 23))
+        return ('POST', '/shows/create',
+                {'venue_id': rng.choice(ids['venues']),
+                 'artist_id': rng.choice(ids['artists']),
+                 'start_time': start_time.strftime('%Y-%m-%d %H:00:00'),
+                 'csrf_token': client.token()},
+                # Refusing a double booking is an answer as good as any.
+                (b'successfully listed', b'Overlaps '))
+    if kind == 'create_venue':
+        return ('POST', '/venues/create',
+                {'name': f'Load listing {number}', 'city': 'Load City',
+                 'state': rng.choice(['CA', 'NY', 'TX', 'WA']),
+                 'address': f'{rng.randint(1, 9999)} Load St',
+                 'phone': '555-555-5555', 'genres': ['Jazz'],
+                 'csrf_token': client.token()},
+                (b'successfully listed',))
+    raise ValueError(f'Unknown request kind {kind!r}')
+
+
+def drive(url, threads, mix, ids, start_at, warmup, duration, timeout, seed):
+    """Run threads clients in this process; return what they recorded.
+
+    Only requests sent after the warm-up are recorded.
+    """
+    kinds, weights = list(mix), list(mix.values())
+    record_from = start_at + warmup
+    end = record_from + duration
+    results = []
+
+    def loop(index):
+        rng = random.Random(seed * 1000 + index)
+        client = Client(url, timeout)
+        latencies = {kind: [] for kind in kinds}
+        errors = Counter()
+        sent = 0
+        while time.time() < start_at:
+            time.sleep(0.005)
+        while True:
+            sent_at = time.time()
+            if sent_at >= end:
+                break
+            kind = rng.choices(kinds, weights)[0]
+            sent += 1
+            started = None
+            try:
+                # Building a form may fetch its CSRF token first, untimed.
+                method, path, form, expected = build(
+                    kind, rng, ids, client, f'{os.getpid()}-{index}-{sent}')
+                started = time.perf_counter()
+                status, data = client.request(method, path, form)
+                ok = status < 400 and (expected is None or any(
+                    text in data for text in expected))
+            except (OSError, http.client.HTTPException):
+                ok = False
+            elapsed = time.perf_counter() - (started or time.perf_counter())
+            if sent_at < record_from:
+                continue
+            latencies[kind].append(elapsed)
+            if not ok:
+                errors[kind] += 1
+        client.close()
+        results.append((latencies, errors))
+
+    workers = [threading.Thread(target=loop, args=(index,))
+               for index in range(threads)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+    latencies = {kind: [] for kind in kinds}
+    errors = Counter()
+    for thread_latencies, thread_errors in results:
+        for kind, values in thread_latencies.items():
+            latencies[kind].extend(values)
+        errors.update(thread_errors)
+    return latencies, dict(errors)
+
+
+def run_level(args, url, mix, ids, concurrency):
+    processes = max(1, min(args.processes, concurrency))
+    shares = [concurrency // processes + (index < concurrency % processes)
+              for index in range(processes)]
+    # Every process starts its clients at the same moment.
+    start_at = time.time() + 1.0
+    jobs = [(url, threads, mix, ids, start_at, args.warmup, args.duration,
+             args.timeout, number) for number, threads in enumerate(shares)]
+    with multiprocessing.Pool(processes) as pool:
+        outcomes = pool.starmap(drive, jobs)
+
+    latencies = {kind: [] for kind in mix}
+    errors = Counter()
+    for process_latencies, process_errors in outcomes:
+        for kind, values in process_latencies.items():
+            latencies[kind].extend(values)
+        errors.update(process_errors)
+    return latencies, errors
+
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def summarize(latencies, errors, duration):
+    values = [value for kind_values in latencies.values()
+              for value in kind_values]
+    requests = len(values)
+    return {'requests': requests,
+            'throughput': requests / duration,
+            'p50_ms': percentile(values, 0.50) * 1000,
+            'p90_ms': percentile(values, 0.90) * 1000,
+            'p99_ms': percentile(values, 0.99) * 1000,
+            'max_ms': max(values, default=0.0) * 1000,
+            'error_rate': sum(errors.values()) / requests if requests else 0.0}
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_server(args):
+    port = free_port()
+    env = dict(os.environ,
+               PORT=str(port),
+               WEB_CONCURRENCY=str(args.workers),
+               DB_POOL_SIZE=str(args.pool_size),
+               DB_MAX_OVERFLOW=str(args.max_overflow))
+    command = [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py',
+               '--bind', f'127.0.0.1:{port}', '--workers', str(args.workers),
+               '--threads', str(args.threads), '--log-level', 'warning']
+    server = subprocess.Popen(command, cwd=ROOT, env=env)
+    url = f'http://127.0.0.1:{port}'
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            raise SystemExit(f'gunicorn exited with status {server.returncode}')
+        try:
+            Client(url, 5).request('GET', '/')
+            return server, url
+        except OSError:
+            time.sleep(0.2)
+    server.terminate()
+    raise SystemExit('gunicorn did not start within 60 seconds')
+
+
+def listing_ids(url, kind):
+    try:
+        status, data = Client(url, 30).request(
+            'GET', f'/api/{kind}?limit=500&fields=id')
+    except OSError as e:
+        raise SystemExit(f'Cannot reach {url}: {e}')
+    if status != 200:
+        raise SystemExit(f'/api/{kind} answered {status}')
+    ids = [record['id'] for record in json.loads(data)['data']]
+    if not ids:
+        raise SystemExit(f'No {kind} to request; run `flask seed` first.')
+    return ids
+
+
+def parse_mix(value, writes):
+    mix = dict(MIX)
+    if value:
+        for item in value.split(','):
+            kind, _, weight = item.partition('=')
+            if kind.strip() not in MIX:
+                raise SystemExit(f'Unknown request kind {kind.strip()!r}; '
+                                 f'choose from {", ".join(MIX)}')
+            mix[kind.strip()] = float(weight)
+    if not writes:
+        mix = {kind: weight for kind, weight in mix.items()
+               if kind not in WRITES}
+    return {kind: weight for kind, weight in mix.items() if weight > 0}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--url', help='Load this server instead of starting one.')
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--threads', type=int, default=1)
+    parser.add_argument('--pool-size', type=int, default=5)
+    parser.add_argument('--max-overflow', type=int, default=5)
+    parser.add_argument('--concurrency', default='1,4,16,64',
+                        help='Comma separated numbers of concurrent clients.')
+    parser.add_argument('--duration', type=float, default=20.0)
+    parser.add_argument('--warmup', type=float, default=3.0)
+    parser.add_argument('--timeout', type=float, default=30.0)
+    parser.add_argument('--mix', help='Weights to change, e.g. shows=30,create_venue=0')
+    parser.add_argument('--processes', type=int,
+                        default=max(1, (os.cpu_count() or 2) // 2))
+    parser.add_argument('--no-writes', dest='writes', action='store_false')
+    args = parser.parse_args()
+
+    levels = [int(level) for level in args.concurrency.split(',')]
+    mix = parse_mix(args.mix, args.writes)
+
+    server = None
+    if args.url:
+        url = args.url.rstrip('/')
+        print(f'target: {url}')
+    else:
+        server, url = start_server(args)
+        print(f'target: gunicorn, {args.workers} workers x {args.threads} '
+              f'threads, pool {args.pool_size} + {args.max_overflow} overflow '
+              f'per worker')
+    try:
+        ids = {kind: listing_ids(url, kind) for kind in ('venues', 'artists')}
+        print(f'mix: {", ".join(f"{kind}={weight:g}" for kind, weight in mix.items())}')
+        print(f'{args.duration:g} s per level after {args.warmup:g} s warm-up\n')
+        print(f'{"clients":>8}{"req/s":>10}{"p50 ms":>10}{"p90 ms":>10}'
+              f'{"p99 ms":>10}{"max ms":>10}{"errors":>9}')
+
+        summaries = []
+        for concurrency in levels:
+            latencies, errors = run_level(args, url, mix, ids, concurrency)
+            summary = summarize(latencies, errors, args.duration)
+            summaries.append((concurrency, summary))
+            print(f'{concurrency:>8}{summary["throughput"]:>10.1f}'
+                  f'{summary["p50_ms"]:>10.1f}{summary["p90_ms"]:>10.1f}'
+                  f'{summary["p99_ms"]:>10.1f}{summary["max_ms"]:>10.1f}'
+                  f'{summary["error_rate"]:>9.1%}')
+
+        print(f'\nby request kind at {levels[-1]} clients')
+        print(f'{"kind":<16}{"requests":>10}{"p50 ms":>10}{"p99 ms":>10}'
+              f'{"errors":>9}')
+        for kind, values in latencies.items():
+            print(f'{kind:<16}{len(values):>10}'
+                  f'{percentile(values, 0.50) * 1000:>10.1f}'
+                  f'{percentile(values, 0.99) * 1000:>10.1f}'
+                  f'{errors.get(kind, 0) / len(values) if values else 0:>9.1%}')
+
+        # Saturation: the first level after which more clients buy less
+        # than 10% more throughput.
+        for (level, summary), (_, following) in zip(summaries, summaries[1:]):
+            if following['throughput'] < summary['throughput'] * 1.1:
+                print(f'\nthroughput levels off at {level} clients, '
+                      f'{summary["throughput"]:.1f} req/s '
+                      f'(p99 {summary["p99_ms"]:.1f} ms)')
+                break
+        else:
+            print('\nthroughput still rising at the highest level; '
+                  'add higher --concurrency levels to find saturation')
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,74 @@
+"""Measure what recording metrics costs per request.
+
+First times the registry calls one request makes (a counter and three
+histogram observations) in a tight loop. Then serves the home page through
+the test client from two apps, with METRICS_ENABLED on and off, and
+compares the time per request. The home page runs no SQL, so the
+difference is the hooks' own overhead. A first request to each app runs the
+before_first_request hooks, so the configured database must be reachable.
+
+Usage: python -m bench.metrics_overhead [--requests N] [--rounds N]
+"""
+import argparse
+import statistics
+import time
+
+import config
+from metrics import Registry
+
+
+def per_request_calls(iterations):
+    registry = Registry()
+    labels = (('endpoint', 'main.index'),)
+    counter_labels = labels + (('method', 'GET'), ('status', '200'))
+    started = time.perf_counter()
+    for _ in range(iterations):
+        registry.enter()
+        registry.inc('fyyur_requests_total', counter_labels)
+        registry.observe('fyyur_request_duration_seconds', labels, 0.012)
+        registry.observe('fyyur_template_render_seconds',
+                         (('template', 'pages/home.html'),), 0.004)
+        registry.observe('fyyur_db_seconds', labels, 0.003)
+        registry.leave()
+    return (time.perf_counter() - started) / iterations
+
+
+def per_request(clients, requests, rounds):
+    # Rounds alternate between the apps so drift affects both alike.
+    timings = {key: [] for key in clients}
+    for client in clients.values():
+        client.get('/')
+    for _ in range(rounds):
+        for key, client in clients.items():
+            started = time.perf_counter()
+            for _ in range(requests):
+                client.get('/')
+            timings[key].append((time.perf_counter() - started) / requests)
+    return {key: statistics.median(values) for key, values in timings.items()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--rounds', type=int, default=5)
+    args = parser.parse_args()
+
+    from app import create_app
+
+    print(f'registry calls per request: '
+          f'{per_request_calls(100000) * 1e6:.2f} us')
+
+    clients = {}
+    for enabled in (False, True):
+        config.METRICS_ENABLED = enabled
+        clients[enabled] = create_app().test_client()
+    timings = per_request(clients, args.requests, args.rounds)
+    off, on = timings[False], timings[True]
+    print(f'GET / without metrics:      {off * 1e6:.1f} us')
+    print(f'GET / with metrics:         {on * 1e6:.1f} us')
+    print(f'overhead per request:       {(on - off) * 1e6:.1f} us '
+          f'({(on - off) / off:.1%})')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,266 @@
+"""Benchmark every route of the app through the test client.
+
+Prints the median and 95th percentile time and the most SQL statements
+per request of each route. Conditional GET is bypassed and the detail page
+cache is cleared before each request, so every response is built from the
+database. Routes of the app without a case here are listed at the end, so
+new ones are not left out unnoticed.
+
+With --writes the form submissions run too: each repeat creates a venue
+and an artist, edits both, books a show between them and deletes the venue
+again; the artists are deleted at the end. Leave it off against a database
+whose data matters.
+
+--save writes the results to a JSON file; --compare reads such a file and
+exits with status 1 if a route got slower than the baseline by more than
+--tolerance (and by at least --floor ms, to ride out timer noise) or runs
+more statements than it did.
+
+Point DATABASE_URL at a local Postgres or SQLite database filled by
+`flask seed`, e.g.
+
+    DATABASE_URL=sqlite:///bench.db flask seed --venues 100000 --shows 1000000
+
+Usage: python -m bench.routes [--repeat N] [--writes] [--save FILE]
+                              [--compare FILE] [--tolerance F] [--floor MS]
+"""
+import argparse
+import json
+import statistics
+import sys
+import time
+from datetime import date, datetime, timedelta
+from itertools import count
+
+from sqlalchemy import event, func, select
+
+from app import create_app
+from models import Artist, Show, Venue, db
+
+# Endpoints measured by every run, with the requests to make of them.
+READS = [
+    ('main.index', 'GET', '/', None),
+    ('main.venues', 'GET', '/venues', None),
+    ('main.search_venues', 'POST', '/venues/search', {'search_term': 'hall'}),
+    ('main.show_venue', 'GET', '/venues/{venue_id}', None),
+    ('main.create_venue_form', 'GET', '/venues/create', None),
+    ('main.artists', 'GET', '/artists', None),
+    ('main.search_artists', 'POST', '/artists/search', {'search_term': 'band'}),
+    ('main.show_artist', 'GET', '/artists/{artist_id}', None),
+    ('main.create_artist_form', 'GET', '/artists/create', None),
+    ('main.shows', 'GET', '/shows', None),
+    ('main.export_shows', 'GET', '/shows/export.csv', None),
+    ('main.create_shows', 'GET', '/shows/create', None),
+    ('main.calendar', 'GET', '/calendar?period=month&date={today}', None),
+    ('main.venue_feed', 'GET', '/venues/{venue_id}/shows.ics', None),
+    ('main.artist_feed', 'GET', '/artists/{artist_id}/shows.ics', None),
+    ('main.suggest', 'GET', '/typeahead?q=blue', None),
+    ('main.cache_stats', 'GET', '/cache/stats', None),
+    ('main.pool_stats', 'GET', '/pool/stats', None),
+    ('metrics', 'GET', '/metrics', None),
+    ('api.venues', 'GET', '/api/venues', None),
+    ('api.venue_detail', 'GET', '/api/venues/{venue_id}', None),
+    ('api.artists', 'GET', '/api/artists', None),
+    ('api.artist_detail', 'GET', '/api/artists/{artist_id}', None),
+    ('api.shows', 'GET', '/api/shows', None),
+    ('api.show_detail', 'GET', '/api/shows/{show_id}', None),
+    ('api.show_conflicts', 'GET', '/api/shows/conflicts?venue_id={venue_id}'
+     '&artist_id={artist_id}&start_time={today}T20:00:00&duration=180', None),
+]
+
+# Endpoints exercised by --writes.
+WRITES = ['main.create_venue_submission', 'main.create_artist_submission',
+          'main.edit_venue', 'main.edit_venue_submission', 'main.edit_artist',
+          'main.edit_artist_submission', 'main.create_show_submission',
+          'main.delete_venue']
+
+BENCH_PREFIX = 'Bench listing'
+
+
+class Recorder:
+    """Times requests and counts the statements each one runs."""
+
+    def __init__(self, client, cache, engine):
+        self.client = client
+        self.cache = cache
+        self.statements = 0
+        self.results = {}
+        event.listen(engine, 'before_cursor_execute', self.count)
+
+    def count(self, conn, cursor, statement, parameters, context, executemany):
+        self.statements += 1
+
+    def request(self, endpoint, method, url, data=None):
+        self.cache.clear()
+        before = self.statements
+        started = time.perf_counter()
+        response = self.client.open(url, method=method, data=data)
+        # Streamed bodies are part of the cost.
+        response.get_data()
+        elapsed = time.perf_counter() - started
+        result = self.results.setdefault(
+            endpoint, {'timings': [], 'queries': 0, 'statuses': set()})
+        result['timings'].append(elapsed)
+        result['queries'] = max(result['queries'], self.statements - before)
+        result['statuses'].add(response.status_code)
+        return response
+
+
+def sample_ids():
+    # The busiest venue and artist, so detail pages carry the most shows.
+    def busiest(model):
+        return db.session.execute(
+            select(model.id).order_by(
+                (model.num_upcoming_shows + model.num_past_shows).desc(),
+                model.id).limit(1)).scalar()
+
+    return {'venue_id': busiest(Venue) or 1,
+            'artist_id': busiest(Artist) or 1,
+            'show_id': db.session.execute(
+                select(func.min(Show.id))).scalar() or 1,
+            'today': date.today().isoformat()}
+
+
+def listing_form(name):
+    # Valid for both the venue and the artist forms.
+    return {'name': name, 'city': 'Bench City', 'state': 'CA',
+            'address': '1 Bench St', 'phone': '555-555-5555',
+            'genres': ['Jazz', 'Blues'],
+            'facebook_link': 'https://www.facebook.com/bench',
+            'image_link': 'https://images.example.com/bench.jpg',
+            'website_link': 'https://bench.example.com',
+            'seeking_description': 'Benchmarking.'}
+
+
+def created_id(model, name):
+    try:
+        return db.session.execute(
+            select(func.max(model.id)).where(model.name == name)).scalar()
+    finally:
+        db.session.remove()
+
+
+def run_writes(recorder, app, number):
+    name = f'{BENCH_PREFIX} {number}'
+    recorder.request('main.create_venue_submission', 'POST', '/venues/create',
+                     listing_form(name))
+    recorder.request('main.create_artist_submission', 'POST',
+                     '/artists/create', listing_form(name))
+    with app.app_context():
+        venue_id = created_id(Venue, name)
+        artist_id = created_id(Artist, name)
+    if venue_id is None or artist_id is None:
+        raise SystemExit('The bench venue or artist was not created.')
+
+    recorder.request('main.edit_venue', 'GET', f'/venues/{venue_id}/edit')
+    recorder.request('main.edit_venue_submission', 'POST',
+                     f'/venues/{venue_id}/edit', listing_form(name))
+    recorder.request('main.edit_artist', 'GET', f'/artists/{artist_id}/edit')
+    recorder.request('main.edit_artist_submission', 'POST',
+                     f'/artists/{artist_id}/edit', listing_form(name))
+    start_time = (datetime.now() + timedelta(days=30)).strftime(
+        '%Y-%m-%d %H:%M:%S')
+    recorder.request('main.create_show_submission', 'POST', '/shows/create',
+                     {'venue_id': venue_id, 'artist_id': artist_id,
+                      'start_time': start_time})
+    recorder.request('main.delete_venue', 'DELETE', f'/venues/{venue_id}')
+
+
+def delete_bench_artists(app):
+    with app.app_context():
+        for artist in Artist.query.filter(
+                Artist.name.startswith(BENCH_PREFIX)):
+            db.session.delete(artist)
+        db.session.commit()
+
+
+def summarize(results):
+    summary = {}
+    for endpoint, result in results.items():
+        timings = sorted(result['timings'])
+        p95 = timings[min(len(timings) - 1, int(len(timings) * 0.95))]
+        summary[endpoint] = {'median_ms': statistics.median(timings) * 1000,
+                             'p95_ms': p95 * 1000,
+                             'queries': result['queries'],
+                             'statuses': sorted(result['statuses'])}
+    return summary
+
+
+def regressions(summary, baseline, tolerance, floor):
+    found = []
+    for endpoint, result in summary.items():
+        before = baseline.get(endpoint)
+        if before is None:
+            continue
+        slower = result['median_ms'] - before['median_ms']
+        if slower > floor and slower > before['median_ms'] * tolerance:
+            found.append(f'{endpoint}: {before["median_ms"]:.2f} -> '
+                         f'{result["median_ms"]:.2f} ms')
+        if result['queries'] > before['queries']:
+            found.append(f'{endpoint}: {before["queries"]} -> '
+                         f'{result["queries"]} queries')
+    return found
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--writes', action='store_true')
+    parser.add_argument('--save', metavar='FILE')
+    parser.add_argument('--compare', metavar='FILE')
+    parser.add_argument('--tolerance', type=float, default=0.25)
+    parser.add_argument('--floor', type=float, default=1.0)
+    args = parser.parse_args()
+
+    app = create_app()
+    app.config['WTF_CSRF_ENABLED'] = False
+    client = app.test_client()
+    client.get('/')
+    with app.app_context():
+        engine = db.engine
+        ids = sample_ids()
+        db.session.remove()
+    recorder = Recorder(client, app.extensions['detail_cache'], engine)
+
+    numbers = count(int(time.time()))
+    try:
+        for _ in range(args.repeat):
+            for endpoint, method, url, data in READS:
+                recorder.request(endpoint, method, url.format(**ids), data)
+            if args.writes:
+                run_writes(recorder, app, next(numbers))
+    finally:
+        if args.writes:
+            delete_bench_artists(app)
+
+    summary = summarize(recorder.results)
+    print(f'{"endpoint":<34}{"median ms":>10}{"p95 ms":>10}'
+          f'{"queries":>9}  status')
+    for endpoint, result in summary.items():
+        statuses = ','.join(map(str, result['statuses']))
+        print(f'{endpoint:<34}{result["median_ms"]:>10.2f}'
+              f'{result["p95_ms"]:>10.2f}{result["queries"]:>9}  {statuses}')
+
+    covered = {endpoint for endpoint, *_ in READS} | set(WRITES)
+    missing = sorted({rule.endpoint for rule in app.url_map.iter_rules()
+                      if rule.endpoint != 'static'} - covered)
+    if missing:
+        print(f'\nnot benchmarked: {", ".join(missing)}')
+    if not args.writes:
+        print('form submissions skipped; pass --writes to include them')
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(summary, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        found = regressions(summary, baseline, args.tolerance, args.floor)
+        if found:
+            print('\nregressions:\n  ' + '\n  '.join(found))
+            sys.exit(1)
+        print('\nno regressions against ' + args.compare)
+
+
+if __name__ == '__main__':
+    main()
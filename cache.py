@@ -0,0 +1,132 @@
+import pickle
+import threading
+import time
+from collections import OrderedDict
+
+#----------------------------------------------------------------------------#
+# Page payload cache.
+#----------------------------------------------------------------------------#
+
+
+class LRUCache:
+    """In-process cache holding at most max_entries, least recently used out.
+
+    Entries carry an absolute expiry (epoch seconds) and are treated as a miss
+    once it has passed.
+    """
+
+    def __init__(self, max_entries=1024, default_timeout=3600):
+        self.max_entries = max_entries
+        self.default_timeout = default_timeout
+        self.hits = self.misses = self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[1] <= time.time():
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def set(self, key, value, expires_at=None):
+        if expires_at is None:
+            expires_at = time.time() + self.default_timeout
+        with self._lock:
+            self._entries[key] = (value, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, *keys):
+        with self._lock:
+            for key in keys:
+                self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return {'backend': 'lru',
+                    'entries': len(self._entries),
+                    'max_entries': self.max_entries,
+                    'hits': self.hits,
+                    'misses': self.misses,
+                    'evictions': self.evictions}
+
+
+class RedisCache:
+    """Cache shared between workers, kept in Redis or a compatible server.
+
+    Hits and misses are counted per process; evictions are the server's own
+    evicted_keys counter.
+    """
+
+    def __init__(self, url, prefix='fyyur:', default_timeout=3600):
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError(
+                "CACHE_BACKEND = 'redis' needs the redis package installed")
+        self.client = redis.Redis.from_url(url)
+        self.prefix = prefix
+        self.default_timeout = default_timeout
+        self.hits = self.misses = 0
+
+    def get(self, key):
+        value = self.client.get(self.prefix + key)
+        if value is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return pickle.loads(value)
+
+    def set(self, key, value, expires_at=None):
+        timeout = (self.default_timeout if expires_at is None
+                   else expires_at - time.time())
+        if timeout <= 0:
+            return
+        self.client.set(self.prefix + key, pickle.dumps(value),
+                        px=max(int(timeout * 1000), 1))
+
+    def delete(self, *keys):
+        if keys:
+            self.client.delete(*[self.prefix + key for key in keys])
+
+    def clear(self):
+        for key in self.client.scan_iter(self.prefix + '*'):
+            self.client.delete(key)
+
+    def stats(self):
+        return {'backend': 'redis',
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.client.info('stats').get('evicted_keys')}
+
+
+def make_cache(config):
+    backend = config.get('CACHE_BACKEND', 'lru')
+    timeout = config.get('CACHE_DEFAULT_TIMEOUT', 3600)
+    if backend == 'lru':
+        return LRUCache(config.get('CACHE_MAX_ENTRIES', 1024), timeout)
+    if backend == 'redis':
+        return RedisCache(config['CACHE_REDIS_URL'],
+                          config.get('CACHE_KEY_PREFIX', 'fyyur:'), timeout)
+    raise ValueError(f'Unknown CACHE_BACKEND: {backend!r}')
+
+
+def get_or_set(cache, key, build):
+    # build() returns the value and when it stops being valid (or None).
+    value = cache.get(key)
+    if value is None:
+        value, expires_at = build()
+        cache.set(key, value, expires_at)
+    return value
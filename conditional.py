@@ -0,0 +1,203 @@
+import hashlib
+from datetime import datetime, timezone
+from functools import wraps
+
+from flask import current_app, g, make_response, request, session
+from sqlalchemy import event, func, select
+from sqlalchemy.engine import Engine
+from sqlalchemy.sql.dml import UpdateBase
+
+from models import DataVersion, Show, db, dialect_insert
+
+#----------------------------------------------------------------------------#
+# Data versions.
+#
+# Every INSERT, UPDATE and DELETE a connection runs, through the ORM or
+# Core, is noted by table on the connection. As its transaction commits,
+# the versions of those tables advance in one upsert, so the data_version
+# rows are locked for the commit alone. Writes the hook cannot see, such as
+# COPY or raw SQL, are noted with mark_written().
+#
+# Venue and artist pages also have a row each, named by page_name(), which
+# the paths writing to a page mark. Payloads cached for a page are keyed on
+# its row and on ALL_PAGES, bumped when every page changes at once.
+#----------------------------------------------------------------------------#
+
+# Tables whose writes leave every page as it was.
+UNVERSIONED = {'data_version', 'counter_watermark'}
+
+# A genre link is part of the venue or artist it belongs to.
+OWNERS = {'venue_genre': 'venue', 'artist_genre': 'artist'}
+
+ALL_PAGES = 'pages'
+
+
+def page_name(kind, ident):
+    # The data_version row of the page of one venue or artist.
+    return f'{kind}:{ident}'
+
+
+def touch(session, tables):
+    # One upsert advancing the counter of every table in tables, through a
+    # session or a connection.
+    now = datetime.now()
+    table = DataVersion.__table__
+    insert = dialect_insert(session, table).values(
+        [{'table_name': name, 'version': 1, 'updated_at': now}
+         for name in sorted(tables)])
+    session.execute(insert.on_conflict_do_update(
+        index_elements=[table.c.table_name],
+        set_={'version': table.c.version + 1, 'updated_at': now}))
+
+
+def mark_written(connection, tables):
+    """Advance the versions of tables when connection's transaction commits."""
+    written = connection.info.setdefault('written_tables', set())
+    written.update(OWNERS.get(name, name) for name in tables
+                   if name not in UNVERSIONED)
+
+
+def record_writes(connection, clauseelement, multiparams, params,
+                  execution_options):
+    if isinstance(clauseelement, UpdateBase):
+        mark_written(connection, [clauseelement.table.name])
+
+
+def forget_writes(connection):
+    # A new transaction starts with nothing written; what a rolled back
+    # one noted goes with it.
+    connection.info.pop('written_tables', None)
+
+
+def bump_versions(connection):
+    # Runs inside the transaction, just before it commits.
+    tables = connection.info.pop('written_tables', None)
+    if tables:
+        touch(connection, tables)
+
+
+event.listen(Engine, 'before_execute', record_writes)
+event.listen(Engine, 'begin', forget_writes)
+event.listen(Engine, 'commit', bump_versions)
+
+
+def utc(value):
+    # Naive timestamps in this app are local time.
+    return value.astimezone(timezone.utc).replace(microsecond=0)
+
+
+def versions_statement(tables):
+    return select(DataVersion.table_name, DataVersion.version,
+                  DataVersion.updated_at).where(
+        DataVersion.table_name.in_(tables)).order_by(DataVersion.table_name)
+
+
+def started_statement():
+    # The start time of the latest show to have begun, from the start_time
+    # index.
+    return select(func.max(Show.start_time)).where(
+        Show.start_time <= datetime.now())
+
+
+def make_validators(rows, time_sensitive, started=None):
+    """ETag and Last-Modified from the rows of versions_statement().
+
+    Pages splitting shows into upcoming and past also change whenever a show
+    starts, so for them the result of started_statement() is part of the
+    version.
+    """
+    versions = [(row.table_name, row.version) for row in rows]
+    moments = [row.updated_at for row in rows]
+
+    if time_sensitive:
+        versions.append(('started', started and started.isoformat()))
+        if started:
+            moments.append(started)
+
+    key = repr((current_app.config.get('ETAG_SALT', ''),
+                request.full_path, versions))
+    etag = hashlib.sha1(key.encode()).hexdigest()
+    return etag, utc(max(moments)) if moments else None
+
+
+def remember_versions(names, rows):
+    # The versions of names for the rest of the request; a name without a
+    # row has never been written.
+    known = g.setdefault('data_versions', {})
+    known.update(dict.fromkeys(names, 0))
+    known.update((row.table_name, row.version) for row in rows)
+
+
+def data_versions(names):
+    """The versions of names, tables or pages, for keys of data cached from
+    them.
+
+    They change with every committed write to any of them. Read once per
+    request: conditional() records the versions it validated with.
+    """
+    known = g.get('data_versions', {})
+    missing = [name for name in names if name not in known]
+    if missing:
+        remember_versions(
+            missing, db.session.execute(versions_statement(missing)).all())
+    return [g.data_versions[name] for name in names]
+
+
+def validators(tables, time_sensitive, pages=()):
+    """ETag and Last-Modified for a page built from tables.
+
+    The versions of pages are read along with them.
+    """
+    names = list(tables) + list(pages)
+    rows = db.session.execute(versions_statement(names)).all()
+    remember_versions(names, rows)
+    started = (db.session.execute(started_statement()).scalar()
+               if time_sensitive else None)
+    return make_validators(rows, time_sensitive, started)
+
+
+def unchanged(etag, last_modified):
+    # Whether the client's copy, as described by the request's conditional
+    # headers, is current.
+    if request.if_none_match:
+        return request.if_none_match.contains(etag)
+    return (last_modified is not None
+            and request.if_modified_since is not None
+            and last_modified <= request.if_modified_since)
+
+
+def skip_validation():
+    return request.method not in ('GET', 'HEAD') or '_flashes' in session
+
+
+def set_validators(response, etag, last_modified):
+    if response.status_code in (200, 304):
+        response.set_etag(etag)
+        response.last_modified = last_modified
+        response.cache_control.no_cache = True
+    return response
+
+
+def conditional(*tables, time_sensitive=False, pages=None):
+    """Answer GET requests for an unchanged page with 304 Not Modified.
+
+    The validators are derived from the data versions of tables, so an
+    unchanged page is confirmed without querying for or rendering it. Pages
+    carrying flashed messages are always rendered in full. pages, called
+    with the view's arguments, names page rows the view keys its cache on,
+    to be read in the same query.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            if skip_validation():
+                return view(*args, **kwargs)
+
+            etag, last_modified = validators(
+                tables, time_sensitive, pages(**kwargs) if pages else ())
+            response = (current_app.response_class(status=304)
+                        if unchanged(etag, last_modified)
+                        else make_response(view(*args, **kwargs)))
+            return set_validators(response, etag, last_modified)
+        return wrapper
+    return decorator
@@ -0,0 +1,218 @@
+import threading
+from datetime import datetime
+
+import click
+from sqlalchemy import bindparam, event, func, select, update
+
+from models import Artist, CounterWatermark, Show, Venue, db, dialect_insert
+
+#----------------------------------------------------------------------------#
+# Show counters.
+#
+# venue and artist carry num_upcoming_shows and num_past_shows. A show counts
+# as upcoming while its start_time is after the counted_until watermark; the
+# scheduler advances the watermark and moves the shows it passes from one
+# counter to the other. Every change is made relative to the watermark row,
+# which writers lock, so the counters stay exact however far the watermark
+# trails the clock.
+#
+# Every path takes its locks in one order: the watermark row, then venue
+# and artist rows, then the data_version rows, which conditional.py only
+# upserts as the transaction commits. Show writes and the scheduler never
+# hold one while waiting on another out of order, so they cannot deadlock.
+# The counter updates are Core statements the data version hook sees; none
+# of these functions touch data_version themselves.
+#----------------------------------------------------------------------------#
+
+WATERMARK = 'show'
+
+show = Show.__table__
+owners = [(Venue.__table__, show.c.venue_id),
+          (Artist.__table__, show.c.artist_id)]
+watermark = CounterWatermark.__table__
+
+
+def counted_until(session, for_update=False):
+    # The watermark row is share locked by writers adding or removing shows
+    # and exclusively locked while it moves.
+    query = select(watermark.c.counted_until).where(
+        watermark.c.name == WATERMARK)
+    return session.execute(
+        query.with_for_update(read=not for_update)).scalar()
+
+
+def set_counted_until(session, moment):
+    insert = dialect_insert(session, watermark).values(
+        name=WATERMARK, counted_until=moment)
+    session.execute(insert.on_conflict_do_update(
+        index_elements=[watermark.c.name], set_={'counted_until': moment}))
+
+
+def adjust(session, table, deltas):
+    # deltas maps an owner id to (upcoming, past) increments.
+    if not deltas:
+        return
+    session.execute(
+        update(table).where(table.c.id == bindparam('owner')).values(
+            num_upcoming_shows=table.c.num_upcoming_shows + bindparam('upcoming'),
+            num_past_shows=table.c.num_past_shows + bindparam('past')),
+        [{'owner': owner, 'upcoming': upcoming, 'past': past}
+         for owner, (upcoming, past) in sorted(deltas.items())])
+
+
+def recount(session, now=None):
+    """Recompute every counter from the show table and reset the watermark."""
+    now = now or datetime.now()
+    counted_until(session, for_update=True)
+    for table, fk in owners:
+        def count(*criteria):
+            return select(func.count(show.c.id)).where(
+                fk == table.c.id, *criteria).scalar_subquery()
+        session.execute(update(table).values(
+            num_upcoming_shows=count(show.c.start_time > now),
+            num_past_shows=count(show.c.start_time <= now)))
+    set_counted_until(session, now)
+
+
+def advance(session, now=None):
+    """Move the shows that started since the watermark over to past.
+
+    Returns the number of shows moved.
+    """
+    now = now or datetime.now()
+    since = counted_until(session, for_update=True)
+    if since is None:
+        recount(session, now)
+        return 0
+    if since >= now:
+        return 0
+
+    moved = 0
+    for table, fk in owners:
+        rows = session.execute(
+            select(fk, func.count(show.c.id)).where(
+                show.c.start_time > since, show.c.start_time <= now
+            ).group_by(fk)).all()
+        adjust(session, table, {owner: (-n, n) for owner, n in rows})
+        # Each pass sees every moved show exactly once.
+        moved = sum(n for _, n in rows)
+    set_counted_until(session, now)
+    return moved
+
+
+def count_shows(session, flush_context):
+    # Keep the counters in step with shows added or deleted through the ORM.
+    added = [instance.id for instance in session.new
+             if isinstance(instance, Show)]
+    deleted = [instance for instance in session.deleted
+               if isinstance(instance, Show)]
+    if not added and not deleted:
+        return
+
+    since = counted_until(session)
+    if since is None:
+        # Never counted: the flushed shows are picked up by the recount.
+        recount(session)
+        return
+
+    # New shows are bucketed by the database, which holds their parsed
+    # start times; deleted ones were loaded from it.
+    rows = [(row.venue_id, row.artist_id, row.upcoming, 1)
+            for row in session.execute(
+                select(show.c.venue_id, show.c.artist_id,
+                       (show.c.start_time > since).label('upcoming')
+                       ).where(show.c.id.in_(added)))] if added else []
+    rows += [(instance.venue_id, instance.artist_id,
+              instance.start_time > since, -1) for instance in deleted]
+    apply_deltas(session, rows)
+
+
+def count_rows(session, rows):
+    """Count show rows inserted without the ORM, such as by the importer."""
+    since = counted_until(session)
+    if since is None:
+        recount(session)
+        return
+    apply_deltas(session, [(row['venue_id'], row['artist_id'],
+                     row['start_time'] > since, 1) for row in rows])
+
+
+def apply_deltas(session, rows):
+    # rows are (venue_id, artist_id, upcoming, sign) for each show counted in
+    # (sign 1) or out (sign -1).
+    for index, (table, _) in enumerate(owners):
+        deltas = {}
+        for *ids, upcoming, sign in rows:
+            current = deltas.get(ids[index], (0, 0))
+            deltas[ids[index]] = (current[0] + sign * bool(upcoming),
+                                  current[1] + sign * (not upcoming))
+        adjust(session, table, deltas)
+
+
+event.listen(db.session, 'after_flush', count_shows)
+
+#----------------------------------------------------------------------------#
+# Scheduler.
+#----------------------------------------------------------------------------#
+
+
+class RefreshScheduler:
+    """Daemon thread advancing the watermark every interval seconds.
+
+    Each worker runs one; the watermark lock makes concurrent runs wait for
+    each other and find nothing left to move.
+    """
+
+    def __init__(self, interval):
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self, app):
+        if self._thread is not None or self.interval <= 0:
+            return
+        self._thread = threading.Thread(target=self._run, args=(app,),
+                                        name='show-counters', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self, app):
+        while True:
+            with app.app_context():
+                try:
+                    advance(db.session)
+                    db.session.commit()
+                except Exception:
+                    db.session.rollback()
+                    app.logger.exception('Advancing the show counters failed')
+                finally:
+                    db.session.close()
+            if self._stop.wait(self.interval):
+                return
+
+
+def register(app):
+    scheduler = RefreshScheduler(app.config['COUNTER_REFRESH_INTERVAL'])
+
+    @app.before_first_request
+    def start_scheduler():
+        scheduler.start(app)
+
+    @app.cli.command('refresh-counters')
+    @click.option('--full', is_flag=True,
+                  help='Recount every venue and artist from scratch.')
+    def refresh_counters(full):
+        """Move shows that have started from upcoming to past."""
+        if full:
+            recount(db.session)
+            click.echo('Recounted every venue and artist.')
+        else:
+            click.echo(f'{advance(db.session)} shows moved to past.')
+        db.session.commit()
+
+    return scheduler
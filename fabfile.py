@@ -1,18 +1,36 @@
+import os
+
 from fabric.api import local, settings, abort
 from fabric.contrib.console import confirm
 
+# Route timings of the last accepted build, made by baseline().
+BASELINE = ".bench-baseline.json"
+
 # prepare for deployment
 
 
+def baseline():
+    local("python -m bench.routes --writes --save {}".format(BASELINE))
+
+
 def test():
     with settings(warn_only=True):
-        result = local(
-            "python test_tasks.py -v && python test_users.py -v", capture=True
-        )
+        result = local("python -m pytest -q", capture=True)
     if result.failed and not confirm("Tests failed. Continue?"):
         abort("Aborted at user request.")
 
 
+def bench():
+    # Fails when a route got slower or runs more queries than at baseline().
+    command = "python -m bench.routes --writes"
+    if os.path.exists(BASELINE):
+        command += " --compare {}".format(BASELINE)
+    with settings(warn_only=True):
+        result = local(command)
+    if result.failed and not confirm("Benchmarks failed. Continue?"):
+        abort("Aborted at user request.")
+
+
 def commit():
     message = raw_input("Enter a git commit message: ")
     local("git add . && git commit -am '{}'".format(message))
@@ -24,6 +42,7 @@ def push():
 
 def prepare():
     test()
+    bench()
     commit()
     push()
 
@@ -39,14 +58,14 @@ def heroku():
 
 
 def heroku_test():
-    local(
-        "heroku run python test_tasks.py -v && heroku run python test_users.py -v"
-    )
+    # Read-only pass over every route, checking that the deploy serves them.
+    local("heroku run python -m bench.routes --repeat 1")
 
 
 def deploy():
     pull()
     test()
+    bench()
     commit()
     heroku()
     heroku_test()
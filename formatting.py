@@ -0,0 +1,54 @@
+from functools import lru_cache
+
+#----------------------------------------------------------------------------#
+# Datetime filter.
+#----------------------------------------------------------------------------#
+
+PATTERNS = {
+    'full': "EEEE MMMM, d, y 'at' h:mma",
+    'medium': "EE MM, dd, y h:mma",
+}
+
+
+class DatetimeFilter:
+    """The `datetime` Jinja filter, cheap enough for thousands of shows.
+
+    The named patterns are compiled once, datetimes are formatted without a
+    round trip through strings, and results are kept in a bounded LRU keyed
+    on the value, so a page full of shows at the same few times formats
+    each time once. Strings are still accepted and parsed. Babel is only
+    imported when the filter is first used, or compile() is called.
+    """
+
+    def __init__(self, maxsize=4096, locale='en'):
+        self.locale_name = locale
+        self.locale = self.patterns = None
+        self._format = lru_cache(maxsize=maxsize)(self._format_uncached)
+
+    def __call__(self, value, format='medium'):
+        return self._format(value, format)
+
+    def compile(self):
+        from babel import Locale
+        from babel.dates import parse_pattern
+
+        self.locale = Locale.parse(self.locale_name)
+        self.patterns = {name: parse_pattern(pattern)
+                         for name, pattern in PATTERNS.items()}
+
+    def _format_uncached(self, value, format):
+        from babel.dates import UTC, parse_pattern
+
+        if self.patterns is None:
+            self.compile()
+        if isinstance(value, str):
+            import dateutil.parser
+            value = dateutil.parser.parse(value)
+        if value.tzinfo is None:
+            # Naive times are formatted as is, as babel would.
+            value = value.replace(tzinfo=UTC)
+        pattern = self.patterns.get(format) or parse_pattern(format)
+        return pattern.apply(value, self.locale)
+
+    def cache_info(self):
+        return self._format.cache_info()
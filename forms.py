@@ -1,10 +1,51 @@
-from datetime import datetime
+from datetime import datetime, timedelta
 from email import message
 
 from flask_wtf import Form
-from wtforms import (BooleanField, DateTimeField, SelectField,
-                     SelectMultipleField, StringField)
-from wtforms.validators import URL, AnyOf, DataRequired, Optional
+from wtforms import (BooleanField, DateField, DateTimeField, IntegerField,
+                     SelectField, SelectMultipleField, StringField)
+from wtforms.validators import (URL, AnyOf, DataRequired, Optional,
+                                ValidationError)
+
+from models import DEFAULT_SHOW_DURATION, MAX_SHOW_DURATION
+
+
+class DurationField(IntegerField):
+    # Entered in whole minutes; the data is a timedelta.
+
+    def process_data(self, value):
+        self.data = value
+
+    def process_formdata(self, valuelist):
+        if valuelist:
+            super().process_formdata(valuelist)
+            if self.data is not None:
+                try:
+                    self.data = timedelta(minutes=self.data)
+                except OverflowError:
+                    self.data = None
+                    raise ValueError(self.gettext('Not a valid duration.'))
+
+    def _value(self):
+        if self.raw_data:
+            return self.raw_data[0]
+        if self.data is not None:
+            return str(int(self.data.total_seconds() // 60))
+        return ''
+
+
+class DurationRange:
+    # Validates a DurationField, or a timedelta the importer parsed.
+
+    def __init__(self, max):
+        self.max = max
+
+    def __call__(self, form, field):
+        if field.data is not None and not (
+                timedelta(minutes=1) <= field.data <= self.max):
+            raise ValidationError(
+                'Duration must be between 1 and '
+                f'{int(self.max.total_seconds() // 60)} minutes.')
 
 
 class ShowForm(Form):
@@ -17,7 +58,14 @@ class ShowForm(Form):
     start_time = DateTimeField(
         'start_time',
         validators=[DataRequired()],
-        default=datetime.today()
+        # As the placeholder asks for it, or with seconds.
+        format=['%Y-%m-%d %H:%M:%S', '%Y-%m-%d %H:%M'],
+        default=datetime.today
+    )
+    duration = DurationField(
+        'duration',
+        validators=[Optional(), DurationRange(MAX_SHOW_DURATION)],
+        default=DEFAULT_SHOW_DURATION
     )
 
 
@@ -242,3 +290,47 @@ class ArtistForm(Form):
     seeking_description = StringField(
         'seeking_description'
     )
+
+
+class ShowFilterForm(Form):
+    # Filters of the show listing, read from the query string.
+    class Meta:
+        csrf = False
+
+    start = DateField(
+        'From', name='from', validators=[Optional()]
+    )
+    end = DateField(
+        'To', name='to', validators=[Optional()]
+    )
+    city = StringField(
+        'City', validators=[Optional()]
+    )
+    state = SelectField(
+        'State', validators=[Optional()],
+        choices=[('', 'Any state')] + ArtistForm.state.kwargs['choices']
+    )
+    genre = SelectField(
+        'Genre', validators=[Optional()],
+        choices=[('', 'Any genre')] + ArtistForm.genres.kwargs['choices']
+    )
+    venue_id = IntegerField(
+        'Venue ID', validators=[Optional()]
+    )
+    artist_id = IntegerField(
+        'Artist ID', validators=[Optional()]
+    )
+
+
+class CalendarForm(ShowFilterForm):
+    # The calendar covers a period rather than a from/to range.
+    start = None
+    end = None
+    period = SelectField(
+        'Period', validators=[Optional()], default='week',
+        choices=[('day', 'Day'), ('week', 'Week'), ('weekend', 'Weekend'),
+                 ('month', 'Month')]
+    )
+    date = DateField(
+        'Date', validators=[Optional()]
+    )
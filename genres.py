@@ -0,0 +1,78 @@
+import threading
+
+from sqlalchemy import event
+
+from models import Genre, db, dialect_insert
+
+#----------------------------------------------------------------------------#
+# Genre registry.
+#----------------------------------------------------------------------------#
+
+
+class GenreRegistry:
+    """Process-wide set of the genre names known to exist in the database.
+
+    The genre table is tiny and almost never changes, so it is read once and
+    then only grows. Names inserted by a session are held in session.info and
+    only join the set once that session commits, so a rolled back insert can
+    never be taken for an existing row.
+    """
+
+    def __init__(self):
+        self._known = None
+        self._lock = threading.Lock()
+
+    def known(self, session):
+        if self._known is None:
+            names = {name for (name,) in session.query(Genre.name)}
+            with self._lock:
+                if self._known is None:
+                    self._known = names
+        return self._known
+
+    def ensure(self, session, names):
+        # One INSERT ... ON CONFLICT DO NOTHING for every name not yet known;
+        # concurrent submissions adding the same genre no longer collide.
+        missing = [name for name in names if name not in self.known(session)]
+        if not missing:
+            return
+        insert = dialect_insert(session, Genre.__table__)
+        session.execute(insert.values([{'name': name} for name in missing])
+                        .on_conflict_do_nothing())
+        session.info.setdefault('new_genres', set()).update(missing)
+
+    def committed(self, session):
+        names = session.info.pop('new_genres', None)
+        if names and self._known is not None:
+            with self._lock:
+                self._known |= names
+
+    def rolled_back(self, session, previous_transaction):
+        session.info.pop('new_genres', None)
+
+    def clear(self):
+        with self._lock:
+            self._known = None
+
+
+registry = GenreRegistry()
+event.listen(db.session, 'after_commit', registry.committed)
+event.listen(db.session, 'after_soft_rollback', registry.rolled_back)
+
+
+def attach(junction, owner_id, names):
+    """Link owner_id to the named genres through junction in two statements.
+
+    Missing genres are created first, then every junction row goes in with a
+    single multi-row INSERT. Pending ORM changes are flushed beforehand, so a
+    cleared genres collection is deleted before the new rows are added.
+    """
+    names = list(dict.fromkeys(names))
+    if not names:
+        return
+    owner = next(column for column in junction.c if column.name != 'genre_name')
+
+    db.session.flush()
+    registry.ensure(db.session, names)
+    db.session.execute(junction.insert().values(
+        [{owner.name: owner_id, 'genre_name': name} for name in names]))
@@ -0,0 +1,20 @@
+import os
+import tempfile
+
+wsgi_app = 'wsgi:app'
+bind = f'0.0.0.0:{os.environ.get("PORT", 5000)}'
+workers = int(os.environ.get('WEB_CONCURRENCY', 4))
+
+# Load the app once in the master, building the shared caches there, and
+# fork the workers from it so they share those caches copy-on-write.
+preload_app = True
+os.environ.setdefault('PRELOAD', '1')
+
+# Workers share their metrics through this directory; start it empty.
+os.environ.setdefault('METRICS_DIR', os.path.join(
+    tempfile.gettempdir(), f'fyyur-metrics-{os.environ.get("PORT", 5000)}'))
+
+
+def on_starting(server):
+    from metrics import reset_directory
+    reset_directory(os.environ['METRICS_DIR'])
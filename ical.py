@@ -0,0 +1,74 @@
+from datetime import datetime, timezone
+
+#----------------------------------------------------------------------------#
+# iCalendar.
+#
+# Just enough of RFC 5545 to publish show listings as a subscribable
+# calendar. Start times are written as floating local times, the way the
+# app stores and shows them.
+#----------------------------------------------------------------------------#
+
+PRODID = '-//Fyyur//Shows//EN'
+
+
+def escape(text):
+    return (str(text).replace('\\', '\\\\').replace(';', '\\;')
+            .replace(',', '\\,').replace('\r\n', '\\n').replace('\n', '\\n'))
+
+
+def fold(line):
+    # Lines are at most 75 octets; continuations start with a space.
+    data = line.encode('utf-8')
+    if len(data) <= 75:
+        return line + '\r\n'
+    parts = []
+    limit = 75
+    while data:
+        cut = min(limit, len(data))
+        # Never split a UTF-8 sequence.
+        while cut < len(data) and data[cut] & 0xC0 == 0x80:
+            cut -= 1
+        parts.append(data[:cut].decode('utf-8'))
+        data = data[cut:]
+        limit = 74
+    return '\r\n '.join(parts) + '\r\n'
+
+
+def local_time(value):
+    return value.strftime('%Y%m%dT%H%M%S')
+
+
+def header(name):
+    lines = ['BEGIN:VCALENDAR', 'VERSION:2.0', f'PRODID:{PRODID}',
+             'CALSCALE:GREGORIAN', 'METHOD:PUBLISH',
+             f'X-WR-CALNAME:{escape(name)}']
+    return ''.join(fold(line) for line in lines)
+
+
+def footer():
+    return fold('END:VCALENDAR')
+
+
+def event(show, host, stamp):
+    """VEVENT of a row with the columns of schedule.FEED_COLUMNS."""
+    location = ', '.join(part for part in (show.venue_name, show.venue_address,
+                                           show.venue_city, show.venue_state)
+                         if part)
+    lines = ['BEGIN:VEVENT',
+             f'UID:show-{show.id}@{host}',
+             f'DTSTAMP:{stamp}',
+             f'DTSTART:{local_time(show.start_time)}',
+             f'DTEND:{local_time(show.start_time + show.duration)}',
+             f'SUMMARY:{escape(f"{show.artist_name} at {show.venue_name}")}',
+             f'LOCATION:{escape(location)}',
+             'END:VEVENT']
+    return ''.join(fold(line) for line in lines)
+
+
+def stream(name, partitions, host):
+    """Yield a calendar chunk by chunk, one chunk per partition of rows."""
+    stamp = datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%SZ')
+    yield header(name)
+    for rows in partitions:
+        yield ''.join(event(show, host, stamp) for show in rows)
+    yield footer()
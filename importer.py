@@ -0,0 +1,351 @@
+import csv
+import io
+import json
+import os
+import time
+from datetime import datetime, timedelta
+
+import click
+from wtforms import BooleanField, DateTimeField, SelectField, SelectMultipleField
+from wtforms.fields.core import UnboundField
+from wtforms.validators import DataRequired, StopValidation, ValidationError
+
+import typeahead
+from conditional import mark_written, page_name
+from counters import count_rows
+from forms import ArtistForm, DurationField, ShowForm, VenueForm
+from genres import registry
+from models import Artist, Genre, Show, Venue, artist_genre, db, venue_genre
+
+#----------------------------------------------------------------------------#
+# Row validation.
+#----------------------------------------------------------------------------#
+
+
+class RowField:
+    """Just enough of a WTForms field for the form validators to run on."""
+
+    def __init__(self, data):
+        self.data = data
+        self.raw_data = [] if data in (None, '') else [data]
+        self.errors = []
+
+    def gettext(self, string):
+        return string
+
+    def ngettext(self, singular, plural, n):
+        return singular if n == 1 else plural
+
+
+def parse_datetime(value):
+    if isinstance(value, datetime):
+        return value
+    try:
+        return datetime.strptime(value, '%Y-%m-%d %H:%M:%S')
+    except ValueError:
+        return datetime.fromisoformat(value)
+
+
+def parse_duration(value):
+    # Whole minutes, as the show form takes them.
+    if isinstance(value, timedelta):
+        return value
+    try:
+        return timedelta(minutes=int(value))
+    except OverflowError:
+        raise ValueError(f'{value} minutes is out of range')
+
+
+def parse_bool(value):
+    if isinstance(value, bool):
+        return value
+    return str(value).strip().lower() in ('y', 'yes', 'true', 't', '1', 'on')
+
+
+def parse_list(value):
+    if isinstance(value, list):
+        return value
+    return [item.strip() for item in (value or '').split(';') if item.strip()]
+
+
+def compile_rules(form_class):
+    """Turn a form class into a list of (name, coerce, choices, validators).
+
+    The validators and choices are read off the form's unbound fields, so
+    rows are held to exactly the rules of the HTML forms without building a
+    form object per row.
+    """
+    rules = []
+    for name in dir(form_class):
+        unbound = getattr(form_class, name)
+        if not isinstance(unbound, UnboundField):
+            continue
+        field_class = unbound.field_class
+        coerce = {BooleanField: parse_bool,
+                  DateTimeField: parse_datetime,
+                  DurationField: parse_duration,
+                  SelectMultipleField: parse_list}.get(field_class)
+        choices = unbound.kwargs.get('choices')
+        if issubclass(field_class, SelectField) and choices:
+            choices = {value for value, _ in choices}
+        else:
+            choices = None
+        rules.append((name, coerce, choices,
+                      unbound.kwargs.get('validators') or []))
+    return rules
+
+
+def validate(rules, row):
+    """Return the cleaned row and a list of error messages."""
+    cleaned, errors = {}, []
+    for name, coerce, choices, validators in rules:
+        value = row.get(name)
+        if isinstance(value, str):
+            value = value.strip()
+        try:
+            if coerce is parse_bool:
+                # An unchecked box is simply absent from a form submission.
+                value = parse_bool(value or '')
+            elif coerce and value not in (None, ''):
+                value = coerce(value)
+        except ValueError as e:
+            errors.append(f'{name}: {e}')
+            continue
+
+        field = RowField(value)
+        try:
+            for validator in validators:
+                validator(None, field)
+        except StopValidation as e:
+            if e.args and e.args[0]:
+                errors.append(f'{name}: {e.args[0]}')
+            continue
+        except ValidationError as e:
+            errors.append(f'{name}: {e.args[0]}')
+            continue
+
+        if choices and value not in (None, ''):
+            invalid = [item for item in (value if isinstance(value, list) else [value])
+                       if item not in choices]
+            if invalid:
+                errors.append(f'{name}: not a valid choice: {", ".join(invalid)}')
+                continue
+        cleaned[name] = value if value != '' else None
+    return cleaned, errors
+
+#----------------------------------------------------------------------------#
+# Kinds.
+#----------------------------------------------------------------------------#
+
+
+def require_id(row, cleaned, errors, name='id'):
+    try:
+        cleaned[name] = int(row[name])
+    except (KeyError, TypeError, ValueError):
+        errors.append(f'{name}: an integer id is required')
+
+
+class Kind:
+    def __init__(self, table, rules, junction=None, ids=()):
+        self.table = table
+        self.rules = rules
+        self.junction = junction
+        self.ids = ids
+
+    def clean(self, row):
+        cleaned, errors = validate(self.rules, row)
+        for name in self.ids:
+            require_id(row, cleaned, errors, name)
+        if 'id' not in self.ids and row.get('id') not in (None, ''):
+            require_id(row, cleaned, errors)
+        columns = self.table.c
+        genres = cleaned.pop('genres', None) or []
+        # Every row of a kind has a key per rule, and one for an id given
+        # beyond those; load() holds rows to the keys of the first. Blanks
+        # left out by Optional() take the model's default, if it has one.
+        values = {}
+        for key in dict.fromkeys([name for name, *_ in self.rules] +
+                                 list(cleaned)):
+            if key not in columns:
+                continue
+            value = cleaned.get(key)
+            default = columns[key].default
+            if value is None and default is not None and default.is_scalar:
+                value = default.arg
+            values[key] = value
+        return values, genres, errors
+
+
+KINDS = {
+    'genres': Kind(Genre.__table__, [('name', None, None, [DataRequired()])]),
+    'venues': Kind(Venue.__table__, compile_rules(VenueForm),
+                   venue_genre, ids=('id',)),
+    'artists': Kind(Artist.__table__, compile_rules(ArtistForm),
+                    artist_genre, ids=('id',)),
+    'shows': Kind(Show.__table__, compile_rules(ShowForm),
+                  ids=('venue_id', 'artist_id')),
+}
+
+#----------------------------------------------------------------------------#
+# Loading.
+#----------------------------------------------------------------------------#
+
+
+def read_rows(path):
+    # Stream dicts from a CSV file or from newline delimited JSON.
+    with open(path, newline='') as f:
+        if path.endswith(('.ndjson', '.jsonl')):
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+        else:
+            yield from csv.DictReader(f)
+
+
+def insert_rows(connection, table, rows):
+    if not rows:
+        return
+    if connection.dialect.name != 'postgresql':
+        connection.execute(table.insert(), rows)
+        return
+
+    # COPY is the fastest path into Postgres by a wide margin.
+    columns = list(rows[0])
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in rows:
+        writer.writerow(['\\N' if row[column] is None else row[column]
+                         for column in columns])
+    buffer.seek(0)
+    cursor = connection.connection.cursor()
+    cursor.copy_expert(
+        f'COPY "{table.name}" ({", ".join(columns)}) '
+        "FROM STDIN WITH (FORMAT csv, NULL '\\N')", buffer)
+
+
+def reset_sequence(connection, table):
+    if connection.dialect.name == 'postgresql' and 'id' in table.c:
+        connection.exec_driver_sql(
+            f"SELECT setval(pg_get_serial_sequence('{table.name}', 'id'), "
+            f'COALESCE((SELECT max(id) FROM "{table.name}"), 1))')
+
+
+def pages(table, rows):
+    # The venue and artist pages showing rows of table.
+    if table is Show.__table__:
+        return ({page_name('venue', row['venue_id']) for row in rows} |
+                {page_name('artist', row['artist_id']) for row in rows})
+    if table.name in ('venue', 'artist'):
+        return {page_name(table.name, row['id']) for row in rows}
+    return set()
+
+
+def write_checkpoint(path, state):
+    with open(path + '.tmp', 'w') as f:
+        json.dump(state, f)
+    os.replace(path + '.tmp', path)
+
+
+def load(kind_name, path, batch_size=5000, checkpoint=None, echo=click.echo):
+    """Stream path into the database, committing every batch_size rows.
+
+    After each commit the number of rows consumed is written to checkpoint,
+    so an interrupted load picks up where the last commit left off. Invalid
+    rows are reported and skipped, as are rows giving a column, such as id,
+    that the first row loaded does not, or the other way round. Returns
+    (loaded, rejected).
+    """
+    kind = KINDS[kind_name]
+    state = {'path': os.path.abspath(path), 'kind': kind_name, 'done': 0}
+    if checkpoint and os.path.exists(checkpoint):
+        with open(checkpoint) as f:
+            saved = json.load(f)
+        if (saved['path'], saved['kind']) == (state['path'], kind_name):
+            state = saved
+            echo(f'Resuming after row {state["done"]}')
+
+    loaded = rejected = 0
+    started = time.monotonic()
+    rows, links, genre_names = [], [], set()
+
+    def flush(done):
+        nonlocal loaded
+        if kind.table is Genre.__table__:
+            # Genres may already exist; the registry inserts only new ones.
+            genre_names.update(row['name'] for row in rows)
+        if genre_names:
+            registry.ensure(db.session, sorted(genre_names))
+        connection = db.session.connection()
+        if kind.table is not Genre.__table__:
+            insert_rows(connection, kind.table, rows)
+        if links:
+            insert_rows(connection, kind.junction, links)
+        if kind.table is Show.__table__:
+            count_rows(db.session, rows)
+        # COPY runs no statement the write hook sees.
+        mark_written(connection, [kind.table.name, *pages(kind.table, rows)])
+        if kind.table.name in typeahead.LABELS:
+            typeahead.changed(connection)
+        db.session.commit()
+
+        loaded += len(rows)
+        state['done'] = done
+        if checkpoint:
+            write_checkpoint(checkpoint, state)
+        elapsed = time.monotonic() - started
+        echo(f'{kind_name}: {done} rows read, {loaded} loaded, '
+             f'{rejected} rejected ({loaded / max(elapsed, 1e-9):,.0f} rows/s)')
+        rows.clear()
+        links.clear()
+        genre_names.clear()
+
+    number = 0
+    for number, row in enumerate(read_rows(path), start=1):
+        if number <= state['done']:
+            continue
+        cleaned, genres, errors = kind.clean(row)
+        if not errors:
+            # Batches are inserted with the columns of their first row.
+            columns = state.setdefault('columns', sorted(cleaned))
+            errors = [f'{name}: given on some rows only' for name in
+                      sorted(set(columns).symmetric_difference(cleaned))]
+        if errors:
+            rejected += 1
+            echo(f'row {number}: ' + '; '.join(errors), err=True)
+            continue
+        rows.append(cleaned)
+        if kind.junction is not None:
+            owner = next(column.name for column in kind.junction.c
+                         if column.name != 'genre_name')
+            links.extend({owner: cleaned['id'], 'genre_name': genre}
+                         for genre in dict.fromkeys(genres))
+            genre_names.update(genres)
+        if len(rows) >= batch_size:
+            flush(number)
+
+    if rows or number > state['done']:
+        flush(number)
+    reset_sequence(db.session.connection(), kind.table)
+    db.session.commit()
+    return loaded, rejected
+
+
+def register(app):
+    @app.cli.command('import')
+    @click.argument('kind', type=click.Choice(sorted(KINDS)))
+    @click.argument('path', type=click.Path(exists=True, dir_okay=False))
+    @click.option('--batch-size', default=5000, show_default=True,
+                  help='Rows committed per transaction.')
+    @click.option('--checkpoint', type=click.Path(dir_okay=False),
+                  help='File recording progress, used to resume a load.')
+    def import_command(kind, path, batch_size, checkpoint):
+        """Bulk load a CSV or NDJSON file of KIND into the database.
+
+        Venue and artist rows need an integer id, and list their genres
+        separated by semicolons. Show rows reference venue_id and artist_id.
+        Load genres, venues and artists before shows. Running workers pick up
+        new listings in their typeahead index within
+        TYPEAHEAD_REFRESH_INTERVAL seconds.
+        """
+        loaded, rejected = load(kind, path, batch_size, checkpoint)
+        click.echo(f'Done: {loaded} loaded, {rejected} rejected.')
@@ -0,0 +1,126 @@
+import re
+import time
+from collections import Counter
+
+from flask import current_app, g, has_request_context, request
+from sqlalchemy import event
+
+#----------------------------------------------------------------------------#
+# Per-request SQL instrumentation.
+#----------------------------------------------------------------------------#
+
+IN_LIST = re.compile(r'\bIN \((?:[^()]|\([^()]*\))*\)', re.IGNORECASE)
+WHITESPACE = re.compile(r'\s+')
+
+
+def shape(statement):
+    # Statements differing only in their parameters, including the length of
+    # an expanded IN list, share a shape.
+    return WHITESPACE.sub(' ', IN_LIST.sub('IN (...)', statement)).strip()
+
+
+class RequestStats:
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        self.slowest = (0.0, None)
+        self.shapes = Counter()
+
+    def record(self, statement, seconds):
+        self.count += 1
+        self.seconds += seconds
+        if seconds >= self.slowest[0]:
+            self.slowest = (seconds, statement)
+        self.shapes[shape(statement)] += 1
+
+    def repeated(self, threshold):
+        return [(statement, count) for statement, count
+                in self.shapes.most_common() if count > threshold]
+
+
+def before_cursor_execute(conn, cursor, statement, parameters, context,
+                          executemany):
+    conn.info.setdefault('query_started', []).append(time.perf_counter())
+
+
+def after_cursor_execute(conn, cursor, statement, parameters, context,
+                         executemany):
+    seconds = time.perf_counter() - conn.info['query_started'].pop()
+    if not has_request_context():
+        return
+    stats = g.get('sql_stats')
+    if stats is None:
+        stats = g.sql_stats = RequestStats()
+    stats.record(statement, seconds)
+
+
+def handle_error(context):
+    # A failed statement never reaches after_cursor_execute.
+    if context.connection is not None:
+        started = context.connection.info.get('query_started')
+        if started:
+            started.pop()
+
+
+def one_line(statement, length=200):
+    statement = WHITESPACE.sub(' ', statement).strip()
+    return statement if len(statement) <= length else statement[:length - 3] + '...'
+
+
+def request_stats():
+    # The RequestStats of the current request, if it ran any SQL.
+    return g.get('sql_stats')
+
+
+def discard(exception):
+    g.pop('sql_stats', None)
+
+
+def report(response):
+    """Warn about repeated statements, then report the request's SQL.
+
+    Debug responses carry the figures in headers (and Server-Timing, for
+    the browser's developer tools); otherwise they are logged.
+    """
+    stats = request_stats()
+    if stats is None:
+        return response
+    logger = current_app.logger
+    where = f'{request.method} {request.full_path.rstrip("?")}'
+
+    for statement, count in stats.repeated(
+            current_app.config['SQL_REPEAT_THRESHOLD']):
+        logger.warning('Possible N+1 in %s: %d x %s',
+                       where, count, one_line(statement))
+
+    total_ms = stats.seconds * 1000
+    slowest_ms, slowest = stats.slowest[0] * 1000, stats.slowest[1]
+    if current_app.debug:
+        response.headers['X-DB-Queries'] = str(stats.count)
+        response.headers['X-DB-Time'] = f'{total_ms:.2f}'
+        response.headers['X-DB-Slowest'] = f'{slowest_ms:.2f}'
+        response.headers['X-DB-Slowest-Statement'] = one_line(slowest).encode(
+            'latin-1', 'replace').decode('latin-1')
+        repeated = stats.shapes.most_common(1)[0][1]
+        response.headers['X-DB-Max-Repeats'] = str(repeated)
+        response.headers.add('Server-Timing',
+                             f'db;dur={total_ms:.2f};desc="{stats.count} queries"')
+    else:
+        logger.info('%s: %d queries, %.1f ms in the database, slowest %.1f ms: %s',
+                    where, stats.count, total_ms, slowest_ms, one_line(slowest))
+    return response
+
+
+def listen(engine):
+    # Also used for the async engine, through its sync_engine.
+    event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+    event.listen(engine, 'after_cursor_execute', after_cursor_execute)
+    event.listen(engine, 'handle_error', handle_error)
+
+
+def register(app, db):
+    if not app.config['SQL_INSTRUMENTATION']:
+        return
+    listen(db.get_engine(app))
+    app.after_request(report)
+    app.teardown_request(discard)
@@ -0,0 +1,308 @@
+import atexit
+import glob
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+
+from flask import Response, g, request
+from flask.signals import (before_render_template, signals_available,
+                           template_rendered)
+
+from instrumentation import request_stats
+
+#----------------------------------------------------------------------------#
+# Metrics.
+#
+# Each worker process keeps its metrics in memory under one lock. With
+# METRICS_DIR set, workers also write snapshots of them there, named by pid,
+# every METRICS_FLUSH_INTERVAL seconds and as they exit, and /metrics adds
+# up the snapshots of every worker, so a scrape answered by any one worker
+# covers them all.
+#----------------------------------------------------------------------------#
+
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+METRICS = {
+    'fyyur_requests_total':
+        ('counter', 'Requests handled, by endpoint, method and status.'),
+    'fyyur_request_duration_seconds':
+        ('histogram', 'Time to build the response, by endpoint.'),
+    'fyyur_requests_in_flight':
+        ('gauge', 'Requests being handled.'),
+    'fyyur_template_render_seconds':
+        ('histogram', 'Time to render a template, by template.'),
+    'fyyur_db_seconds':
+        ('histogram', 'Time spent running SQL per request, by endpoint.'),
+}
+
+
+class Registry:
+    def __init__(self, directory=None, flush_interval=5.0):
+        self.directory = directory
+        self.flush_interval = flush_interval
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._histograms = {}
+        self._in_flight = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def inc(self, name, labels, value=1):
+        key = (name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name, labels, value):
+        # Bucket counts are kept per bucket and made cumulative on export.
+        key = (name, labels)
+        index = bisect_left(BUCKETS, value)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = [0] * len(BUCKETS) + [0, 0.0]
+            histogram[index] += 1
+            histogram[-1] += value
+
+    def enter(self):
+        with self._lock:
+            self._in_flight += 1
+
+    def leave(self):
+        with self._lock:
+            self._in_flight -= 1
+
+    def snapshot(self):
+        with self._lock:
+            return {'pid': os.getpid(),
+                    'counters': [[name, labels, value]
+                                 for (name, labels), value
+                                 in self._counters.items()],
+                    'histograms': [[name, labels, list(values)]
+                                   for (name, labels), values
+                                   in self._histograms.items()],
+                    'in_flight': self._in_flight}
+
+    def path(self, pid):
+        return os.path.join(self.directory, f'metrics-{pid}.json')
+
+    def flush(self):
+        # Readers always see a complete file.
+        if not self.directory:
+            return
+        snapshot = self.snapshot()
+        path = self.path(snapshot['pid'])
+        temporary = f'{path}.{threading.get_ident()}.tmp'
+        with open(temporary, 'w') as f:
+            json.dump(snapshot, f)
+        os.replace(temporary, path)
+
+    def start(self):
+        """Write snapshots from a daemon thread, and once more at exit.
+
+        Called in each worker after it is forked, so an idle worker's last
+        requests still reach the other workers' scrapes.
+        """
+        if not self.directory or self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run,
+                                        name='metrics-flush', daemon=True)
+        self._thread.start()
+        atexit.register(self.flush)
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.flush()
+
+    def _run(self):
+        while not self._stop.wait(self.flush_interval):
+            self.flush()
+
+    def snapshots(self):
+        # This worker's live figures plus the last snapshot of every other.
+        # Counters of exited workers still count; their in-flight requests
+        # do not.
+        own = self.snapshot()
+        if not self.directory:
+            return [own]
+        snapshots = [own]
+        for path in glob.glob(os.path.join(self.directory, 'metrics-*.json')):
+            try:
+                with open(path) as f:
+                    snapshot = json.load(f)
+            except (OSError, ValueError):
+                continue
+            if snapshot['pid'] == own['pid']:
+                continue
+            if not alive(snapshot['pid']):
+                snapshot['in_flight'] = 0
+            snapshots.append(snapshot)
+        return snapshots
+
+    def exposition(self):
+        """All workers' metrics in the Prometheus text format."""
+        counters, histograms, in_flight = {}, {}, 0
+        for snapshot in self.snapshots():
+            for name, labels, value in snapshot['counters']:
+                key = (name, tuple(map(tuple, labels)))
+                counters[key] = counters.get(key, 0) + value
+            for name, labels, values in snapshot['histograms']:
+                key = (name, tuple(map(tuple, labels)))
+                merged = histograms.setdefault(key, [0] * len(values))
+                for index, value in enumerate(values):
+                    merged[index] += value
+            in_flight += snapshot['in_flight']
+
+        lines = []
+        for name, (kind, text) in METRICS.items():
+            lines += [f'# HELP {name} {text}', f'# TYPE {name} {kind}']
+            if kind == 'gauge':
+                lines.append(f'{name} {in_flight}')
+            for (metric, labels), value in sorted(counters.items()):
+                if metric == name:
+                    lines.append(f'{name}{format_labels(labels)} {value}')
+            for (metric, labels), values in sorted(histograms.items()):
+                if metric != name:
+                    continue
+                cumulative = 0
+                for bound, count in zip(BUCKETS + ('+Inf',), values):
+                    cumulative += count
+                    bucket = labels + (('le', str(bound)),)
+                    lines.append(f'{name}_bucket{format_labels(bucket)} {cumulative}')
+                lines.append(f'{name}_sum{format_labels(labels)} {values[-1]}')
+                lines.append(f'{name}_count{format_labels(labels)} {cumulative}')
+        return '\n'.join(lines) + '\n'
+
+
+def alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{key}="{escape(value)}"' for key, value in labels) + '}'
+
+
+def reset_directory(directory):
+    # For the process manager to call before starting workers, so a fresh
+    # deployment starts its counters from zero.
+    os.makedirs(directory, exist_ok=True)
+    for path in glob.glob(os.path.join(directory, 'metrics-*.json*')):
+        os.remove(path)
+
+#----------------------------------------------------------------------------#
+# Request hooks.
+#----------------------------------------------------------------------------#
+
+
+def endpoint_label():
+    # Unmatched URLs share one label, so scanners cannot blow up the series.
+    return request.endpoint or 'unmatched'
+
+
+def register(app):
+    if not app.config['METRICS_ENABLED']:
+        return None
+
+    registry = Registry(app.config['METRICS_DIR'],
+                        app.config['METRICS_FLUSH_INTERVAL'])
+    if registry.directory:
+        os.makedirs(registry.directory, exist_ok=True)
+
+    @app.before_first_request
+    def start_flushing():
+        registry.start()
+
+    @app.before_request
+    def start_timer():
+        g.metrics_started = time.perf_counter()
+        registry.enter()
+
+    def record(endpoint, method, status, seconds, stats):
+        registry.inc('fyyur_requests_total',
+                     (('endpoint', endpoint), ('method', method),
+                      ('status', str(status))))
+        registry.observe('fyyur_request_duration_seconds',
+                         (('endpoint', endpoint),), seconds)
+        if stats is not None:
+            registry.observe('fyyur_db_seconds', (('endpoint', endpoint),),
+                             stats.seconds)
+
+    @app.after_request
+    def record_response(response):
+        started = g.get('metrics_started')
+        if started is None:
+            return response
+        g.metrics_recorded = True
+        if not response.is_streamed:
+            record(endpoint_label(), request.method, response.status_code,
+                   time.perf_counter() - started, request_stats())
+            return response
+
+        # A streamed body is made while it is sent, so the request is timed,
+        # and leaves the in-flight gauge, when the server closes it. Its SQL
+        # figures are taken at teardown, which stream_with_context holds
+        # back until the body is done.
+        stream = g.metrics_stream = {'stats': None}
+        endpoint, method = endpoint_label(), request.method
+        status = response.status_code
+
+        def close():
+            record(endpoint, method, status, time.perf_counter() - started,
+                   stream['stats'])
+            registry.leave()
+
+        response.call_on_close(close)
+        return response
+
+    @app.teardown_request
+    def finish(exception):
+        started = g.pop('metrics_started', None)
+        if started is None:
+            return
+        stream = g.pop('metrics_stream', None)
+        if stream is not None:
+            stream['stats'] = request_stats()
+            return
+        if not g.pop('metrics_recorded', False):
+            # The request failed before a response was made.
+            record(endpoint_label(), request.method, 500,
+                   time.perf_counter() - started, request_stats())
+        registry.leave()
+
+    if signals_available:
+        def render_started(sender, template, context, **extra):
+            g.setdefault('render_started', []).append(time.perf_counter())
+
+        def render_finished(sender, template, context, **extra):
+            started = g.get('render_started')
+            if started:
+                registry.observe('fyyur_template_render_seconds',
+                                 (('template', template.name or '<string>'),),
+                                 time.perf_counter() - started.pop())
+
+        before_render_template.connect(render_started, app, weak=False)
+        template_rendered.connect(render_finished, app, weak=False)
+
+    @app.route('/metrics')
+    def metrics():
+        registry.flush()
+        return Response(registry.exposition(),
+                        mimetype='text/plain; version=0.0.4')
+
+    return registry
@@ -0,0 +1,40 @@
+"""show access path indexes
+
+Revision ID: 1f620b6d9b92
+Revises: e588bbc4963c
+Create Date: 2026-10-18 10:41:07.557302
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '1f620b6d9b92'
+down_revision = 'e588bbc4963c'
+branch_labels = None
+depends_on = None
+
+# Every hot show query filters on venue or artist and compares start_time;
+# the listing sorts and pages on (start_time, id).
+INDEXES = [
+    ('ix_show_venue_id_start_time', ['venue_id', 'start_time']),
+    ('ix_show_artist_id_start_time', ['artist_id', 'start_time']),
+    ('ix_show_start_time', ['start_time', 'id']),
+]
+
+
+def upgrade():
+    # CONCURRENTLY cannot run inside a transaction. If a build fails it
+    # leaves an INVALID index behind, which must be dropped before retrying.
+    with op.get_context().autocommit_block():
+        for name, columns in INDEXES:
+            op.create_index(name, 'show', columns,
+                            postgresql_concurrently=True)
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        for name, _ in reversed(INDEXES):
+            op.drop_index(name, table_name='show',
+                          postgresql_concurrently=True)
@@ -0,0 +1,30 @@
+"""data version counters
+
+Revision ID: 3dcbf0ed1674
+Revises: 1f620b6d9b92
+Create Date: 2026-10-18 11:26:44.903518
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3dcbf0ed1674'
+down_revision = '1f620b6d9b92'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Rows are created by the first write to each table.
+    op.create_table('data_version',
+    sa.Column('table_name', sa.String(length=64), nullable=False),
+    sa.Column('version', sa.BigInteger(), nullable=False),
+    sa.Column('updated_at', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('table_name')
+    )
+
+
+def downgrade():
+    op.drop_table('data_version')
@@ -0,0 +1,54 @@
+"""precomputed show counters
+
+Revision ID: 9a41c3e07b25
+Revises: 3dcbf0ed1674
+Create Date: 2026-10-18 13:02:17.440129
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9a41c3e07b25'
+down_revision = '3dcbf0ed1674'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    for table in ('venue', 'artist'):
+        op.add_column(table, sa.Column('num_upcoming_shows', sa.Integer(),
+                                       server_default='0', nullable=False))
+        op.add_column(table, sa.Column('num_past_shows', sa.Integer(),
+                                       server_default='0', nullable=False))
+    op.create_table('counter_watermark',
+    sa.Column('name', sa.String(length=64), nullable=False),
+    sa.Column('counted_until', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('name')
+    )
+
+    # Backfill against a single watermark so every show lands in one counter.
+    op.execute("INSERT INTO counter_watermark (name, counted_until) "
+               "VALUES ('show', LOCALTIMESTAMP)")
+    for table in ('venue', 'artist'):
+        op.execute(f"""
+            UPDATE {table} SET
+                num_upcoming_shows = (
+                    SELECT count(*) FROM show
+                    WHERE show.{table}_id = {table}.id
+                      AND show.start_time > (SELECT counted_until
+                                             FROM counter_watermark)),
+                num_past_shows = (
+                    SELECT count(*) FROM show
+                    WHERE show.{table}_id = {table}.id
+                      AND show.start_time <= (SELECT counted_until
+                                              FROM counter_watermark))
+        """)
+
+
+def downgrade():
+    op.drop_table('counter_watermark')
+    for table in ('artist', 'venue'):
+        op.drop_column(table, 'num_past_shows')
+        op.drop_column(table, 'num_upcoming_shows')
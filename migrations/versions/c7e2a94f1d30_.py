@@ -0,0 +1,26 @@
+"""venue city index
+
+Revision ID: c7e2a94f1d30
+Revises: 9a41c3e07b25
+Create Date: 2026-10-18 16:41:09.302716
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c7e2a94f1d30'
+down_revision = '9a41c3e07b25'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # The show listing filters on city without state, which
+    # ix_venue_area_name (state, city, ...) cannot serve.
+    op.create_index('ix_venue_city', 'venue', ['city'])
+
+
+def downgrade():
+    op.drop_index('ix_venue_city', table_name='venue')
@@ -0,0 +1,41 @@
+"""trigram search indexes
+
+Revision ID: db63c46d4812
+Revises: 4c6665057a37
+Create Date: 2026-10-18 09:12:31.402117
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'db63c46d4812'
+down_revision = '4c6665057a37'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # pg_trgm lets GIN indexes serve ILIKE '%term%' and similarity() ranking.
+    op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm;')
+
+    for table in ('venue', 'artist'):
+        for column in ('name', 'city', 'state'):
+            op.create_index(f'ix_{table}_{column}_trgm', table, [column],
+                            postgresql_using='gin',
+                            postgresql_ops={column: 'gin_trgm_ops'})
+
+    op.create_index('ix_venue_genre_genre_name', 'venue_genre',
+                    ['genre_name', 'venue_id'])
+    op.create_index('ix_artist_genre_genre_name', 'artist_genre',
+                    ['genre_name', 'artist_id'])
+
+
+def downgrade():
+    op.drop_index('ix_artist_genre_genre_name', table_name='artist_genre')
+    op.drop_index('ix_venue_genre_genre_name', table_name='venue_genre')
+
+    for table in ('venue', 'artist'):
+        for column in ('name', 'city', 'state'):
+            op.drop_index(f'ix_{table}_{column}_trgm', table_name=table)
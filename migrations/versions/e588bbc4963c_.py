@@ -0,0 +1,28 @@
+"""listing sort key indexes
+
+Revision ID: e588bbc4963c
+Revises: db63c46d4812
+Create Date: 2026-10-18 10:03:52.118940
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e588bbc4963c'
+down_revision = 'db63c46d4812'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Keyset pagination walks these in order, one page at a time.
+    op.create_index('ix_venue_area_name', 'venue',
+                    ['state', 'city', 'name', 'id'])
+    op.create_index('ix_artist_name', 'artist', ['name', 'id'])
+
+
+def downgrade():
+    op.drop_index('ix_artist_name', table_name='artist')
+    op.drop_index('ix_venue_area_name', table_name='venue')
@@ -0,0 +1,59 @@
+"""show duration and double booking constraints
+
+Revision ID: f3b8d1c6a572
+Revises: c7e2a94f1d30
+Create Date: 2026-10-18 18:27:45.611384
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f3b8d1c6a572'
+down_revision = 'c7e2a94f1d30'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Existing shows, and rows written without one, last two hours.
+    op.add_column('show', sa.Column('duration', sa.Interval(),
+                                    server_default=sa.text("'2 hours'"),
+                                    nullable=False))
+    op.create_check_constraint(
+        'ck_show_duration', 'show',
+        "duration > interval '0' AND duration <= interval '43200 seconds'")
+
+    # Shows already booked over each other would fail the constraints;
+    # list them rather than drop any. Each show is checked against those
+    # starting after it and before its end, from the (id, start_time)
+    # indexes.
+    connection = op.get_bind()
+    for owner in ('venue_id', 'artist_id'):
+        overlapping = connection.execute(sa.text(f"""
+            SELECT a.id, b.id FROM show a JOIN show b
+              ON b.{owner} = a.{owner}
+             AND (b.start_time, b.id) > (a.start_time, a.id)
+             AND b.start_time < a.start_time + a.duration
+            LIMIT 20
+        """)).all()
+        if overlapping:
+            pairs = ', '.join(f'{a}/{b}' for a, b in overlapping)
+            raise RuntimeError(
+                f'Shows overlapping at the same {owner[:-3]} must be '
+                f'rescheduled or deleted first: {pairs}')
+
+    # btree_gist supplies the integer equality of the exclusion constraints.
+    op.execute('CREATE EXTENSION IF NOT EXISTS btree_gist;')
+    for owner in ('venue_id', 'artist_id'):
+        op.execute(f'ALTER TABLE show ADD CONSTRAINT ex_show_{owner}_overlap '
+                   f'EXCLUDE USING gist ({owner} WITH =, '
+                   f'tsrange(start_time, start_time + duration) WITH &&)')
+
+
+def downgrade():
+    for owner in ('artist_id', 'venue_id'):
+        op.drop_constraint(f'ex_show_{owner}_overlap', 'show')
+    op.drop_constraint('ck_show_duration', 'show')
+    op.drop_column('show', 'duration')
@@ -1,4 +1,9 @@
+from datetime import datetime, timedelta
+
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import DDL, event
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.engine import Connection
 
 db = SQLAlchemy()
 
@@ -7,16 +12,39 @@ db = SQLAlchemy()
 #----------------------------------------------------------------------------#
 
 
+def dialect_insert(session, table):
+    # INSERT construct supporting ON CONFLICT for the database of a session
+    # or a connection.
+    dialects = {'postgresql': postgresql.insert, 'sqlite': sqlite.insert}
+    bind = session if isinstance(session, Connection) else session.bind
+    return dialects[bind.dialect.name](table)
+
+
+def trigram_index(table, column):
+    # GIN trigram index backing ILIKE '%term%' search on Postgres.
+    return db.Index(f'ix_{table}_{column}_trgm', column,
+                    postgresql_using='gin',
+                    postgresql_ops={column: 'gin_trgm_ops'})
+
+
 venue_genre = db.Table('venue_genre',
                        db.Column('venue_id', db.Integer,
                                  db.ForeignKey('venue.id'), primary_key=True),
                        db.Column('genre_name', db.String(120),
-                                 db.ForeignKey('genre.name'), primary_key=True)
+                                 db.ForeignKey('genre.name'), primary_key=True),
+                       db.Index('ix_venue_genre_genre_name',
+                                'genre_name', 'venue_id')
                        )
 
 
 class Venue(db.Model):
     __tablename__ = 'venue'
+    __table_args__ = (trigram_index('venue', 'name'),
+                      trigram_index('venue', 'city'),
+                      trigram_index('venue', 'state'),
+                      db.Index('ix_venue_area_name',
+                               'state', 'city', 'name', 'id'),
+                      db.Index('ix_venue_city', 'city'))
 
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String, nullable=False)
@@ -31,6 +59,11 @@ class Venue(db.Model):
     website_link = db.Column(db.String(120), nullable=True)
     seeking_talent = db.Column(db.Boolean, default=False)
     seeking_description = db.Column(db.String(500))
+    # Maintained by counters.py rather than counted per request.
+    num_upcoming_shows = db.Column(db.Integer, nullable=False, default=0,
+                                   server_default='0')
+    num_past_shows = db.Column(db.Integer, nullable=False, default=0,
+                               server_default='0')
 
     shows = db.relationship('Show', backref='venue', lazy='dynamic')
 
@@ -42,12 +75,18 @@ artist_genre = db.Table('artist_genre',
                         db.Column('artist_id', db.Integer,
                                   db.ForeignKey('artist.id'), primary_key=True),
                         db.Column('genre_name', db.String(120),
-                                  db.ForeignKey('genre.name'), primary_key=True)
+                                  db.ForeignKey('genre.name'), primary_key=True),
+                        db.Index('ix_artist_genre_genre_name',
+                                 'genre_name', 'artist_id')
                         )
 
 
 class Artist(db.Model):
     __tablename__ = 'artist'
+    __table_args__ = (trigram_index('artist', 'name'),
+                      trigram_index('artist', 'city'),
+                      trigram_index('artist', 'state'),
+                      db.Index('ix_artist_name', 'name', 'id'))
 
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String, nullable=False)
@@ -61,6 +100,11 @@ class Artist(db.Model):
     website_link = db.Column(db.String(120), nullable=True)
     seeking_venue = db.Column(db.Boolean, nullable=False, default=False)
     seeking_description = db.Column(db.String(500))
+    # Maintained by counters.py rather than counted per request.
+    num_upcoming_shows = db.Column(db.Integer, nullable=False, default=0,
+                                   server_default='0')
+    num_past_shows = db.Column(db.Integer, nullable=False, default=0,
+                               server_default='0')
 
     shows = db.relationship('Show', backref='artist', lazy='dynamic')
 
@@ -68,8 +112,18 @@ class Artist(db.Model):
         return f'{self.id}: {self.name}'
 
 
+# Length of a show booked without one, and the longest a show may run.
+DEFAULT_SHOW_DURATION = timedelta(hours=2)
+MAX_SHOW_DURATION = timedelta(hours=12)
+
+
 class Show(db.Model):
     __tablename__ = 'show'
+    __table_args__ = (db.Index('ix_show_venue_id_start_time',
+                               'venue_id', 'start_time'),
+                      db.Index('ix_show_artist_id_start_time',
+                               'artist_id', 'start_time'),
+                      db.Index('ix_show_start_time', 'start_time', 'id'))
 
     id = db.Column(db.Integer, primary_key=True)
     venue_id = db.Column(db.Integer, db.ForeignKey('venue.id'),
@@ -77,6 +131,28 @@ class Show(db.Model):
     artist_id = db.Column(db.Integer, db.ForeignKey('artist.id'),
                           nullable=False)
     start_time = db.Column(db.DateTime(), nullable=False)
+    duration = db.Column(db.Interval(), nullable=False,
+                         default=DEFAULT_SHOW_DURATION,
+                         server_default=db.text("'2 hours'"))
+
+
+# Postgres refuses a show overlapping another of its venue or its artist.
+# The exclusion constraints need btree_gist for the id equality. A show
+# lasts at most MAX_SHOW_DURATION, so schedule.conflicts finds the shows a
+# booking overlaps with a bounded scan of the (id, start_time) indexes.
+event.listen(Show.__table__, 'before_create', DDL(
+    'CREATE EXTENSION IF NOT EXISTS btree_gist').execute_if(
+        dialect='postgresql'))
+event.listen(Show.__table__, 'after_create', DDL(
+    "ALTER TABLE show ADD CONSTRAINT ck_show_duration CHECK ("
+    "duration > interval '0' AND duration <= interval '%d seconds')"
+    % MAX_SHOW_DURATION.total_seconds()).execute_if(dialect='postgresql'))
+for owner in ('venue_id', 'artist_id'):
+    event.listen(Show.__table__, 'after_create', DDL(
+        f'ALTER TABLE show ADD CONSTRAINT ex_show_{owner}_overlap '
+        f'EXCLUDE USING gist ({owner} WITH =, '
+        f'tsrange(start_time, start_time + duration) WITH &&)'
+    ).execute_if(dialect='postgresql'))
 
 
 class Genre(db.Model):
@@ -86,3 +162,27 @@ class Genre(db.Model):
 
     def __repr__(self):
         return f'{self.name}'
+
+
+class DataVersion(db.Model):
+    # Change counter per table, or per venue or artist page, bumped by every
+    # commit writing to it.
+    __tablename__ = 'data_version'
+
+    table_name = db.Column(db.String(64), primary_key=True)
+    version = db.Column(db.BigInteger, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime(), nullable=False, default=datetime.now)
+
+    def __repr__(self):
+        return f'{self.table_name}: {self.version}'
+
+
+class CounterWatermark(db.Model):
+    # Shows starting after counted_until are counted as upcoming.
+    __tablename__ = 'counter_watermark'
+
+    name = db.Column(db.String(64), primary_key=True)
+    counted_until = db.Column(db.DateTime(), nullable=False)
+
+    def __repr__(self):
+        return f'{self.name}: {self.counted_until}'
@@ -0,0 +1,73 @@
+import base64
+import json
+from collections import namedtuple
+from datetime import datetime
+
+from sqlalchemy import tuple_
+
+#----------------------------------------------------------------------------#
+# Keyset pagination.
+#----------------------------------------------------------------------------#
+
+Page = namedtuple('Page', ['items', 'next', 'prev'])
+
+
+def encode_cursor(values):
+    values = [value.isoformat() if isinstance(value, datetime) else value
+              for value in values]
+    return base64.urlsafe_b64encode(
+        json.dumps(values, separators=(',', ':')).encode()).decode()
+
+
+def decode_cursor(cursor, columns):
+    values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    if len(values) != len(columns):
+        raise ValueError('cursor does not match the sort key')
+    return [datetime.fromisoformat(value)
+            if column.type.python_type is datetime else value
+            for column, value in zip(columns, values)]
+
+
+def paginate(query, columns, after=None, before=None, per_page=50,
+             fetch=lambda query: query.all()):
+    """Fetch one page of query, ordered by the unique sort key columns.
+
+    Pages are addressed by opaque cursors holding the sort key of the row
+    they start after (or end before), so every page is an index range scan
+    of per_page + 1 rows however deep it is. Rows must expose each sort
+    column under its key. query may be an ORM Query or a Core select, in
+    which case fetch executes it.
+    """
+    rows = fetch(page_query(query, columns, after, before, per_page))
+    return make_page(rows, columns, after, before, per_page)
+
+
+def page_query(query, columns, after=None, before=None, per_page=50):
+    # The query for the page; paginate() in two halves, for callers that
+    # fetch the rows themselves.
+    if before:
+        values = decode_cursor(before, columns)
+        return query.filter(tuple_(*columns) < tuple_(*values)).order_by(
+            *[column.desc() for column in columns]).limit(per_page + 1)
+    if after:
+        values = decode_cursor(after, columns)
+        query = query.filter(tuple_(*columns) > tuple_(*values))
+    return query.order_by(*columns).limit(per_page + 1)
+
+
+def make_page(rows, columns, after=None, before=None, per_page=50):
+    # The Page of the rows fetched by page_query().
+    def cursor_for(row):
+        return encode_cursor([getattr(row, column.key) for column in columns])
+
+    more = len(rows) > per_page
+    if before:
+        rows = rows[:per_page][::-1]
+        return Page(rows,
+                    cursor_for(rows[-1]) if rows else None,
+                    cursor_for(rows[0]) if rows and more else None)
+
+    rows = rows[:per_page]
+    return Page(rows,
+                cursor_for(rows[-1]) if rows and more else None,
+                cursor_for(rows[0]) if rows and after else None)
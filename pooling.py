@@ -0,0 +1,170 @@
+import threading
+import time
+
+from sqlalchemy import event, exc
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+
+#----------------------------------------------------------------------------#
+# Connection pool.
+#----------------------------------------------------------------------------#
+
+
+class TimedQueuePool(QueuePool):
+    """QueuePool that records how long checkouts wait for a connection."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._lock = threading.Lock()
+        self.checkouts = self.timeouts = 0
+        self.wait_total = self.wait_max = 0.0
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        except exc.TimeoutError:
+            with self._lock:
+                self.timeouts += 1
+            raise
+        finally:
+            waited = time.perf_counter() - started
+            with self._lock:
+                self.checkouts += 1
+                self.wait_total += waited
+                self.wait_max = max(self.wait_max, waited)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'size': self.size(),
+                'checked_in': self.checkedin(),
+                'checked_out': self.checkedout(),
+                'overflow': max(self.overflow(), 0),
+                'max_overflow': self._max_overflow,
+                'checkouts': self.checkouts,
+                'timeouts': self.timeouts,
+                'wait_seconds_total': round(self.wait_total, 6),
+                'wait_seconds_max': round(self.wait_max, 6),
+                'wait_seconds_avg': round(self.wait_total / self.checkouts, 6)
+                if self.checkouts else 0.0,
+            }
+
+
+class TimedAsyncQueuePool(TimedQueuePool, AsyncAdaptedQueuePool):
+    """TimedQueuePool for engines on an asyncio driver."""
+
+
+ASYNC_DRIVERS = {'postgresql': 'postgresql+asyncpg',
+                 'sqlite': 'sqlite+aiosqlite'}
+
+
+def is_postgres(config):
+    return config['SQLALCHEMY_DATABASE_URI'].startswith('postgresql')
+
+
+def engine_options(config):
+    """SQLALCHEMY_ENGINE_OPTIONS for the configured database and pool mode.
+
+    In 'session' mode the statement timeout is a connection startup option.
+    In 'pgbouncer' mode, for PgBouncer in transaction pooling, connections
+    carry no session state at all: the timeout is set per transaction by
+    set_local_timeouts instead, since consecutive transactions may land on
+    different server connections.
+    """
+    options = dict(config['SQLALCHEMY_ENGINE_OPTIONS'])
+    if not is_postgres(config):
+        # Pool sizing only applies to the Postgres QueuePool.
+        for name in ('pool_size', 'max_overflow', 'pool_timeout'):
+            options.pop(name, None)
+        return options
+
+    options['poolclass'] = TimedQueuePool
+    timeout = config['DB_STATEMENT_TIMEOUT_MS']
+    if config['DB_POOL_MODE'] == 'session' and timeout:
+        connect_args = dict(options.get('connect_args', {}))
+        connect_args['options'] = f'-c statement_timeout={int(timeout)}'
+        options['connect_args'] = connect_args
+    return options
+
+
+def set_local_timeouts(timeout):
+    def begin(connection):
+        connection.exec_driver_sql(
+            f'SET LOCAL statement_timeout = {int(timeout)}')
+    return begin
+
+
+def configure(app, db):
+    if app.config['DB_POOL_MODE'] not in ('session', 'pgbouncer'):
+        raise ValueError(f'Unknown DB_POOL_MODE {app.config["DB_POOL_MODE"]!r}')
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(app.config)
+    db.init_app(app)
+
+    timeout = app.config['DB_STATEMENT_TIMEOUT_MS']
+    if (app.config['DB_POOL_MODE'] == 'pgbouncer' and timeout
+            and is_postgres(app.config)):
+        engine = db.get_engine(app)
+        event.listen(engine, 'begin', set_local_timeouts(timeout))
+
+
+def async_database_uri(config):
+    # SQLALCHEMY_DATABASE_URI with the async driver of its database, unless
+    # ASYNC_DATABASE_URI names one.
+    if config.get('ASYNC_DATABASE_URI'):
+        return config['ASYNC_DATABASE_URI']
+    scheme, _, rest = config['SQLALCHEMY_DATABASE_URI'].partition('://')
+    backend = scheme.split('+')[0]
+    if backend not in ASYNC_DRIVERS:
+        raise ValueError(f'No async driver known for {backend!r}; '
+                         'set ASYNC_DATABASE_URI')
+    return f'{ASYNC_DRIVERS[backend]}://{rest}'
+
+
+def async_engine_options(config):
+    """Engine options of the async engine, matching engine_options().
+
+    asyncpg takes the statement timeout as a server setting. In 'pgbouncer'
+    mode its prepared statement caches are turned off as well, since a
+    statement prepared on one server connection is unknown on the next.
+    """
+    options = dict(config['SQLALCHEMY_ENGINE_OPTIONS'])
+    if not is_postgres(config):
+        for name in ('pool_size', 'max_overflow', 'pool_timeout'):
+            options.pop(name, None)
+        return options
+
+    options['poolclass'] = TimedAsyncQueuePool
+    connect_args = dict(options.get('connect_args', {}))
+    timeout = config['DB_STATEMENT_TIMEOUT_MS']
+    if config['DB_POOL_MODE'] == 'session' and timeout:
+        connect_args['server_settings'] = {
+            'statement_timeout': str(int(timeout))}
+    if config['DB_POOL_MODE'] == 'pgbouncer':
+        connect_args['statement_cache_size'] = 0
+        connect_args['prepared_statement_cache_size'] = 0
+    options['connect_args'] = connect_args
+    return options
+
+
+def create_async_engine(config):
+    from sqlalchemy.ext.asyncio import create_async_engine
+
+    uri = async_database_uri(config)
+    try:
+        engine = create_async_engine(uri, **async_engine_options(config))
+    except ImportError:
+        # The driver is named after the package it needs.
+        driver = uri.partition('://')[0].partition('+')[2]
+        raise RuntimeError(
+            f'The async engine needs the {driver} package installed')
+    timeout = config['DB_STATEMENT_TIMEOUT_MS']
+    if config['DB_POOL_MODE'] == 'pgbouncer' and timeout and is_postgres(config):
+        event.listen(engine.sync_engine, 'begin', set_local_timeouts(timeout))
+    return engine
+
+
+def stats(engine):
+    pool = engine.pool
+    if isinstance(pool, TimedQueuePool):
+        return pool.stats()
+    return {'pool': type(pool).__name__, 'status': pool.status()}
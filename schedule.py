@@ -0,0 +1,143 @@
+from datetime import datetime, time, timedelta
+
+from sqlalchemy import and_, or_, select
+
+from models import MAX_SHOW_DURATION, Artist, Show, Venue, artist_genre
+
+#----------------------------------------------------------------------------#
+# Show schedule.
+#
+# Show listings select just the columns they render from one join of show,
+# venue and artist, and narrow it with filters that each have an index to
+# work from:
+#
+#   start, end           ix_show_start_time (start_time, id)
+#   venue_id, artist_id  ix_show_venue_id_start_time, ix_show_artist_id_start_time
+#   state, city          ix_venue_area_name (state, city, ...), ix_venue_city
+#   genre                ix_artist_genre_genre_name (genre_name, artist_id)
+#
+# The genre of a show is the genre of its artist. Calendars are the same
+# listing over a window of whole days.
+#----------------------------------------------------------------------------#
+
+venue = Venue.__table__
+artist = Artist.__table__
+show = Show.__table__
+
+
+def select_shows(*columns):
+    """Select columns of shows joined to their venue and artist."""
+    return select(*columns).select_from(
+        show.join(venue, show.c.venue_id == venue.c.id)
+        .join(artist, show.c.artist_id == artist.c.id))
+
+
+def filter_shows(statement, start=None, end=None, city=None, state=None,
+                 genre=None, venue_id=None, artist_id=None):
+    """Narrow a select_shows statement; filters left as None are skipped.
+
+    start is inclusive and end exclusive.
+    """
+    criteria = []
+    if start is not None:
+        criteria.append(show.c.start_time >= start)
+    if end is not None:
+        criteria.append(show.c.start_time < end)
+    if venue_id is not None:
+        criteria.append(show.c.venue_id == venue_id)
+    if artist_id is not None:
+        criteria.append(show.c.artist_id == artist_id)
+    if city:
+        criteria.append(venue.c.city == city)
+    if state:
+        criteria.append(venue.c.state == state)
+    if genre:
+        criteria.append(show.c.artist_id.in_(
+            select(artist_genre.c.artist_id).where(
+                artist_genre.c.genre_name == genre)))
+    return statement.where(*criteria)
+
+
+#  Calendar
+#  ----------------------------------------------------------------
+
+# The days each calendar period covers, given a day it is shown for:
+# (days from that day back to its first day, its length in days).
+PERIODS = {
+    'day': lambda day: (0, 1),
+    'week': lambda day: (day.weekday(), 7),
+    # Friday to Sunday; from Monday on, the coming one.
+    'weekend': lambda day: (day.weekday() - 4, 3),
+    'month': lambda day: (day.day - 1, days_in_month(day)),
+}
+
+# Columns the iCalendar feeds are built from.
+FEED_COLUMNS = [show.c.id, show.c.start_time, show.c.duration,
+                venue.c.name.label('venue_name'),
+                venue.c.address.label('venue_address'),
+                venue.c.city.label('venue_city'),
+                venue.c.state.label('venue_state'),
+                artist.c.name.label('artist_name')]
+
+
+def days_in_month(day):
+    following = (day.replace(day=28) + timedelta(days=4)).replace(day=1)
+    return (following - day.replace(day=1)).days
+
+
+def window(period, day):
+    """First day of the period containing day, and the day after its last."""
+    back, length = PERIODS[period](day)
+    first = day - timedelta(days=back)
+    return first, first + timedelta(days=length)
+
+
+def midnight(day):
+    return datetime.combine(day, time())
+
+
+def adjacent(period, day):
+    """A day of the period before, and one of the period after, day's."""
+    first, last = window(period, day)
+    if period == 'weekend':
+        # Weekends do not cover the days between them.
+        return first - timedelta(days=7), first + timedelta(days=7)
+    return first - timedelta(days=1), last
+
+
+#  Conflicts
+#  ----------------------------------------------------------------
+
+def conflicts(session, columns, start_time, duration, venue_id=None,
+              artist_id=None):
+    """Shows of the venue or the artist overlapping the given booking.
+
+    No show runs longer than MAX_SHOW_DURATION, so only those starting less
+    than that before the booking can reach into it: each check is two
+    bounded range scans of the (venue_id, start_time) and (artist_id,
+    start_time) indexes, however long the schedule grows. columns must
+    include start_time and duration.
+    """
+    end_time = start_time + duration
+    window = and_(show.c.start_time > start_time - MAX_SHOW_DURATION,
+                  show.c.start_time < end_time)
+    owners = [show.c[name] == ident
+              for name, ident in (('venue_id', venue_id),
+                                  ('artist_id', artist_id))
+              if ident is not None]
+    if not owners:
+        return []
+    rows = session.execute(
+        select_shows(*columns).where(or_(*owners), window)
+        .order_by(show.c.start_time, show.c.id))
+    # The window holds the few shows that may overlap; their ends, which
+    # no index orders, are compared here.
+    return [row for row in rows
+            if row.start_time + row.duration > start_time]
+
+
+def refused_overlap(error):
+    """Whether an IntegrityError is an exclusion constraint of show refusing
+    an overlapping booking, as when two are made at once."""
+    # exclusion_violation
+    return getattr(error.orig, 'pgcode', None) == '23P01'
@@ -0,0 +1,220 @@
+import random
+import time
+from datetime import datetime, timedelta
+
+import click
+from sqlalchemy import func, select
+
+import typeahead
+from conditional import ALL_PAGES, mark_written
+from counters import recount
+from forms import VenueForm
+from genres import registry
+from importer import insert_rows, reset_sequence
+from models import (DEFAULT_SHOW_DURATION, Artist, CounterWatermark, Genre,
+                    Show, Venue, artist_genre, db, venue_genre)
+
+#----------------------------------------------------------------------------#
+# Synthetic data.
+#
+# Rows are generated from one seeded random number generator, so the same
+# options always produce the same database (show times are spread around
+# the anchor, which defaults to now). They go in through the importer's
+# insert path, COPY on Postgres, a batch per transaction.
+#----------------------------------------------------------------------------#
+
+GENRES = [value for value, _ in VenueForm.genres.kwargs['choices']]
+STATES = [value for value, _ in VenueForm.state.kwargs['choices']]
+
+WORDS = ['Blue', 'Velvet', 'Electric', 'Golden', 'Midnight', 'Silver',
+         'Crimson', 'Hollow', 'Lucky', 'Wild', 'Neon', 'Paper', 'Iron',
+         'Rolling', 'Broken', 'Quiet', 'Sunset', 'Northern', 'Little', 'Grand']
+VENUE_KINDS = ['Hall', 'Room', 'Lounge', 'Club', 'Bar', 'Theatre', 'Cellar',
+               'Garden', 'Ballroom', 'Tavern']
+ARTIST_KINDS = ['Band', 'Trio', 'Quartet', 'Collective', 'Orchestra',
+                'Brothers', 'Sisters', 'Project', 'Ensemble', 'Kids']
+PLACES = ['City', 'Falls', 'Springs', 'Harbor', 'Hills', 'Valley', 'Point']
+STREETS = ['Main St', 'Market St', 'Broadway', 'Mission St', 'Elm St',
+           'Oak Ave', 'Pine St', '1st Ave', 'Sunset Blvd', 'Bourbon St']
+
+# Shows start on a grid this coarse, longer than any seeded show.
+SHOW_SLOT = timedelta(hours=3)
+
+# Every table the generator writes, children first. data_version is only
+# ever bumped, so no ETag issued before a reset can match afterwards.
+TABLES = [Show.__table__, venue_genre, artist_genre, Venue.__table__,
+          Artist.__table__, Genre.__table__]
+
+
+def cities(rng, count):
+    # A fixed pool of areas, so listings group and filter as real data does.
+    return [(f'{rng.choice(WORDS)} {rng.choice(PLACES)}', rng.choice(STATES))
+            for _ in range(count)]
+
+
+def links(rng, kind, number):
+    slug = f'{kind}{number}'
+    return {'phone': f'{rng.randint(200, 999)}-{rng.randint(200, 999)}-'
+                     f'{rng.randint(1000, 9999)}',
+            'facebook_link': f'https://www.facebook.com/{slug}',
+            'image_link': f'https://images.example.com/{slug}.jpg',
+            'website_link': f'https://{slug}.example.com'}
+
+
+def venue_rows(rng, count, areas):
+    for number in range(1, count + 1):
+        city, state = rng.choice(areas)
+        seeking = rng.random() < 0.3
+        yield dict(
+            id=number,
+            name=f'The {rng.choice(WORDS)} {rng.choice(VENUE_KINDS)} {number}',
+            city=city, state=state,
+            address=f'{rng.randint(1, 9999)} {rng.choice(STREETS)}',
+            seeking_talent=seeking,
+            seeking_description='Looking for local acts.' if seeking else None,
+            **links(rng, 'venue', number)), rng.sample(GENRES, rng.randint(1, 3))
+
+
+def artist_rows(rng, count, areas):
+    for number in range(1, count + 1):
+        city, state = rng.choice(areas)
+        seeking = rng.random() < 0.3
+        yield dict(
+            id=number,
+            name=f'{rng.choice(WORDS)} {rng.choice(ARTIST_KINDS)} {number}',
+            city=city, state=state,
+            seeking_venue=seeking,
+            seeking_description='Looking for venues.' if seeking else None,
+            **links(rng, 'artist', number)), rng.sample(GENRES, rng.randint(1, 3))
+
+
+def show_rows(rng, count, venues, artists, anchor, days):
+    # Start times fall on a grid of SHOW_SLOT within days either side of
+    # anchor, and no venue or artist gets two shows in one slot, so no
+    # booking overlaps another.
+    anchor = anchor.replace(minute=0, second=0, microsecond=0)
+    reach = days * timedelta(days=1) // SHOW_SLOT
+    slots = 2 * reach + 1
+    taken = set()
+    for _ in range(count):
+        for _ in range(100):
+            venue_id = rng.randint(1, venues)
+            artist_id = rng.randint(1, artists)
+            slot = rng.randint(-reach, reach)
+            # Venue slots are counted from 0 up, artist slots from -1 down.
+            keys = (venue_id * slots + slot + reach,
+                    -1 - (artist_id * slots + slot + reach))
+            if not taken.intersection(keys):
+                break
+        else:
+            raise click.ClickException(
+                'No free slot left for a show; ask for fewer shows, or more '
+                'venues, artists or days.')
+        taken.update(keys)
+        yield dict(venue_id=venue_id, artist_id=artist_id,
+                   start_time=anchor + slot * SHOW_SLOT,
+                   duration=DEFAULT_SHOW_DURATION), ()
+
+
+def batches(rows, size):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def write(table, junction, rows, batch_size, echo):
+    started = time.monotonic()
+    written = 0
+    for batch in batches(rows, batch_size):
+        connection = db.session.connection()
+        insert_rows(connection, table, [row for row, _ in batch])
+        if junction is not None:
+            owner = next(column.name for column in junction.c
+                         if column.name != 'genre_name')
+            insert_rows(connection, junction,
+                        [{owner: row['id'], 'genre_name': name}
+                         for row, names in batch for name in names])
+        db.session.commit()
+        written += len(batch)
+        elapsed = time.monotonic() - started
+        echo(f'{table.name}: {written} rows '
+             f'({written / max(elapsed, 1e-9):,.0f} rows/s)')
+    reset_sequence(db.session.connection(), table)
+    db.session.commit()
+
+
+def clear():
+    for table in TABLES + [CounterWatermark.__table__]:
+        db.session.execute(table.delete())
+    db.session.commit()
+    registry.clear()
+
+
+def seed(venues, artists, shows, random_seed=0, days=365, anchor=None,
+         batch_size=10000, echo=click.echo):
+    """Fill empty tables with generated venues, artists, genres and shows.
+
+    The show counters are recomputed once at the end rather than per batch.
+    """
+    rng = random.Random(random_seed)
+    anchor = anchor or datetime.now()
+    areas = cities(rng, max(1, min(500, (venues + artists) // 20)))
+
+    db.session.execute(Genre.__table__.insert(),
+                       [{'name': name} for name in GENRES])
+    db.session.commit()
+    write(Venue.__table__, venue_genre, venue_rows(rng, venues, areas),
+          batch_size, echo)
+    write(Artist.__table__, artist_genre, artist_rows(rng, artists, areas),
+          batch_size, echo)
+    if shows and venues and artists:
+        write(Show.__table__, None,
+              show_rows(rng, shows, venues, artists, anchor, days),
+              batch_size, echo)
+
+    recount(db.session)
+    # Ids of listings removed by clear() are used again: no page cached
+    # before stays.
+    mark_written(db.session.connection(),
+                 [ALL_PAGES] + [table.name for table in TABLES])
+    typeahead.changed(db.session.connection())
+    db.session.commit()
+    registry.clear()
+
+
+def register(app):
+    @app.cli.command('seed')
+    @click.option('--venues', default=1000, show_default=True)
+    @click.option('--artists', default=1000, show_default=True)
+    @click.option('--shows', default=10000, show_default=True)
+    @click.option('--seed', 'random_seed', default=0, show_default=True,
+                  help='Seed of the random number generator.')
+    @click.option('--days', default=365, show_default=True,
+                  help='Shows start up to this many days either side of now.')
+    @click.option('--batch-size', default=10000, show_default=True,
+                  help='Rows committed per transaction.')
+    @click.option('--reset', is_flag=True,
+                  help='Delete every venue, artist, genre and show first.')
+    def seed_command(venues, artists, shows, random_seed, days, batch_size,
+                     reset):
+        """Fill the database with synthetic listings for benchmarking.
+
+        The tables must be empty, or --reset given to empty them. Running
+        workers pick up the new listings in their typeahead index within
+        TYPEAHEAD_REFRESH_INTERVAL seconds.
+        """
+        if reset:
+            clear()
+        elif any(db.session.execute(select(func.count()).select_from(table))
+                 .scalar() for table in TABLES):
+            raise click.ClickException(
+                'The database already holds listings; pass --reset to '
+                'replace them.')
+        started = time.monotonic()
+        seed(venues, artists, shows, random_seed, days, batch_size=batch_size)
+        click.echo(f'Done in {time.monotonic() - started:.1f} s.')
@@ -2,3 +2,59 @@ window.parseISOString = function parseISOString(s) {
   var b = s.split(/\D+/);
   return new Date(Date.UTC(b[0], --b[1], b[2], b[3], b[4], b[5], b[6]));
 };
+
+// Search box suggestions, served from the in-process typeahead index.
+document.querySelectorAll('input[data-typeahead]').forEach(function (input) {
+  var suggestions = document.getElementById(input.getAttribute('list'));
+  input.addEventListener('input', function () {
+    var term = input.value.trim();
+    if (!term) {
+      return;
+    }
+    fetch('/typeahead?q=' + encodeURIComponent(term) +
+          '&kinds=' + encodeURIComponent(input.dataset.typeahead))
+      .then(function (response) { return response.json(); })
+      .then(function (results) {
+        if (input.value.trim() !== term) {
+          return;
+        }
+        suggestions.innerHTML = '';
+        results.forEach(function (result) {
+          var option = document.createElement('option');
+          option.value = result.label;
+          suggestions.appendChild(option);
+        });
+      });
+  });
+});
+
+// Warn about bookings a new show would overlap before it is submitted.
+document.querySelectorAll('form[data-conflicts]').forEach(function (form) {
+  var warning = form.querySelector('#show-conflicts');
+  form.addEventListener('change', function () {
+    var params = new URLSearchParams();
+    ['venue_id', 'artist_id', 'start_time', 'duration'].forEach(function (name) {
+      var value = form.elements[name].value.trim();
+      if (value) {
+        params.set(name, name === 'start_time' ? value.replace(' ', 'T') : value);
+      }
+    });
+    if (!params.has('start_time') ||
+        !(params.has('venue_id') || params.has('artist_id'))) {
+      return;
+    }
+    fetch(form.dataset.conflicts + '?' + params.toString())
+      .then(function (response) { return response.ok ? response.json() : null; })
+      .then(function (result) {
+        if (!result) {
+          return;
+        }
+        warning.textContent = result.data.map(function (show) {
+          return 'Overlaps ' + show.artist_name + ' at ' + show.venue_name +
+                 ', ' + show.start_time.replace('T', ' ') + ' to ' +
+                 show.end_time.replace('T', ' ') + '.';
+        }).join(' ');
+        warning.hidden = !result.data.length;
+      });
+  });
+});
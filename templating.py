@@ -0,0 +1,28 @@
+import os
+
+from jinja2 import FileSystemBytecodeCache
+
+#----------------------------------------------------------------------------#
+# Template compilation.
+#----------------------------------------------------------------------------#
+
+
+def configure(app):
+    """Persist compiled templates and compile them all up front.
+
+    With JINJA_CACHE_DIR set, compiled template bytecode is written there
+    and reused by every later worker, which then only unmarshals it. With
+    TEMPLATE_WARMUP on, every template is loaded now rather than on the
+    first request that renders it. Returns the number of templates loaded.
+    """
+    cache_dir = app.config.get('JINJA_CACHE_DIR')
+    if cache_dir:
+        os.makedirs(cache_dir, exist_ok=True)
+        app.jinja_env.bytecode_cache = FileSystemBytecodeCache(cache_dir)
+
+    if not app.config.get('TEMPLATE_WARMUP'):
+        return 0
+    names = app.jinja_env.list_templates(extensions=['html'])
+    for name in names:
+        app.jinja_env.get_template(name)
+    return len(names)
@@ -0,0 +1,51 @@
+import pytest
+
+import config
+from app import create_app
+from models import db
+
+#----------------------------------------------------------------------------#
+# Apps on throwaway SQLite databases.
+#
+# Background threads and shared snapshot files are off, so a test sees only
+# the statements its own requests run.
+#----------------------------------------------------------------------------#
+
+
+def settings_for(directory, name):
+    settings = {key: getattr(config, key) for key in dir(config)
+                if key.isupper()}
+    settings.update(
+        SQLALCHEMY_DATABASE_URI=f'sqlite:///{directory / name}.db',
+        TESTING=True,
+        WTF_CSRF_ENABLED=False,
+        PRELOAD=False,
+        COUNTER_REFRESH_INTERVAL=0,
+        TYPEAHEAD_REFRESH_INTERVAL=0,
+        METRICS_DIR=None,
+        JINJA_CACHE_DIR=str(directory / 'jinja'))
+    return type('TestConfig', (), settings)
+
+
+@pytest.fixture
+def make_app(tmp_path):
+    """Build an app on an empty database of its own, named name."""
+    def make(name='fyyur'):
+        app = create_app(settings_for(tmp_path, name))
+        with app.app_context():
+            db.create_all()
+        return app
+    return make
+
+
+@pytest.fixture
+def app(make_app):
+    app = make_app()
+    with app.app_context():
+        yield app
+        db.session.remove()
+
+
+@pytest.fixture
+def session(app):
+    return db.session
@@ -0,0 +1,76 @@
+from datetime import date
+
+import pytest
+
+from ical import escape, fold
+from schedule import adjacent, window
+
+# A Wednesday.
+DAY = date(2024, 5, 15)
+
+
+@pytest.mark.parametrize('period, day, expected', [
+    ('day', DAY, (date(2024, 5, 15), date(2024, 5, 16))),
+    ('week', DAY, (date(2024, 5, 13), date(2024, 5, 20))),
+    ('week', date(2024, 5, 19), (date(2024, 5, 13), date(2024, 5, 20))),
+    ('weekend', DAY, (date(2024, 5, 17), date(2024, 5, 20))),
+    ('weekend', date(2024, 5, 18), (date(2024, 5, 17), date(2024, 5, 20))),
+    ('weekend', date(2024, 5, 20), (date(2024, 5, 24), date(2024, 5, 27))),
+    ('month', DAY, (date(2024, 5, 1), date(2024, 6, 1))),
+    ('month', date(2024, 2, 29), (date(2024, 2, 1), date(2024, 3, 1))),
+    ('month', date(2024, 12, 31), (date(2024, 12, 1), date(2025, 1, 1))),
+])
+def test_window(period, day, expected):
+    assert window(period, day) == expected
+
+
+@pytest.mark.parametrize('period, expected', [
+    ('day', (date(2024, 5, 14), date(2024, 5, 16))),
+    ('week', (date(2024, 5, 12), date(2024, 5, 20))),
+    ('weekend', (date(2024, 5, 10), date(2024, 5, 24))),
+    ('month', (date(2024, 4, 30), date(2024, 6, 1))),
+])
+def test_adjacent(period, expected):
+    previous, following = adjacent(period, DAY)
+    assert (previous, following) == expected
+    # Each lies in the period just before or after DAY's.
+    first, last = window(period, DAY)
+    assert window(period, previous)[1] <= first
+    assert window(period, following)[0] >= last
+
+
+def lines(folded):
+    assert folded.endswith('\r\n')
+    return folded[:-2].split('\r\n')
+
+
+def unfold(folded):
+    return ''.join(line[1:] if number else line
+                   for number, line in enumerate(lines(folded)))
+
+
+def test_fold_leaves_short_lines():
+    assert fold('SUMMARY:' + 'x' * 67) == 'SUMMARY:' + 'x' * 67 + '\r\n'
+
+
+def test_fold_splits_at_75_octets():
+    line = 'SUMMARY:' + 'x' * 150
+    folded = lines(fold(line))
+    assert [len(part) for part in folded] == [75, 75, 10]
+    assert all(part.startswith(' ') for part in folded[1:])
+    assert unfold(fold(line)) == line
+
+
+def test_fold_keeps_utf8_sequences_whole():
+    line = 'LOCATION:' + 'Café Émile, Zürich ' * 10
+    folded = fold(line)
+    for part in lines(folded):
+        assert len(part.encode('utf-8')) <= 75
+    assert unfold(folded) == line
+
+
+def test_escape():
+    assert escape('Rock, Pop; Jazz') == 'Rock\\, Pop\\; Jazz'
+    assert escape('C:\\music') == 'C:\\\\music'
+    assert escape('one\r\ntwo\nthree') == 'one\\ntwo\\nthree'
+    assert escape(42) == '42'
@@ -0,0 +1,13 @@
+def test_flask_command_registers_its_commands(make_app, monkeypatch):
+    monkeypatch.setenv('FLASK_RUN_FROM_CLI', 'true')
+    app = make_app()
+    assert {'import', 'seed'} <= set(app.cli.list_commands(None))
+    # flask db comes from Flask-Migrate, for the app it was set up on.
+    assert 'migrate' in app.extensions
+
+
+def test_servers_skip_them(make_app, monkeypatch):
+    monkeypatch.delenv('FLASK_RUN_FROM_CLI', raising=False)
+    app = make_app()
+    assert not {'import', 'seed'} & set(app.cli.list_commands(None))
+    assert 'migrate' not in app.extensions
@@ -0,0 +1,103 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from models import MAX_SHOW_DURATION, Artist, Show, Venue
+from schedule import conflicts
+
+EIGHT_PM = datetime(2030, 6, 1, 20, 0)
+HOUR = timedelta(hours=1)
+COLUMNS = [Show.id, Show.start_time, Show.duration]
+
+
+@pytest.fixture
+def booked(session):
+    """A venue and two artists; the first plays the venue from 8 to 10 pm."""
+    venue = Venue(name='Park Square Live Music & Coffee', city='San Francisco',
+                  state='CA', address='34 Whiskey Moore Ave')
+    first = Artist(name='The Wild Sax Band', city='San Francisco', state='CA')
+    second = Artist(name='Matt Quevedo', city='New York', state='NY')
+    session.add_all([venue, first, second])
+    session.flush()
+    show = Show(venue_id=venue.id, artist_id=first.id, start_time=EIGHT_PM,
+                duration=2 * HOUR)
+    session.add(show)
+    session.commit()
+    return venue, first, second, show
+
+
+@pytest.mark.parametrize('start, duration, clashes', [
+    # Ending as the show starts, or starting as it ends, is no overlap.
+    (EIGHT_PM - HOUR, HOUR, False),
+    (EIGHT_PM + 2 * HOUR, HOUR, False),
+    (EIGHT_PM - HOUR, HOUR + timedelta(minutes=1), True),
+    (EIGHT_PM + 2 * HOUR - timedelta(minutes=1), HOUR, True),
+    (EIGHT_PM + HOUR, timedelta(minutes=5), True),
+    (EIGHT_PM - HOUR, 4 * HOUR, True),
+    (EIGHT_PM - MAX_SHOW_DURATION, MAX_SHOW_DURATION, False),
+])
+def test_overlap_edges(session, booked, start, duration, clashes):
+    venue, first, second, show = booked
+    expected = [show.id] if clashes else []
+    assert [row.id for row in conflicts(session, COLUMNS, start, duration,
+                                        venue_id=venue.id)] == expected
+    assert [row.id for row in conflicts(session, COLUMNS, start, duration,
+                                        artist_id=first.id)] == expected
+
+
+def test_other_venue_or_artist(session, booked):
+    venue, first, second, show = booked
+    assert conflicts(session, COLUMNS, EIGHT_PM, HOUR,
+                     artist_id=second.id) == []
+    assert conflicts(session, COLUMNS, EIGHT_PM, HOUR,
+                     venue_id=venue.id + 1) == []
+    assert conflicts(session, COLUMNS, EIGHT_PM, HOUR) == []
+    # Either of the venue or the artist being taken is a conflict.
+    assert [row.id for row in conflicts(
+        session, COLUMNS, EIGHT_PM, HOUR, venue_id=venue.id,
+        artist_id=second.id)] == [show.id]
+
+
+def test_long_show_reaches_into_booking(session, booked):
+    venue, first, second, show = booked
+    long_show = Show(venue_id=venue.id, artist_id=second.id,
+                     start_time=EIGHT_PM - MAX_SHOW_DURATION + HOUR,
+                     duration=MAX_SHOW_DURATION)
+    session.add(long_show)
+    session.commit()
+    assert [row.id for row in conflicts(
+        session, COLUMNS, EIGHT_PM - 2 * HOUR, HOUR,
+        venue_id=venue.id)] == [long_show.id]
+
+
+@pytest.mark.parametrize('duration, status', [
+    ('60', 200), ('720', 200), ('0', 400), ('721', 400),
+    ('9' * 30, 400),
+])
+def test_api_duration_bounds(app, booked, duration, status):
+    venue = booked[0]
+    response = app.test_client().get(
+        '/api/shows/conflicts', query_string={
+            'start_time': EIGHT_PM.isoformat(), 'venue_id': venue.id,
+            'duration': duration})
+    assert response.status_code == status
+
+
+@pytest.mark.parametrize('start_time', ['2030-06-02 20:00',
+                                        '2030-06-02 20:00:00'])
+def test_create_show_in_placeholder_format(app, booked, start_time):
+    venue_id, artist_id = booked[0].id, booked[2].id
+    response = app.test_client().post('/shows/create', data={
+        'venue_id': venue_id, 'artist_id': artist_id,
+        'start_time': start_time, 'duration': '90'})
+    assert response.status_code == 200
+    assert b'Show was successfully listed!' in response.data
+    created = Show.query.filter_by(artist_id=artist_id).one()
+    assert created.start_time == datetime(2030, 6, 2, 20, 0)
+    assert created.duration == timedelta(minutes=90)
+
+
+def test_show_form_default_is_current(app):
+    from forms import ShowForm
+    with app.test_request_context():
+        assert ShowForm().start_time.data >= datetime.now() - HOUR
@@ -0,0 +1,77 @@
+from datetime import datetime, timedelta
+
+from counters import advance, counted_until, recount
+from models import Artist, Show, Venue
+
+NOW = datetime(2030, 6, 1, 12, 0)
+HOUR = timedelta(hours=1)
+
+
+def book(session, *offsets):
+    """A venue and two artists, with a show of the first artist at each
+    offset from NOW and one of the second an hour after the last."""
+    venue = Venue(name='The Dueling Pianos Bar', city='New York', state='NY',
+                  address='335 Delancey Street')
+    first = Artist(name='Guns N Petals', city='San Francisco', state='CA')
+    second = Artist(name='Matt Quevedo', city='New York', state='NY')
+    session.add_all([venue, first, second])
+    session.flush()
+    session.add_all(Show(venue_id=venue.id, artist_id=first.id,
+                         start_time=NOW + offset) for offset in offsets)
+    session.add(Show(venue_id=venue.id, artist_id=second.id,
+                     start_time=NOW + max(offsets) + HOUR))
+    session.flush()
+    recount(session, NOW)
+    session.commit()
+    return venue, first, second
+
+
+def counts(session, *instances):
+    for instance in instances:
+        session.refresh(instance)
+    return [(instance.num_upcoming_shows, instance.num_past_shows)
+            for instance in instances]
+
+
+def test_recount(session):
+    venue, first, second = book(session, -48 * HOUR, -HOUR, HOUR, 48 * HOUR)
+    assert counts(session, venue, first, second) == [(3, 2), (2, 2), (1, 0)]
+    assert counted_until(session) == NOW
+
+
+def test_advance_moves_started_shows(session):
+    venue, first, second = book(session, -HOUR, HOUR, 3 * HOUR, 48 * HOUR)
+
+    # The first artist's show at 3 hours and the second's at 49 stay ahead.
+    assert advance(session, NOW + 2 * HOUR) == 1
+    session.commit()
+    assert counts(session, venue, first, second) == [(3, 2), (2, 2), (1, 0)]
+    assert counted_until(session) == NOW + 2 * HOUR
+
+    # A watermark already past the time moves nothing.
+    assert advance(session, NOW) == 0
+    assert counts(session, venue, first, second) == [(3, 2), (2, 2), (1, 0)]
+
+    assert advance(session, NOW + 72 * HOUR) == 3
+    session.commit()
+    assert counts(session, venue, first, second) == [(0, 5), (0, 4), (0, 1)]
+
+
+def test_advance_matches_recount(session):
+    venue, first, second = book(session, -HOUR, HOUR, 5 * HOUR, 30 * HOUR)
+    advance(session, NOW + 6 * HOUR)
+    session.commit()
+    advanced = counts(session, venue, first, second)
+    recount(session, NOW + 6 * HOUR)
+    session.commit()
+    assert counts(session, venue, first, second) == advanced
+
+
+def test_show_writes_adjust_counters(session):
+    venue, first, second = book(session, -HOUR, HOUR)
+    session.add(Show(venue_id=venue.id, artist_id=second.id,
+                     start_time=NOW + 24 * HOUR))
+    session.delete(Show.query.filter_by(artist_id=first.id).order_by(
+        Show.start_time).first())
+    session.commit()
+    assert counts(session, venue, first, second) == [(3, 0), (1, 0), (2, 0)]
@@ -0,0 +1,79 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from counters import advance, recount
+from models import Artist, Show, Venue, db
+
+TOMORROW = datetime.now().replace(second=0, microsecond=0) + timedelta(days=1)
+
+
+@pytest.fixture
+def listings(app, session):
+    """Venues A and B, and artists playing a show at each: the first at A,
+    the second at B. Returns the pages of each."""
+    venues = [Venue(name=name, city='San Francisco', state='CA',
+                    address='1015 Folsom Street')
+              for name in ('The Musical Hop', 'Park Square Live Music')]
+    artists = [Artist(name=name, city='San Francisco', state='CA')
+               for name in ('Guns N Petals', 'The Wild Sax Band')]
+    session.add_all(venues + artists)
+    session.flush()
+    session.add_all(Show(venue_id=venue.id, artist_id=artist.id,
+                         start_time=TOMORROW)
+                    for venue, artist in zip(venues, artists))
+    recount(session)
+    session.commit()
+    return ([f'/venues/{venue.id}' for venue in venues],
+            [f'/artists/{artist.id}' for artist in artists],
+            venues[0].id, artists[1].id)
+
+
+def visit(app, url):
+    # The page, and whether its payload came from the cache.
+    cache = app.extensions['detail_cache']
+    hits = cache.stats()['hits']
+    response = app.test_client().get(url)
+    assert response.status_code == 200
+    return response.data, cache.stats()['hits'] == hits + 1
+
+
+def hits(app, urls):
+    return [visit(app, url)[1] for url in urls]
+
+
+def test_write_misses_only_the_pages_it_changed(make_app, app, listings):
+    (venue_a, venue_b), (first, second), a_id, second_id = listings
+    # Another worker, with a cache of its own, on the same database.
+    other = make_app()
+    pages = [venue_a, venue_b, first, second]
+    for worker in (app, other):
+        assert hits(worker, pages) == [False] * 4
+        assert hits(worker, pages) == [True] * 4
+
+    entries = app.extensions['detail_cache'].stats()['entries']
+    response = app.test_client().post('/shows/create', data={
+        'venue_id': a_id, 'artist_id': second_id,
+        'start_time': f'{TOMORROW + timedelta(days=1):%Y-%m-%d %H:%M}'})
+    assert b'Show was successfully listed!' in response.data
+
+    for worker in (app, other):
+        # Venue A and the second artist list the new show.
+        assert hits(worker, [venue_b, first]) == [True, True]
+        data, hit = visit(worker, venue_a)
+        assert not hit and data.count(b'The Wild Sax Band') == 1
+        data, hit = visit(worker, second)
+        assert not hit and data.count(b'The Musical Hop') == 1
+        assert hits(worker, pages) == [True] * 4
+    # The writer dropped the payloads it superseded; the other worker's
+    # are left to age out, as nothing reads them again.
+    assert app.extensions['detail_cache'].stats()['entries'] == entries
+    assert other.extensions['detail_cache'].stats()['entries'] == entries + 2
+
+
+def test_counter_refresh_leaves_pages_cached(app, listings):
+    venues, artists, *_ = listings
+    hits(app, venues + artists)
+    assert advance(db.session, TOMORROW + timedelta(hours=1)) == 2
+    db.session.commit()
+    assert hits(app, venues + artists) == [True] * 4
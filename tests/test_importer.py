@@ -0,0 +1,83 @@
+import csv
+
+import pytest
+
+from importer import load
+from models import Artist, Genre, Show, Venue
+
+
+def write_csv(path, rows):
+    with open(path, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=list(rows[0]))
+        writer.writeheader()
+        writer.writerows(rows)
+    return str(path)
+
+
+class Echo(list):
+    def __call__(self, message, err=False):
+        self.append((message, err))
+
+    def errors(self):
+        return [message for message, err in self if err]
+
+
+@pytest.fixture
+def booked(session):
+    venue = Venue(id=1, name='The Musical Hop', city='San Francisco',
+                  state='CA', address='1015 Folsom Street')
+    artist = Artist(id=1, name='Guns N Petals', city='San Francisco',
+                    state='CA')
+    session.add_all([venue, artist])
+    session.commit()
+
+
+def show(start_time, **row):
+    return dict(row, venue_id='1', artist_id='1', start_time=start_time,
+                duration='')
+
+
+@pytest.mark.parametrize('rows, kept, rejected', [
+    # The first row decides; the other is reported by number.
+    ([show('2030-06-01 20:00:00', id='7'), show('2030-06-02 20:00:00', id='')],
+     ['2030-06-01 20:00:00'], 'row 2: id: given on some rows only'),
+    ([show('2030-06-01 20:00:00', id=''), show('2030-06-02 20:00:00', id='8')],
+     ['2030-06-01 20:00:00'], 'row 2: id: given on some rows only'),
+])
+@pytest.mark.parametrize('batch_size', [1, 5000])
+def test_mixed_ids_are_rejected(session, tmp_path, booked, rows, kept,
+                                rejected, batch_size):
+    echo = Echo()
+    path = write_csv(tmp_path / 'shows.csv', rows)
+    assert load('shows', path, batch_size=batch_size, echo=echo) == (1, 1)
+    assert echo.errors() == [rejected]
+    assert [f'{start_time}' for (start_time,) in
+            session.query(Show.start_time)] == kept
+    if rows[0]['id']:
+        assert session.query(Show.id).scalar() == 7
+
+
+def test_resumed_load_keeps_the_first_rows_columns(
+        session, tmp_path, booked):
+    rows = [show('2030-06-01 20:00:00', id='7'),
+            show('2030-06-02 20:00:00', id=''),
+            show('2030-06-03 20:00:00', id='9')]
+    checkpoint = str(tmp_path / 'shows.checkpoint')
+    # Interrupted after committing the first row.
+    load('shows', write_csv(tmp_path / 'shows.csv', rows[:1]),
+         checkpoint=checkpoint, echo=Echo())
+    echo = Echo()
+    assert load('shows', write_csv(tmp_path / 'shows.csv', rows),
+                checkpoint=checkpoint, echo=echo) == (1, 1)
+    assert echo.errors() == ['row 2: id: given on some rows only']
+    assert sorted(id for (id,) in session.query(Show.id)) == [7, 9]
+
+
+def test_genre_ids_are_ignored(session, tmp_path):
+    path = write_csv(tmp_path / 'genres.csv', [
+        {'id': '1', 'name': 'Jazz'}, {'id': '', 'name': 'Blues'}])
+    echo = Echo()
+    assert load('genres', path, echo=echo) == (2, 0)
+    assert echo.errors() == []
+    assert sorted(name for (name,) in session.query(Genre.name)) == [
+        'Blues', 'Jazz']
@@ -0,0 +1,51 @@
+from datetime import datetime
+
+import pytest
+
+from models import Show, Venue
+from pagination import decode_cursor, encode_cursor, paginate
+from seed import seed
+
+SORT_KEY = [Show.start_time, Show.id]
+
+
+def test_cursor_round_trip():
+    values = [datetime(2024, 5, 17, 20, 30), 42]
+    cursor = encode_cursor(values)
+    assert decode_cursor(cursor, SORT_KEY) == values
+    # Cursors go into query strings as they are.
+    assert set(cursor) <= set('ABCDEFGHIJKLMNOPQRSTUVWXYZ'
+                              'abcdefghijklmnopqrstuvwxyz0123456789-_=')
+
+
+def test_cursor_keeps_strings():
+    values = ['The Musical Hop', 1]
+    assert decode_cursor(encode_cursor(values), [Venue.name, Venue.id]) == values
+
+
+def test_cursor_of_another_sort_key_is_refused():
+    with pytest.raises(ValueError):
+        decode_cursor(encode_cursor([1]), SORT_KEY)
+
+
+def test_pages_cover_every_row_once(app, session):
+    seed(3, 3, 23, echo=lambda message: None)
+    expected = Show.query.order_by(*SORT_KEY).all()
+
+    pages, after = [], None
+    while True:
+        page = paginate(Show.query, SORT_KEY, after=after, per_page=5)
+        pages.append(page.items)
+        if page.next is None:
+            break
+        after = page.next
+    assert [len(items) for items in pages] == [5, 5, 5, 5, 3]
+    assert sum(pages, []) == expected
+
+    # Walking back from the last page yields the same pages in reverse.
+    before, back = page.prev, [page.items]
+    while before:
+        page = paginate(Show.query, SORT_KEY, before=before, per_page=5)
+        back.append(page.items)
+        before = page.prev
+    assert back[::-1] == pages
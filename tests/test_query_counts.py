@@ -0,0 +1,87 @@
+import pytest
+from sqlalchemy import event, func, select
+
+from models import Show, db
+from seed import seed
+
+# (venues, artists, shows) of a small database and of one ten times larger.
+SMALL = (5, 5, 20)
+LARGE = (50, 50, 200)
+
+# The most statements each page runs, whatever the size of the database.
+# Every page reads its data versions for the conditional GET; detail pages
+# also read the latest show start. The page itself is one query for a
+# listing, and two for a venue or artist: the row joined to its genres, and
+# its shows joined to the other side. A cached payload leaves only the
+# validation.
+LISTINGS = {'/venues': 2, '/artists': 2, '/shows': 2}
+DETAILS = {'/venues/{venue_id}': 4, '/artists/{artist_id}': 4}
+CACHED = 2
+
+
+def busiest(column):
+    # The venue or artist with the most shows, and how many it has.
+    return db.session.execute(
+        select(column, func.count()).group_by(column)
+        .order_by(func.count().desc(), column)).first()
+
+
+def statements_run(app, url, repeat=1):
+    client = app.test_client()
+    # The first request builds the typeahead index; it is not counted.
+    client.get('/')
+    counts = []
+    for _ in range(repeat):
+        statements = []
+
+        def count(connection, cursor, statement, parameters, context,
+                  executemany):
+            statements.append(statement)
+
+        engine = db.get_engine(app)
+        event.listen(engine, 'before_cursor_execute', count)
+        try:
+            response = client.get(url)
+        finally:
+            event.remove(engine, 'before_cursor_execute', count)
+        assert response.status_code == 200
+        counts.append(len(statements))
+    return counts
+
+
+def seeded(make_app, name, scale):
+    app = make_app(name)
+    with app.app_context():
+        seed(*scale, echo=lambda message: None)
+        venue_id, venue_shows = busiest(Show.venue_id)
+        artist_id, artist_shows = busiest(Show.artist_id)
+        db.session.remove()
+    return app, {'venue_id': venue_id, 'artist_id': artist_id}, (
+        venue_shows, artist_shows)
+
+
+@pytest.fixture
+def databases(make_app):
+    small = seeded(make_app, 'small', SMALL)
+    large = seeded(make_app, 'large', LARGE)
+    # The detail pages compared list more shows on the larger database.
+    assert all(l > s for s, l in zip(small[2], large[2]))
+    return small, large
+
+
+@pytest.mark.parametrize('page, most', LISTINGS.items())
+def test_listing_statements(databases, page, most):
+    (small, _, _), (large, _, _) = databases
+    counts = statements_run(small, page) + statements_run(large, page)
+    assert counts[0] == counts[1] <= most
+
+
+@pytest.mark.parametrize('page, most', DETAILS.items())
+def test_detail_statements(databases, page, most):
+    # Built once, then served from the cache.
+    (small, small_ids, _), (large, large_ids, _) = databases
+    small_counts = statements_run(small, page.format(**small_ids), repeat=2)
+    large_counts = statements_run(large, page.format(**large_ids), repeat=2)
+    assert small_counts == large_counts
+    built, cached = large_counts
+    assert built <= most and cached <= CACHED
@@ -0,0 +1,268 @@
+import sys
+import threading
+from bisect import bisect_left, insort
+
+from sqlalchemy import event, inspect, select
+
+from conditional import mark_written
+
+#----------------------------------------------------------------------------#
+# Prefix index.
+#----------------------------------------------------------------------------#
+
+
+def normalize(text):
+    return ' '.join(text.lower().split())
+
+
+def index_keys(label):
+    # Index the whole label and every word onwards, so "hop" finds
+    # "The Musical Hop" as well as "hop" finding "Hopscotch".
+    words = normalize(label).split(' ')
+    return {' '.join(words[i:]) for i in range(len(words))}
+
+
+class PrefixIndex:
+    """Sorted in-memory index answering prefix queries by binary search.
+
+    Entries are identified by (kind, ident) and reference counted, so a city
+    shared by several venues stays suggested until the last one goes away.
+    The index refuses new keys once max_keys is reached.
+    """
+
+    def __init__(self, max_keys=None):
+        self.max_keys = max_keys
+        self.dropped = 0
+        self._keys = []
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _insert(self, kind, ident, label, refs):
+        keys = index_keys(label)
+        if self.max_keys is not None and len(self._keys) + len(keys) > self.max_keys:
+            self.dropped += 1
+            return
+        self._entries[(kind, ident)] = [label, refs]
+        for key in keys:
+            insort(self._keys, (key, kind, ident))
+
+    def add(self, kind, ident, label):
+        with self._lock:
+            entry = self._entries.get((kind, ident))
+            if entry is None:
+                self._insert(kind, ident, label, 1)
+            else:
+                entry[1] += 1
+
+    def ensure(self, kind, ident, label):
+        # Add the entry unless it is already indexed; no reference is taken.
+        with self._lock:
+            if (kind, ident) not in self._entries:
+                self._insert(kind, ident, label, 1)
+
+    def remove(self, kind, ident):
+        with self._lock:
+            entry = self._entries.get((kind, ident))
+            if entry is None:
+                return
+            entry[1] -= 1
+            if entry[1] > 0:
+                return
+            del self._entries[(kind, ident)]
+            for key in index_keys(entry[0]):
+                position = bisect_left(self._keys, (key, kind, ident))
+                if position < len(self._keys) and self._keys[position] == (key, kind, ident):
+                    del self._keys[position]
+
+    def load(self, entries):
+        # Bulk build from (kind, ident, label) triples with a single sort.
+        counts = {}
+        for kind, ident, label in entries:
+            counts.setdefault((kind, ident), [label, 0])[1] += 1
+
+        keys = []
+        indexed = {}
+        for (kind, ident), entry in counts.items():
+            entry_keys = index_keys(entry[0])
+            if self.max_keys is not None and len(keys) + len(entry_keys) > self.max_keys:
+                self.dropped += 1
+                continue
+            indexed[(kind, ident)] = entry
+            keys.extend((key, kind, ident) for key in entry_keys)
+        keys.sort()
+
+        with self._lock:
+            self._keys = keys
+            self._entries = indexed
+
+    def suggest(self, prefix, kinds=None, limit=10):
+        prefix = normalize(prefix)
+        if not prefix:
+            return []
+
+        results = []
+        seen = set()
+        with self._lock:
+            position = bisect_left(self._keys, (prefix,))
+            while position < len(self._keys) and len(results) < limit:
+                key, kind, ident = self._keys[position]
+                if not key.startswith(prefix):
+                    break
+                position += 1
+                if (kind, ident) in seen or (kinds and kind not in kinds):
+                    continue
+                seen.add((kind, ident))
+                results.append({'kind': kind,
+                                'id': ident,
+                                'label': self._entries[(kind, ident)][0]})
+        return results
+
+    def stats(self):
+        with self._lock:
+            size = sys.getsizeof(self._keys) + sum(
+                sys.getsizeof(entry) + sys.getsizeof(entry[0])
+                for entry in self._keys)
+            return {'entries': len(self._entries),
+                    'keys': len(self._keys),
+                    'max_keys': self.max_keys,
+                    'dropped': self.dropped,
+                    'approx_bytes': size}
+
+
+#----------------------------------------------------------------------------#
+# Listings.
+#
+# Each worker process holds its own index. The handler of a write updates
+# its worker's index at once; every change to what is suggested also
+# advances the 'typeahead' data version, and each worker rebuilds its index
+# within TYPEAHEAD_REFRESH_INTERVAL seconds of seeing it move.
+#----------------------------------------------------------------------------#
+
+VERSION = 'typeahead'
+
+# The columns suggestions are made from, by table.
+LABELS = {'venue': ('name', 'city', 'state'),
+          'artist': ('name', 'city', 'state'),
+          'genre': ('name',)}
+
+index = PrefixIndex()
+built_version = None
+
+
+def area(city, state):
+    return f'{city}, {state}'
+
+
+def add_listing(kind, ident, name, city, state, genres=()):
+    index.add(kind, ident, name)
+    index.add('city', area(city, state), area(city, state))
+    for genre in genres:
+        index.ensure('genre', genre, genre)
+
+
+def remove_listing(kind, ident, city, state):
+    index.remove(kind, ident)
+    index.remove('city', area(city, state))
+
+
+def changed(connection):
+    # Have every worker rebuild its index once the transaction commits.
+    mark_written(connection, [VERSION])
+
+
+def note_changes(session, flush_context):
+    # Listings added, deleted or relabelled through the ORM; bulk loaders
+    # call changed() themselves.
+    for instance in session.new | session.dirty | session.deleted:
+        columns = LABELS.get(getattr(instance, '__tablename__', None))
+        if columns is None:
+            continue
+        if instance in session.dirty and not any(
+                inspect(instance).attrs[column].history.has_changes()
+                for column in columns):
+            continue
+        changed(session.connection())
+        return
+
+
+def current_version(db):
+    from models import DataVersion
+
+    return db.session.execute(select(DataVersion.version).where(
+        DataVersion.table_name == VERSION)).scalar()
+
+
+def build(db, max_keys=None):
+    """Rebuild the index from the Venue, Artist and Genre tables."""
+    from models import Artist, Genre, Venue
+
+    def entries():
+        for kind, model in (('venue', Venue), ('artist', Artist)):
+            rows = db.session.query(model.id, model.name,
+                                    model.city, model.state)
+            for ident, name, city, state in rows.yield_per(1000):
+                yield kind, ident, name
+                yield 'city', area(city, state), area(city, state)
+        for (name,) in db.session.query(Genre.name):
+            yield 'genre', name, name
+
+    global index, built_version
+    # Read first: a change committed during the build shows up as a newer
+    # version, and so as another rebuild.
+    version = current_version(db)
+    fresh = PrefixIndex(max_keys)
+    fresh.load(entries())
+    index, built_version = fresh, version
+    return fresh
+
+
+class Refresher:
+    """Daemon thread rebuilding this worker's index every interval seconds
+    in which the typeahead data version has moved."""
+
+    def __init__(self, interval):
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self, app):
+        if self._thread is not None or self.interval <= 0:
+            return
+        self._thread = threading.Thread(target=self._run, args=(app,),
+                                        name='typeahead', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self, app):
+        from models import db
+
+        while not self._stop.wait(self.interval):
+            with app.app_context():
+                try:
+                    if current_version(db) != built_version:
+                        build(db, app.config['TYPEAHEAD_MAX_KEYS'])
+                except Exception:
+                    app.logger.exception('Rebuilding the typeahead index failed')
+                finally:
+                    db.session.remove()
+
+
+def register(app):
+    from models import db
+
+    event.listen(db.session, 'after_flush', note_changes)
+    refresher = Refresher(app.config['TYPEAHEAD_REFRESH_INTERVAL'])
+
+    @app.before_first_request
+    def start_refresher():
+        refresher.start(app)
+
+    return refresher